@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime, timezone
+
+import database
+from instrumentation import ALERTS_TOTAL
+
+
+# Alert rules over the stored ingest-time scores (the scores table written by
+# pipeline.py). The engine keeps a cursor (settings.alerts_cursor) and on every
+# poll() only reads scores with reading_id above it, so the cost follows the
+# ingest rate, not the length of the history. Rules run on reading timestamps
+# rather than wall time, which keeps them deterministic for backfills and tests.
+#
+# Every state change is one row in the alerts table: a rule "fires" once its
+# condition has held long enough (debounce) and "resolves" once it has clearly
+# gone away (a lower clear level = hysteresis), so a value hovering around the
+# threshold does not produce a stream of alerts.
+
+log = logging.getLogger("alerts")
+
+# Used when ALERT_RULES is not set. Both watch ewma, the model scored at ingest
+# until a reference forest is trained (pipeline.ingest_model). A calibrated model
+# flags about c of healthy readings, in clusters: at c = 0.05 a healthy seed
+# stream reaches up to ~14 flags in 60 s, so a burst starts well above that.
+DEFAULT_RULES = [
+    {"name": "anomaly_burst", "kind": "count", "model": "ewma", "n": 20, "window_s": 60, "clear_n": 5,
+     "cooldown_s": 300, "severity": "warning"},
+    {"name": "ewma_sustained", "kind": "threshold", "model": "ewma", "threshold": 6.0,
+     "clear": 4.0, "hold_s": 10, "clear_s": 30, "severity": "critical"},
+]
+
+
+def parse_ts(ts: str) -> float:
+    """ISO8601 reading timestamp (with or without 'Z' / milliseconds) -> epoch seconds."""
+    dt = datetime.fromisoformat(ts[:-1] if ts.endswith("Z") else ts)
+    # readings are stored in UTC; naive timestamps mean UTC too
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+
+class Rule:
+    """
+    Shared bookkeeping: name, severity, optional model filter and the firing flag.
+    Rule kinds subclass it and define kind and feed(row, t), which takes
+    row = (reading_id, timestamp, model, score, is_anomaly) and returns an event or None.
+    """
+
+    kind = None
+
+    def __init__(self, name, severity="warning", model=None, cooldown_s=0.0):
+        self.name = name
+        self.severity = severity
+        self.model = model
+        self.cooldown_s = float(cooldown_s)
+        self.active = False
+        self.resolved_at = None
+
+    def _event(self, state, ts, row, value, message):
+        return {"rule": self.name, "kind": self.kind, "severity": self.severity, "state": state,
+                "ts": ts, "reading_id": row[0], "model": row[2], "value": round(float(value), 6),
+                "message": message}
+
+    def _cooling_down(self, t):
+        return self.resolved_at is not None and t - self.resolved_at < self.cooldown_s
+
+
+class CountRule(Rule):
+    """
+    Fires when at least n readings were flagged within window_s seconds and
+    resolves once the window holds clear_n or fewer flags. After resolving it
+    stays quiet for cooldown_s.
+    """
+
+    kind = "count"
+
+    def __init__(self, name, n=5, window_s=60.0, clear_n=None, **kw):
+        super().__init__(name, **kw)
+        self.n = int(n)
+        self.window_s = float(window_s)
+        self.clear_n = int(self.n // 2 if clear_n is None else clear_n)
+        self.flags = deque()  # timestamps of flagged readings inside the window
+
+    def feed(self, row, t):
+        while self.flags and t - self.flags[0] > self.window_s:
+            self.flags.popleft()
+        if row[4]:
+            self.flags.append(t)
+        count = len(self.flags)
+        if not self.active and count >= self.n and not self._cooling_down(t):
+            self.active = True
+            return self._event("firing", row[1], row, count,
+                               f"{count} anomalies in {self.window_s:g}s")
+        if self.active and count <= self.clear_n:
+            self.active, self.resolved_at = False, t
+            return self._event("resolved", row[1], row, count,
+                               f"{count} anomalies in the last {self.window_s:g}s")
+        return None
+
+
+class ThresholdRule(Rule):
+    """
+    Fires when the score stays above `threshold` for hold_s seconds and resolves
+    when it stays below `clear` (<= threshold) for clear_s seconds.
+    """
+
+    kind = "threshold"
+
+    def __init__(self, name, threshold, clear=None, hold_s=10.0, clear_s=10.0, **kw):
+        super().__init__(name, **kw)
+        self.threshold = float(threshold)
+        self.clear = float(self.threshold if clear is None else min(clear, threshold))
+        self.hold_s = float(hold_s)
+        self.clear_s = float(clear_s)
+        self.since = None  # start of the current run above threshold (or below clear, when active)
+        self.peak = None
+
+    def feed(self, row, t):
+        score = row[3]
+        if not self.active:
+            if score <= self.threshold:
+                self.since = self.peak = None
+                return None
+            if self.since is None:
+                self.since, self.peak = t, score
+            self.peak = max(self.peak, score)
+            if t - self.since >= self.hold_s and not self._cooling_down(t):
+                self.active, self.since = True, None
+                return self._event("firing", row[1], row, self.peak,
+                                   f"score above {self.threshold:g} for {self.hold_s:g}s (peak {self.peak:.3g})")
+            return None
+        if score >= self.clear:
+            self.since = None
+            return None
+        if self.since is None:
+            self.since = t
+        if t - self.since >= self.clear_s:
+            self.active, self.resolved_at, self.since, self.peak = False, t, None, None
+            return self._event("resolved", row[1], row, score,
+                               f"score below {self.clear:g} for {self.clear_s:g}s")
+        return None
+
+
+RULE_KINDS = {"count": CountRule, "threshold": ThresholdRule}
+
+
+def build_rules(specs):
+    """Rule objects from a list of dicts ({"name", "kind", ...rule parameters})."""
+    rules = []
+    for spec in specs:
+        spec = dict(spec)
+        kind = spec.pop("kind", "count")
+        if kind not in RULE_KINDS:
+            raise ValueError(f"unknown alert rule kind: {kind}")
+        rules.append(RULE_KINDS[kind](**spec))
+    names = [r.name for r in rules]
+    if len(set(names)) != len(names):
+        raise ValueError("alert rule names must be unique")
+    return rules
+
+
+def load_rules():
+    """Rules from the ALERT_RULES env var (a JSON list), else DEFAULT_RULES."""
+    raw = os.getenv("ALERT_RULES")
+    return build_rules(json.loads(raw) if raw else DEFAULT_RULES)
+
+
+class AlertEngine:
+    """Evaluates rules over newly stored scores and appends state changes to the alerts table."""
+
+    def __init__(self, rules=None, batch=5000, on_alert=None):
+        self.rules = build_rules(DEFAULT_RULES) if rules is None else rules
+        self.batch = batch
+        self.on_alert = list(on_alert) if on_alert else []
+        self.cursor = None
+
+    def _restore(self):
+        # cursor and which rules were left firing, so a restart neither re-reads
+        # old scores nor fires a second alert for one that is still open
+        with database.get_connection() as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key = 'alerts_cursor'").fetchone()
+            self.cursor = int(row[0]) if row else 0
+            last = dict(conn.execute(
+                "SELECT rule, state FROM alerts WHERE id IN (SELECT MAX(id) FROM alerts GROUP BY rule)"
+            ).fetchall())
+        for rule in self.rules:
+            rule.active = last.get(rule.name) == "firing"
+
+    def poll(self):
+        """Feeds every score stored since the last poll to the rules. Returns the new alerts."""
+        if self.cursor is None:
+            self._restore()
+        out = []
+        while True:
+            with database.get_connection() as conn:
+                rows = conn.execute(
+                    "SELECT s.reading_id, r.timestamp, s.model, s.score, s.is_anomaly "
+                    "FROM scores s JOIN readings r ON r.id = s.reading_id "
+                    "WHERE s.reading_id > ? ORDER BY s.reading_id LIMIT ?",
+                    (self.cursor, self.batch)).fetchall()
+            if not rows:
+                return out
+            events = []
+            for row in rows:
+                t = parse_ts(row[1])
+                for rule in self.rules:
+                    if rule.model and rule.model != row[2]:
+                        continue
+                    event = rule.feed(row, t)
+                    if event:
+                        events.append(event)
+            self.cursor = rows[-1][0]
+            # alerts and the cursor move together, so a crash cannot log an alert twice
+            out.extend(database.insert_alerts(events, cursor=self.cursor))
+            for event in events:
+                ALERTS_TOTAL.labels(event["rule"], event["state"]).inc()
+                log.warning(json.dumps({"alert": event}))
+                for callback in self.on_alert:
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        log.error(json.dumps({"alert_callback_error": str(e)}))
+            if len(rows) < self.batch:
+                return out
@@ -1,7 +1,8 @@
-from database import DB_PATH,fetch_latest, fetch_last_n,fetch_last_n_raw, init_db 
+from database import (DB_PATH, fetch_alerts, fetch_latest, fetch_scores, fetch_last_n, fetch_last_n_raw,
+                      fetch_last_n_tuples, fetch_thresholds, fetch_window_at_index, init_db)
 from flask import Flask, jsonify, request, render_template, Response, g, current_app
-import sqlite3,logging, json, uuid
-from models.isolation import fit_iforest, score_iforest
+import sqlite3,logging, json, uuid, threading, os, csv, io, hashlib, random, hmac, re
+from collections import OrderedDict, deque
 import numpy as np
 from io import BytesIO
 from datetime import datetime, timezone
@@ -10,71 +11,198 @@ from reportlab.lib import colors
 from reportlab.lib.units import mm
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from time import perf_counter, monotonic, time
+from time import perf_counter, monotonic, sleep, time
 
 from retention import run_retention
-from models.lstm import load_artifacts, make_sequences, score_sequences
+from serialization import rows_to_columns, feature_matrix, columnar_response
+from downsample import downsample_columns, downsample_rows
+from compression import compress_response, summary as compression_summary
+from instrumentation import (DB_QUERY_SECONDS, REQUEST_LATENCY, REQUESTS_IN_FLIGHT, ROWS_SERVED,
+                             SCORING_SHED, render_latest, timed)
+from tracing import span, traced
+from profiler import ProfilerBusy, profile, to_collapsed, to_speedscope
+from models.lstm import artifact_version
+from models.streaming import STREAMING_MODELS, WARM_CONTEXT, score_streaming
+from models import store as models_store
+from models.store import current_version
+from scoring_pool import POOL_MODELS, ScoringBusy, ScoringPool, WORKERS as SCORING_WORKERS, score_job
+from calibration import Calibrator, model_version as model_version_of
+from shared_state import shared_state
+import sklearn
 from dotenv import load_dotenv
 
+EXPORT_FIELDS = ("id", "timestamp", "temperature", "pressure", "motor_speed")
+
+# Read endpoints whose body depends only on the stored readings, the replay cursor,
+# the query string and the model; they get an ETag and can answer 304 Not Modified
+ETAG_ENDPOINTS = {"latest", "history", "scores", "anomalies", "scores_for_window"}
+
+
+EXPORT_RANGE_SQL = """
+    SELECT id, timestamp, temperature, pressure, motor_speed
+    FROM readings
+    WHERE timestamp BETWEEN ? AND ?
+    ORDER BY timestamp ASC
+"""
+
+
+def export_range(from_ts: str, to_ts: str):
+    """/export's from/to as UTC ISO strings; ValueError if either is not ISO8601."""
+    dt_from = datetime.fromisoformat(from_ts.replace("Z", "+00:00")).astimezone(timezone.utc)
+    dt_to = datetime.fromisoformat(to_ts.replace("Z", "+00:00")).astimezone(timezone.utc)
+    return (dt_from.isoformat().replace("+00:00", "Z"), dt_to.isoformat().replace("+00:00", "Z"))
+
+
+def csv_chunks(rows, endpoint="export_csv"):
+    """CSV text of export rows in ~64 KB pieces, header first."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_FIELDS)
+    count = 0
+    for r in rows:
+        writer.writerow(r)
+        count += 1
+        if buf.tell() >= 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+    # streamed after the request finished, so counted here rather than via g
+    ROWS_SERVED.labels(endpoint).inc(count)
+
+
 def get_setting(key: str, default: str | None = None) -> str | None:
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM settings WHERE key = ?", (key,))
-        row = cur.fetchone()
-        return row[0] if row else default
+    # served from memory; reloaded when any worker changes a setting (shared_state.py)
+    return shared_state(DB_PATH).get_setting(key, default)
 
 def set_setting(key: str, value: str) -> None:
-    with sqlite3.connect(DB_PATH) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO settings(key, value) VALUES(?, ?) "
-            "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-            (key, value)
-        )
-        conn.commit()
+    shared_state(DB_PATH).set_setting(key, value)
 
 
-def detect_scores(X: np.ndarray, model: str, contamination: float):
-    """Detects anomalies using the specified model."""
+@traced("detect_scores")
+def detect_scores(X: np.ndarray, model: str, contamination: float, context=None):
+    """Detects anomalies using the specified model (context: readings before X, for the streaming ones)."""
 
     app = current_app 
     m = (model or "iforest").lower()
+    calibrator = app.config['_calibrator']
+    pool = app.config['_scoring_pool']
+
+    def run(name, threshold=None):
+        # window fits and the LSTM go to the scoring pool (scoring_pool.py) unless it is off
+        root = models_store.STORE_DIR
+        if pool is not None:
+            with span("scoring_pool"):
+                return pool.run(X, name, contamination, threshold=threshold, store_root=root)
+        return score_job(X, name, contamination, threshold=threshold, store_root=root, n_jobs=-1)
+
     if m == "lstm":
         try:
-            
-            lstm_cache = app.config['_lstm_cache']
-            if not lstm_cache["loaded"]:
-                mdl, s, L = load_artifacts()
-                lstm_cache.update({"loaded": True, "model": mdl, "scaler": s, "seq_len": L})
-            
-            mdl, s, L = lstm_cache["model"], lstm_cache["scaler"], lstm_cache["seq_len"]
-            Xs = s.transform(X)
-            if len(Xs) < L:
-                scores = np.zeros(len(Xs), dtype=float)
-                is_out = np.zeros(len(Xs), dtype=bool)
-                return scores, is_out, "lstm"
-            S = make_sequences(Xs, L)
-            errs = score_sequences(mdl, S)
-            scores = np.zeros(len(Xs), dtype=float)
-            scores[L-1:] = errs
-            k = max(1, int(np.ceil(len(scores) * min(max(contamination, 0.001), 0.5))))
-            thresh = np.partition(scores, -k)[-k]
-            is_out = scores >= thresh
-            return scores, is_out, "lstm"
-        
+            return run("lstm", calibrator.threshold("lstm", contamination))
+        except ScoringBusy:
+            raise
         except Exception as e:
-        
             app.logger.warning(json.dumps({"lstm_inference_error": str(e)}))
             # Fallback to iforest if LSTM fails
-            clf = fit_iforest(X, contamination=contamination, random_state=42)
-            scores_vals, is_out = score_iforest(clf, X)
-            return scores_vals, is_out, "iforest"
+            return run("iforest")
+
+    if m == "iforest_ref" and current_version("iforest_ref") is not None:
+        # reference forest trained offline on long history (scripts/train_iforest.py),
+        # memory-mapped and shared by all workers; without one, fit on the window
+        return run(m, calibrator.threshold(m, contamination))
 
+    if m in STREAMING_MODELS:
+        threshold = calibrator.threshold(m, contamination)
+        scores_vals, is_out = score_streaming(m, X, contamination, threshold=threshold, context=context)
+        return scores_vals, is_out, m
 
         # Default: Isolation Forest
-    clf = fit_iforest(X, contamination=contamination, random_state=42)
-    scores_vals, is_out = score_iforest(clf, X)
-    return scores_vals, is_out, "iforest"
+    return run("iforest")
+
+
+def single_flight(key, fn):
+    """
+    Runs fn() once per key at a time. Callers that arrive while a call for the
+    same key is in flight wait for it and share its result (or its exception).
+    """
+
+    flights = current_app.config['_inflight']
+    with flights["lock"]:
+        call = flights["calls"].get(key)
+        leader = call is None
+        if leader:
+            call = {"done": threading.Event(), "result": None, "error": None}
+            flights["calls"][key] = call
+
+    if not leader:
+        call["done"].wait()
+        if call["error"] is not None:
+            raise call["error"]
+        return call["result"]
+
+    try:
+        call["result"] = fn()
+    except Exception as e:
+        call["error"] = e
+        raise
+    finally:
+        with flights["lock"]:
+            flights["calls"].pop(key, None)
+        call["done"].set()
+    return call["result"]
+
+
+def detect_scores_shared(end_id: int, X: np.ndarray, model: str, contamination: float, context=None):
+    """
+    detect_scores() deduplicated across concurrent requests for the same window.
+    The key is (endpoint, window end id, n, model, contamination); the endpoint
+    is part of it because row order (and so the fitted forest) differs per route.
+    """
+
+    key = (request.endpoint, int(end_id), len(X), (model or "iforest").lower(), round(contamination, 6))
+    return single_flight(key, lambda: detect_scores(X, model=model, contamination=contamination, context=context))
+
+
+# Models exercised at start-up (WARMUP_MODELS, comma separated; WARMUP=0 skips it)
+WARMUP_MODELS = "iforest,iforest_ref,lstm,ewma,mahalanobis,hst"
+
+
+def after_fork_models(models):
+    """
+    The models a preloading server must warm in each worker: the LSTM (TensorFlow
+    is not fork-safe once it has run) and whatever runs in the worker's own scoring pool.
+    """
+    return [m for m in models if m == "lstm" or (SCORING_WORKERS > 0 and m in POOL_MODELS)]
+
+
+def warm_up(models, before_fork=False):
+    """
+    Runs each model once on a realistic window so the first real request does not
+    pay for imports, artifact loading, TensorFlow tracing, threshold lookups or
+    page faults on mapped artifacts. Records per-model milliseconds in the app's
+    _warmup (shown on /healthz). Before a fork, after_fork_models() are skipped.
+    """
+
+    app = current_app
+    rows = fetch_last_n_tuples(200)[::-1]
+    if len(rows) >= 50:
+        X = feature_matrix(rows_to_columns(rows))
+    else:
+        # empty database: plausible readings, same shape as a dashboard window
+        X = np.random.default_rng(0).normal([50.0, 6.0, 1800.0], [5.0, 0.5, 200.0], size=(200, 3))
+    done = app.config['_warmup']
+    for m in models:
+        if before_fork and m in after_fork_models([m]):
+            continue
+        t0 = perf_counter()
+        try:
+            detect_scores(X, m, 0.05)
+        except Exception as e:
+            app.logger.warning(json.dumps({"warmup_error": str(e), "model": m}))
+            continue
+        done[m] = round((perf_counter() - t0) * 1000.0, 1)
+    app.logger.info(json.dumps({"warmup_ms": done, "pid": os.getpid()}))
+    return done
 
 
 def create_app():
@@ -89,18 +217,47 @@ def create_app():
 
     app = Flask(__name__)
 
+    # Response compression: gzip level 1-9, brotli quality 0-11, bodies below the
+    # minimum size are sent as-is (streamed bodies are always compressed)
+    app.config.update(
+        COMPRESS_LEVEL=int(os.getenv("COMPRESS_LEVEL", "6")),
+        COMPRESS_BR_QUALITY=int(os.getenv("COMPRESS_BR_QUALITY", "4")),
+        COMPRESS_MIN_SIZE=int(os.getenv("COMPRESS_MIN_SIZE", "1024")),
+    )
+
+    # Request traces: spans always go to the JSON log line; a sample of requests
+    # (plus every request slower than TRACE_SLOW_MS) is kept for /debug/traces
+    app.config.update(
+        TRACE_SAMPLE_RATE=float(os.getenv("TRACE_SAMPLE_RATE", "0.1")),
+        TRACE_SLOW_MS=float(os.getenv("TRACE_SLOW_MS", "500")),
+        _traces=deque(maxlen=int(os.getenv("TRACE_BUFFER_SIZE", "200"))),
+    )
     
+    # Dashboard event stream (/stream): how often it checks the alerts table, how
+    # often it sends a keep-alive comment, and how long one connection is held
+    # before the browser is asked to reconnect (it resumes from Last-Event-ID)
+    app.config.update(
+        STREAM_POLL_S=float(os.getenv("STREAM_POLL_S", "1.0")),
+        STREAM_HEARTBEAT_S=float(os.getenv("STREAM_HEARTBEAT_S", "15")),
+        STREAM_MAX_SECONDS=float(os.getenv("STREAM_MAX_SECONDS", "55")),
+        # how the page gets new alerts: "sse" (/stream), "poll" (/alerts) or "auto",
+        # which is sse only under asgi.py; under gthread every open stream holds a thread
+        ALERT_STREAM=os.getenv("ALERT_STREAM", "auto"),
+    )
+
     # These are kept inside the factory to avoid global scope issues.
     app.config.update(
         _last_fit={"counter": 0, "clf": None, "n": None, "c": None, "Xshape": None},
-        REPLAY_MODE=False,
-        _replay_index=0,
-        REPLAY_STRIDE=5,
-        _last_manual_step_at=0.0,
-        _lstm_cache={"loaded": False, "model": None, "scaler": None, "seq_len": None},
+        REPLAY_STRIDE=5,  # default until replay_stride is set; the replay cursor is in shared_state
+        _scoring_pool=ScoringPool() if SCORING_WORKERS > 0 else None,
+        _last_scores=OrderedDict(),  # (endpoint, model, n, c) -> last window scored, for load shedding
+        _inflight={"lock": threading.Lock(), "calls": {}},
+        _calibrator=Calibrator(),
+        _warmup={},
         _metrics={
             "requests_total": 0, "latency_ms_sum": 0.0, "latency_ms_count": 0,
             "rows_total": 0, "anomalies_24h": 0, "errors_total": 0, "last_error_ts": None,
+            "compression": {},
         }
     )
 
@@ -111,21 +268,15 @@ def create_app():
     app.logger.setLevel(gunicorn_logger.level)
 
 
-    def total_rows():
+    @timed(DB_QUERY_SECONDS, "id_range")
+    @traced("id_range")
+    def id_range():
+        """(first, last) reading id, or (0, 0); two rowid seeks, unlike COUNT(*)."""
         with sqlite3.connect(DB_PATH) as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT COUNT(*) FROM readings")
-            return int(cur.fetchone()[0] or 0)
-
-
-    def fetch_window_at_index(n: int, end_index: int):
-        start = max(0, end_index - n)
-        limit = max(1 if end_index > 0 else 0, min(n, end_index - start))
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row
-            cur = conn.cursor()
-            cur.execute("SELECT * FROM readings ORDER BY id ASC LIMIT ? OFFSET ?", (limit, start))
-            return [dict(r) for r in cur.fetchall()]
+            # separate subqueries: SQLite only turns a lone MIN() / MAX() into an index seek
+            first, last = conn.execute(
+                "SELECT (SELECT MIN(id) FROM readings), (SELECT MAX(id) FROM readings)").fetchone()
+            return int(first or 0), int(last or 0)
 
 
     def init_settings_table():
@@ -146,13 +297,128 @@ def create_app():
 
 
 
-    def step_replay_index(stride: int):
-        max_id = total_rows()
-        idx = app.config['_replay_index']
-        if idx >= max_id:
-            return idx
-        app.config['_replay_index'] = min(idx + stride, max_id)
-        return app.config['_replay_index']
+    def window_scores(ids, X, model: str, c: float):
+        """
+        Scores for a window of readings. When the ingest pipeline has already scored
+        every one of them with this model the stored scores are used (flagged against
+        the calibrated threshold, or the top c share); otherwise the window is scored now.
+        """
+        first_id, last_id = int(min(ids)), int(max(ids))
+        # the pipeline fits a new iforest per batch, so its stored iforest scores are
+        # not on one scale and cannot be ranked against each other; refit the window
+        stored = fetch_scores(first_id, last_id, model) if model != "iforest" else {}
+        if len(stored) == len(ids):
+            scores_vals = np.array([stored[int(i)] for i in ids], dtype=float)
+            return scores_vals, app.config['_calibrator'].flag(model, scores_vals, c), model
+        key = (request.endpoint, model, len(ids), round(c, 6))
+        context = None
+        if model in STREAMING_MODELS and app.config['_calibrator'].threshold(model, c) is not None:
+            # calibrated thresholds come from the pipeline's long-running detector; the
+            # window's own detector catches up on the readings before it first (uncalibrated,
+            # the window is flagged by its own top c, which needs no context)
+            before = fetch_window_at_index(WARM_CONTEXT, first_id - 1, as_tuples=True)
+            context = np.array([r[2:5] for r in before], dtype=float).reshape(-1, 3)
+        try:
+            result = detect_scores_shared(last_id, X, model=model, contamination=c, context=context)
+        except ScoringBusy:
+            result = stale_scores(key, ids, stored)
+            if result is None:
+                SCORING_SHED.labels(model, "rejected").inc()
+                raise
+            SCORING_SHED.labels(model, "stale").inc()
+            g.scores_stale = True
+            return result
+        cache = app.config['_last_scores']
+        cache[key] = (dict(zip(map(int, ids), zip(result[0], result[1]))), result[2])
+        cache.move_to_end(key)
+        while len(cache) > 64:
+            cache.popitem(last=False)
+        return result
+
+
+    def stale_scores(key, ids, stored):
+        """
+        Answer for a window when the scoring pool is saturated: each reading keeps
+        the score it had in the last window scored for the same request (or the
+        ingest pipeline's stored score); readings newer than that score 0, unflagged.
+        """
+        last = app.config['_last_scores'].get(key)
+        if last is None:
+            return None
+        seen, used = last
+        scores_vals, is_out = [], []
+        for i in map(int, ids):
+            s, o = seen.get(i, (stored.get(i, 0.0), False))
+            scores_vals.append(s)
+            is_out.append(o)
+        return np.array(scores_vals, dtype=float), np.array(is_out, dtype=bool), used
+
+
+    def newest_first_scores(ids, X, model: str, c: float):
+        """
+        window_scores() for a newest-first window (live /scores, /anomalies). The
+        window is scored oldest->newest, as the streaming detectors only look back,
+        and the results are returned in the window's own order.
+        """
+        scores_vals, is_out, used = window_scores(ids[::-1], X[::-1].copy(), model, c)
+        return np.asarray(scores_vals, dtype=float)[::-1], np.asarray(is_out, dtype=bool)[::-1], used
+
+
+    def scored_columns(rows, model: str, c: float, newest_first=False):
+        """Columnar scores payload for reading tuples, without per-row dicts."""
+        cols = rows_to_columns(rows)
+        if rows:
+            scorer = newest_first_scores if newest_first else window_scores
+            scores_vals, is_out, used = scorer(cols["id"], feature_matrix(cols), model, c)
+        else:
+            scores_vals, is_out, used = np.zeros(0), np.zeros(0, dtype=bool), None
+        cols["anomaly_score"] = np.asarray(scores_vals, dtype=float)
+        cols["is_anomaly"] = np.asarray(is_out, dtype=bool)
+        cols["model"] = used
+        return cols
+
+
+    def replay_session():
+        """The caller's replay session id (X-Replay-Session header or ?session=), or None."""
+        return request.headers.get("X-Replay-Session") or request.args.get("session") or None
+
+
+    def replay_state():
+        """The caller's ReplayCursor (shared_state.py), the same whichever worker answers."""
+        return shared_state(DB_PATH).replay(replay_session())
+
+
+    def update_replay(fn):
+        return shared_state(DB_PATH).update_replay(fn, replay_session())
+
+
+    def replay_stride():
+        return int(get_setting("replay_stride", str(app.config['REPLAY_STRIDE'])))
+
+
+    def advance_replay():
+        # Auto-advance the caller's cursor (if it is replaying) unless it stepped manually very recently:
+        # one stride per poll, or `speed` readings per second of wall time when set
+        # (so a dashboard open in two tabs does not replay twice as fast). One atomic
+        # update, so polls answered by two workers at once cannot both apply
+        _, max_id = id_range()
+        default_stride = replay_stride()
+
+        def advance(cur):
+            now = time()
+            if not cur.mode or cur.index >= max_id or now - cur.stepped_at <= 0.5:
+                return None
+            if cur.speed <= 0:
+                return cur._replace(index=min(cur.index + (cur.stride or default_stride), max_id), advanced_at=now)
+            # readings due since the last advance, carrying the fraction over; a tab
+            # back from the background catches up at most 10 s rather than skipping ahead
+            elapsed = min(now - cur.advanced_at, 10.0)
+            steps = int(elapsed * cur.speed)
+            if steps < 1:
+                return None
+            return cur._replace(index=min(cur.index + steps, max_id), advanced_at=now - (elapsed - steps / cur.speed))
+
+        return update_replay(advance)
 
 
 
@@ -171,12 +437,13 @@ def create_app():
     def set_mode():
         payload = request.get_json(silent=True) or {}
         is_replay = payload.get("mode") == "replay"
-        app.config['REPLAY_MODE'] = is_replay
-        if is_replay:
-            app.config['_replay_index'] = 0
+        # replay starts just before the oldest stored reading
+        start = max(0, id_range()[0] - 1) if is_replay else None
+        index = update_replay(lambda cur: cur._replace(
+            mode=is_replay, index=cur.index if start is None else start, advanced_at=time())).index
         return jsonify({
             "mode": "replay" if is_replay else "live",
-            "index": app.config['_replay_index']
+            "index": index
         }), 200
 
 
@@ -199,15 +466,58 @@ def create_app():
             return jsonify({"ok": False, "error": str(e)}), 500
 
 
+    def admin_auth_error():
+        """None if the request carries the ADMIN_TOKEN bearer token, else an error response."""
+        token = os.getenv("ADMIN_TOKEN")
+        if not token:
+            return jsonify({"ok": False, "error": "admin endpoint disabled (ADMIN_TOKEN not set)"}), 403
+        supplied = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            return jsonify({"ok": False, "error": "unauthorized"}), 401
+        return None
+
+
+    @app.post("/admin/profile")
+    def admin_profile():
+        """
+        Samples this worker's threads for ?seconds= (max 30) and returns the stacks
+        as collapsed text (default) or ?format=speedscope JSON.
+        """
+        err = admin_auth_error()
+        if err:
+            return err
+        try:
+            seconds = min(max(float(request.args.get("seconds", "5")), 0.1), 30.0)
+            interval = min(max(float(request.args.get("interval_ms", "5")), 1.0), 100.0) / 1000.0
+        except ValueError:
+            return jsonify({"ok": False, "error": "seconds and interval_ms must be numbers"}), 400
+        fmt = request.args.get("format", "collapsed")
+        if fmt not in ("collapsed", "speedscope"):
+            return jsonify({"ok": False, "error": "format must be collapsed|speedscope"}), 400
+
+        try:
+            counts, elapsed = profile(seconds, interval)
+        except ProfilerBusy as e:
+            return jsonify({"ok": False, "error": str(e)}), 409
+
+        if fmt == "speedscope":
+            return jsonify(to_speedscope(counts, elapsed, interval, name=f"pid {os.getpid()}")), 200
+        return Response(to_collapsed(counts), mimetype="text/plain",
+                        headers={"X-Profile-Pid": str(os.getpid())})
+
+
     @app.get("/config")
     def get_config():
         keys = ["contamination_default","replay_stride","history_window_default",
                 "score_window_default","poll_ms","default_model","view_window_seconds"]
         
         out = { k: get_setting(k) for k in keys }
-        # --- FIX #2: Use app.config for state ---
-        out["replay_mode"] = app.config['REPLAY_MODE']
-        out["replay_index"] = app.config['_replay_index']
+        cursor = replay_state()
+        out["replay_mode"], out["replay_index"] = cursor.mode, cursor.index
+        stream = app.config['ALERT_STREAM']
+        if stream not in ("sse", "poll"):
+            stream = "sse" if request.environ.get("dashboard.native_stream") else "poll"
+        out["alert_stream"] = stream
         return jsonify(out), 200
 
     @app.post("/config")
@@ -224,8 +534,8 @@ def create_app():
             
             try:
                 if k == "default_model":
-                    if str(v).lower() not in {"iforest","lstm"}:
-                        raise ValueError("model must be iforest|lstm")
+                    if str(v).lower() not in {"iforest", "iforest_ref", "lstm", *STREAMING_MODELS}:
+                        raise ValueError("model must be iforest|iforest_ref|lstm|" + "|".join(STREAMING_MODELS))
                 
                 elif k == "contamination_default": 
                     float(v)  # Validate it's a float
@@ -234,9 +544,7 @@ def create_app():
                 
                 # If all validations pass, set the setting
                 set_setting(k, str(v))
-                if k == 'replay_stride':
-                    app.config['REPLAY_STRIDE'] = int(v)
-                elif k == 'contamination_default':
+                if k == 'contamination_default':
                     app.config['CONTAMINATION_DEFAULT'] = float(v)
                 updated[k] = v
                 
@@ -252,8 +560,29 @@ def create_app():
 
     @app.post("/replay/reset")
     def replay_reset():
-        app.config['_replay_index'] = 0
-        return jsonify({"ok": True, "index": 0}), 200
+        start = max(0, id_range()[0] - 1)
+        update_replay(lambda cur: cur._replace(index=start))
+        return jsonify({"ok": True, "index": start}), 200
+
+
+    @app.post("/replay/settings")
+    def replay_settings():
+        # The caller's own replay pace: stride readings per poll, or speed readings
+        # per second (0 = per poll). Other dashboards keep theirs
+        payload = request.get_json(silent=True) or {}
+        try:
+            stride = int(payload["stride"]) if "stride" in payload else None
+            speed = float(payload["speed"]) if "speed" in payload else None
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "error": "stride must be an integer and speed a number"}), 400
+        if (stride is not None and not 0 <= stride <= 10_000) or (speed is not None and not 0 <= speed <= 10_000):
+            return jsonify({"ok": False, "error": "stride and speed must be between 0 and 10000"}), 400
+        # the speed clock starts now, so the first poll does not make up for time before it
+        cursor = update_replay(lambda cur: cur._replace(
+            stride=cur.stride if stride is None else stride, speed=cur.speed if speed is None else speed,
+            advanced_at=time()))
+        return jsonify({"ok": True, "index": cursor.index, "stride": cursor.stride or replay_stride(),
+                        "speed": cursor.speed}), 200
 
 
     
@@ -264,24 +593,44 @@ def create_app():
         return int(r[0] or 0)
 
 
+    def model_version():
+        return f"iforest:{sklearn.__version__}|lstm:{artifact_version()}|ref:{current_version('iforest_ref')}"
+
+
+    def compute_etag():
+        """
+        Weak ETag over everything a read response depends on: last reading id, last
+        ingest-scored id, replay cursor, query string (minus the _t cache-buster), the default model (used when
+        no model= is given), the model version and the stored thresholds row of the request's model. Costs
+        two indexed lookups (and a thresholds read every reload_s).
+        """
+        with sqlite3.connect(DB_PATH) as conn:
+            last_id = _get_last_id(conn)
+            # ingest-time scores can land after the reading itself
+            scored_id = conn.execute("SELECT MAX(reading_id) FROM scores").fetchone()[0]
+        args = sorted((k, v) for k, v in request.args.items(multi=True) if k != "_t")
+        cursor = g.get("replay") or replay_state()
+        default_model = get_setting("default_model", "iforest")
+        key = json.dumps([
+            request.path, args, last_id, scored_id, cursor.mode, cursor.index,
+            replay_stride(), default_model, model_version(),
+            app.config['_calibrator'].revision(request.args.get("model", default_model).lower()),
+        ])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
 
     # in /replay/step, record the manual step time just before returning
     @app.route('/replay/step', methods=['POST'])
     def replay_step():
-        if not app.config['REPLAY_MODE']:
-            app.config['REPLAY_MODE'] = True
-        
         data = request.get_json(silent=False) or {}
         delta = data.get('delta', 0)
         if not isinstance(delta, int):
             return jsonify(error='delta must be int'), 400
 
-        max_id = total_rows()
-        current_index = app.config['_replay_index']
-        next_index = max(0, min(current_index + delta, max_id))
-        
-        app.config['_replay_index'] = next_index
-        app.config['_last_manual_step_at'] = monotonic()
+        _, max_id = id_range()
+        next_index = update_replay(lambda cur: cur._replace(
+            mode=True, index=max(0, min(cur.index + delta, max_id)), stepped_at=time())).index
         
         return jsonify(ok=True, index=next_index)
 
@@ -309,12 +658,12 @@ def create_app():
             )
             row = cur.fetchone()
             if row:
-                app.config['_replay_index'] = int(row["id"])
+                target = int(row["id"])
             else:
                 last_id_cur = conn.execute("SELECT MAX(id) FROM readings")
-                app.config['_replay_index'] = int(last_id_cur.fetchone()[0] or 0)
-        app.config['_last_manual_step_at'] = monotonic()
-        return jsonify({"ok": True, "index": app.config['_replay_index']})
+                target = int(last_id_cur.fetchone()[0] or 0)
+        update_replay(lambda cur: cur._replace(index=target, stepped_at=time()))
+        return jsonify({"ok": True, "index": target})
     
 
 
@@ -327,16 +676,20 @@ def create_app():
         except ValueError:
             return jsonify({"error": "n must be an integer"}), 400
         n = max(1, min(n, 2000))
+        layout = request.args.get("layout")
+        columnar = layout in ("columnar", "binary")
+        try:
+            max_points = int(request.args.get("max_points", "0"))  # 0 = no downsampling
+        except ValueError:
+            return jsonify({"error": "max_points must be an integer"}), 400
 
-        if app.config['REPLAY_MODE']:
-            # Auto-advance unless a manual step occurred very recently
-            if monotonic() - app.config['_last_manual_step_at'] > 0.5:
-                step_replay_index(app.config['REPLAY_STRIDE'])
-
-            rows = fetch_window_at_index(n, app.config['_replay_index'])  # oldest->newest
+        # advanced by before_request_hook, ahead of the ETag
+        cursor = g.get("replay") or advance_replay()
+        if cursor.mode:
+            rows = fetch_window_at_index(n, cursor.index, as_tuples=columnar)  # oldest->newest
             replay_now = 0
             if rows:
-                newest_iso = rows[-1]["timestamp"]
+                newest_iso = rows[-1][1] if columnar else rows[-1]["timestamp"]
                 replay_now = int(datetime.fromisoformat(newest_iso.replace("Z", "+00:00"))
                                     .astimezone(timezone.utc).timestamp() * 1000)
             else:
@@ -347,12 +700,28 @@ def create_app():
                     if newest_iso:
                         replay_now = int(datetime.fromisoformat(newest_iso.replace("Z", "+00:00"))
                                             .astimezone(timezone.utc).timestamp() * 1000)
-            return jsonify({"rows": rows, "replay_now": replay_now, "server_now": int(time() * 1000)}), 200
+            if columnar:
+                cols = downsample_columns(rows_to_columns(rows), max_points)
+                g.rows_served = len(cols["ts"])
+                return columnar_response({**cols, "replay_now": replay_now,
+                                          "server_now": int(time() * 1000)}, layout=layout)
+            rows = downsample_rows(rows, max_points)
+            g.rows_served = len(rows)
+            with span("serialize"):
+                return jsonify({"rows": rows, "replay_now": replay_now, "server_now": int(time() * 1000)}), 200
 
         else:
+            if columnar:
+                rows = fetch_last_n_tuples(n)[::-1]  # oldest->newest
+                cols = downsample_columns(rows_to_columns(rows), max_points)
+                g.rows_served = len(cols["ts"])
+                return columnar_response({**cols, "server_now": int(time() * 1000)}, layout=layout)
             rows = fetch_last_n(n)
             rows = sorted(rows, key=lambda r: r["timestamp"])  # oldest->newest
-            return jsonify({"rows": rows, "server_now": int(time() * 1000)}), 200
+            rows = downsample_rows(rows, max_points)
+            g.rows_served = len(rows)
+            with span("serialize"):
+                return jsonify({"rows": rows, "server_now": int(time() * 1000)}), 200
 
 
 
@@ -373,6 +742,7 @@ def create_app():
     @app.get("/healthz")
     def healthz():
         m = app.config['_metrics']
+        pool = app.config['_scoring_pool']
         try:
             with sqlite3.connect(DB_PATH) as conn:
                 cur = conn.cursor()
@@ -381,11 +751,16 @@ def create_app():
                 cur.execute("SELECT MAX(timestamp) FROM readings")
                 last_ts = cur.fetchone()[0]
             m["rows_total"] = rows
+            cursor = replay_state()
             return jsonify({
                 "ok": True, "rows": rows, "last_ts": last_ts,
-                "replay_mode": app.config['REPLAY_MODE'],
-                "replay_index": app.config['_replay_index'],
+                "replay_mode": cursor.mode,
+                "replay_index": cursor.index,
+                "replay_sessions": shared_state(DB_PATH).live_sessions(),
                 "db_path": DB_PATH,
+                "warmup_ms": app.config['_warmup'],
+                "scoring_pool": pool and {"workers": pool.workers, "pending": pool.pending,
+                                          "max_queue": pool.max_queue},
             }), 200
         except Exception as e:
             m["errors_total"] += 1
@@ -440,11 +815,28 @@ def create_app():
             "errors_total": m.get("errors_total", 0),
             "last_error_ts": m.get("last_error_ts"),
             "hourly_aggregates_total": aggregates_rows,
+            "compression": compression_summary(m["compression"]),
         }
 
         return jsonify(payload), 200
 
 
+    @app.get("/debug/traces")
+    def debug_traces():
+        """Sampled request traces, newest first; ?rid= filters to one request."""
+        rid = request.args.get("rid")
+        traces = list(reversed(app.config['_traces']))
+        if rid:
+            traces = [t for t in traces if t["rid"] == rid]
+        return jsonify(traces), 200
+
+
+    @app.get("/metrics/prometheus")
+    def metrics_prometheus():
+        body, content_type = render_latest()
+        return Response(body, content_type=content_type)
+
+
     @app.get("/ping")
     def ping():
         return jsonify({"ok": True}), 200
@@ -460,32 +852,50 @@ def create_app():
             return jsonify({"error": "n must be an integer"}), 400
         
         n = max(1, min(n, 2000))
+        layout = request.args.get("layout")
+        columnar = layout in ("columnar", "binary")
+        try:
+            max_points = int(request.args.get("max_points", "0"))  # 0 = no downsampling
+        except ValueError:
+            return jsonify({"error": "max_points must be an integer"}), 400
 
-        if app.config['REPLAY_MODE']:
+        cursor = replay_state()
+        if cursor.mode:
             # align with the same replay slice shown on charts
-            rows = fetch_window_at_index(n, app.config['_replay_index'])  # oldest->newest
+            rows = fetch_window_at_index(n, cursor.index, as_tuples=columnar)  # oldest->newest
+        elif columnar:
+            rows = fetch_last_n_tuples(n)                   # newest-first (live)
         else:
             rows = fetch_last_n_raw(n)                      # newest-first (live)
 
-        if not rows:
+        if not rows and not columnar:
             return jsonify([]), 200
 
         model = request.args.get("model", get_setting("default_model", "iforest")).lower()
-
-        X = np.array([[r["temperature"], r["pressure"], r["motor_speed"]] for r in rows], dtype=float)
         c = float(request.args.get("c", "0.05"))
         c = max(0.001, min(c, 0.5))
 
-        scores_vals, is_out, used = detect_scores(X, model=model, contamination=c)
+        if columnar:
+            cols = downsample_columns(scored_columns(rows, model, c, newest_first=not cursor.mode), max_points)
+            g.rows_served = len(cols["ts"])
+            return columnar_response(cols, layout=layout)
 
-        out = []
-        for r, s, o in zip(rows, scores_vals, is_out):
-            r2 = dict(r)
-            r2["anomaly_score"] = float(s)
-            r2["is_anomaly"] = bool(o)
-            r2["model"] = used
-            out.append(r2)
-        return jsonify(out), 200
+        X = np.array([[r["temperature"], r["pressure"], r["motor_speed"]] for r in rows], dtype=float)
+
+        scorer = window_scores if cursor.mode else newest_first_scores
+        scores_vals, is_out, used = scorer([r["id"] for r in rows], X, model, c)
+
+        with span("serialize"):
+            out = []
+            for r, s, o in zip(rows, scores_vals, is_out):
+                r2 = dict(r)
+                r2["anomaly_score"] = float(s)
+                r2["is_anomaly"] = bool(o)
+                r2["model"] = used
+                out.append(r2)
+            out = downsample_rows(out, max_points, keep=is_out)
+            g.rows_served = len(out)
+            return jsonify(out), 200
 
 
 
@@ -498,8 +908,9 @@ def create_app():
             return jsonify({"error": "n must be an integer"}), 400
         
         n = max(1, min(n, 2000))
-        if app.config['REPLAY_MODE']:
-            rows = fetch_window_at_index(n,app.config['_replay_index'])  # oldest->newest
+        cursor = replay_state()
+        if cursor.mode:
+            rows = fetch_window_at_index(n, cursor.index)  # oldest->newest
         else:
             rows = fetch_last_n_raw(n)                      # newest-first
 
@@ -511,7 +922,8 @@ def create_app():
         X = np.array([[r["temperature"], r["pressure"], r["motor_speed"]] for r in rows], dtype=float)
         c = float(request.args.get("c", "0.05")); c = max(0.001, min(c, 0.5))
 
-        scores_vals, is_out, used = detect_scores(X, model=model, contamination=c)
+        scorer = window_scores if cursor.mode else newest_first_scores
+        scores_vals, is_out, used = scorer([r["id"] for r in rows], X, model, c)
 
         flagged = []
         for r, s, o in zip(rows, scores_vals, is_out):
@@ -521,6 +933,7 @@ def create_app():
                 r2["is_anomaly"] = True
                 r2["model"] = used
                 flagged.append(r2)
+        g.rows_served = len(flagged)
         return jsonify(flagged), 200
 
 
@@ -535,33 +948,115 @@ def create_app():
         
         n = max(1, min(n, 2000))
 
-        if app.config['REPLAY_MODE']:
-            rows = fetch_window_at_index(n, app.config['_replay_index'])  
+        layout = request.args.get("layout")
+        columnar = layout in ("columnar", "binary")
+        try:
+            max_points = int(request.args.get("max_points", "0"))  # 0 = no downsampling
+        except ValueError:
+            return jsonify({"error": "max_points must be an integer"}), 400
+
+        cursor = replay_state()
+        if cursor.mode:
+            rows = fetch_window_at_index(n, cursor.index, as_tuples=columnar)
+        elif columnar:
+            rows = fetch_last_n_tuples(n)[::-1]  # oldest->newest
         else:
             rows = fetch_last_n(n)
             rows = sorted(rows, key=lambda r: r["timestamp"])
 
-        if not rows:
+        if not rows and not columnar:
             return jsonify([]), 200
 
         model = request.args.get("model", get_setting("default_model", "iforest")).lower()
-        X = np.array([[r["temperature"], r["pressure"], r["motor_speed"]] for r in rows], dtype=float)
         c = float(request.args.get("c", "0.05"))
         c = max(0.001, min(c, 0.5))
 
+        if columnar:
+            cols = downsample_columns(scored_columns(rows, model, c), max_points)
+            g.rows_served = len(cols["ts"])
+            return columnar_response(cols, layout=layout)
+
+        X = np.array([[r["temperature"], r["pressure"], r["motor_speed"]] for r in rows], dtype=float)
+
         
-        scores_vals, is_out, used = detect_scores(X, model=model, contamination=c)
+        scores_vals, is_out, used = window_scores([r["id"] for r in rows], X, model, c)
 
-        out = []
-        for r, s, o in zip(rows, scores_vals, is_out):
-            r2 = dict(r)
-            r2["anomaly_score"] = float(s)
-            r2["is_anomaly"] = bool(o)
-            r2["model"] = used
-            out.append(r2)  
-        return jsonify(out), 200    
+        with span("serialize"):
+            out = []
+            for r, s, o in zip(rows, scores_vals, is_out):
+                r2 = dict(r)
+                r2["anomaly_score"] = float(s)
+                r2["is_anomaly"] = bool(o)
+                r2["model"] = used
+                out.append(r2)
+            out = downsample_rows(out, max_points, keep=is_out)
+            g.rows_served = len(out)
+            return jsonify(out), 200    
+
+
+
+
+    @app.get("/thresholds")
+    def thresholds():
+        # Calibrated score distributions per model version (see calibration.py)
+        rows = fetch_thresholds()
+        current = {m: model_version_of(m) for m in {r["model"] for r in rows}}
+        for r in rows:
+            r["current"] = current[r["model"]] == r["version"]
+        return jsonify(rows), 200
 
 
+    @app.get("/alerts")
+    def alerts_log():
+        # Alert log, newest first. Page with ?before_id=<last id of the previous page>
+        try:
+            limit = max(1, min(int(request.args.get("limit", "50")), 500))
+            before_id = request.args.get("before_id")
+            before_id = int(before_id) if before_id else None
+        except ValueError:
+            return jsonify({"error": "limit and before_id must be integers"}), 400
+        rows = fetch_alerts(limit=limit, before_id=before_id, rule=request.args.get("rule"))
+        g.rows_served = len(rows)
+        next_before = rows[-1]["id"] if len(rows) == limit else None
+        return jsonify({"alerts": rows, "next_before_id": next_before}), 200
+
+
+    @app.get("/stream")
+    def event_stream():
+        # Server-sent events: one "alert" event per new alerts row. A reconnecting
+        # browser sends Last-Event-ID and gets whatever it missed; a new one starts
+        # from the newest alert (or ?after_id=)
+        last = request.headers.get("Last-Event-ID") or request.args.get("after_id")
+        try:
+            cursor = int(last) if last else None
+        except ValueError:
+            return jsonify({"error": "Last-Event-ID / after_id must be an integer"}), 400
+        if cursor is None:
+            newest = fetch_alerts(limit=1)
+            cursor = newest[0]["id"] if newest else 0
+        poll_s, beat_s = app.config['STREAM_POLL_S'], app.config['STREAM_HEARTBEAT_S']
+        deadline = monotonic() + app.config['STREAM_MAX_SECONDS']
+
+        def generate():
+            nonlocal cursor
+            yield f"retry: {int(poll_s * 1000) + 1000}\n\n"
+            last_sent = monotonic()
+            while True:
+                for a in fetch_alerts(limit=100, after_id=cursor):
+                    cursor = a["id"]
+                    yield f"id: {a['id']}\nevent: alert\ndata: {json.dumps(a)}\n\n"
+                    last_sent = monotonic()
+                now = monotonic()
+                if now >= deadline:
+                    return
+                if now - last_sent >= beat_s:
+                    yield ": keep-alive\n\n"
+                    last_sent = now
+                sleep(min(poll_s, max(deadline - now, 0.0)))
+
+        return Response(generate(), mimetype="text/event-stream",
+                        headers={"X-Accel-Buffering": "no"})
+
 
 
     @app.get("/export")
@@ -575,38 +1070,37 @@ def create_app():
 
         try:
             if from_ts and to_ts:
-                # Validate and normalize to UTC ISO
-                dt_from = datetime.fromisoformat(from_ts.replace("Z", "+00:00")).astimezone(timezone.utc)
-                dt_to = datetime.fromisoformat(to_ts.replace("Z", "+00:00")).astimezone(timezone.utc)
-                iso_from = dt_from.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
-                iso_to = dt_to.replace(tzinfo=timezone.utc).isoformat().replace("+00:00", "Z")
-                with sqlite3.connect(DB_PATH) as conn:
-                    conn.row_factory = sqlite3.Row
-                    cur = conn.cursor()
-                    cur.execute("""
-                        SELECT id, timestamp, temperature, pressure, motor_speed
-                        FROM readings
-                        WHERE timestamp BETWEEN ? AND ?
-                        ORDER BY timestamp ASC
-                    """, (iso_from, iso_to))
-                    rows = [dict(r) for r in cur.fetchall()]
+                iso_from, iso_to = export_range(from_ts, to_ts)
+                # The query runs now (so errors still map to a 500); rows are pulled lazily
+                # while streaming, so a long range is never held in memory at once
+                conn = sqlite3.connect(DB_PATH)
+                try:
+                    cur = conn.execute(EXPORT_RANGE_SQL, (iso_from, iso_to))
+                except Exception:
+                    conn.close()
+                    raise
+
+                def iter_rows():
+                    try:
+                        while True:
+                            chunk = cur.fetchmany(5000)
+                            if not chunk:
+                                break
+                            yield from chunk
+                    finally:
+                        conn.close()
+                rows = iter_rows()
             else:
                 n = int(n_param)
                 n = max(1, min(n, 2000))
-                rows = fetch_last_n(n)  # oldest->newest
+                rows = [tuple(r[k] for k in EXPORT_FIELDS) for r in fetch_last_n(n)]  # oldest->newest
         except ValueError:
             return jsonify({"error": "bad parameters: use n or from/to ISO8601"}), 400
         except Exception as e:
             return jsonify({"error": str(e)}), 500
 
-        import csv, io
-        buf = io.StringIO()
-        writer = csv.DictWriter(buf, fieldnames=["id","timestamp","temperature","pressure","motor_speed"])
-        writer.writeheader()
-        for r in rows or []:
-            writer.writerow(r)
         return Response(
-            buf.getvalue(),
+            csv_chunks(rows),
             mimetype="text/csv",
             headers={"Content-Disposition": "attachment; filename=history.csv"}
         )
@@ -652,8 +1146,7 @@ def create_app():
 
         if rows_nf:
             X = np.array([[r["temperature"], r["pressure"], r["motor_speed"]] for r in rows_nf], dtype=float)
-            clf = fit_iforest(X, contamination=c, random_state=42)
-            scores_vals, is_out = score_iforest(clf, X)
+            scores_vals, is_out, _ = detect_scores(X, "iforest", c)
         else:
             scores_vals, is_out = [], []
 
@@ -718,10 +1211,38 @@ def create_app():
             headers={"Content-Disposition": "attachment; filename=anomaly_report.pdf"}
         )
     
+    @app.errorhandler(ScoringBusy)
+    def scoring_busy(e):
+        # saturated scoring pool and no earlier scores for this window to fall back on
+        return jsonify({"error": "scoring is overloaded, retry shortly", "detail": str(e)}), 503, {"Retry-After": "1"}
+
     @app.before_request
     def before_request_hook():
         g._t0 = perf_counter()
         g.request_id = str(uuid.uuid4())
+        g.rows_served = 0
+        g.spans = []
+        REQUESTS_IN_FLIGHT.labels(request.endpoint or "-").inc()
+        g._in_flight = True
+        g.etag = None
+        sid = replay_session()
+        if sid and not re.fullmatch(r"[A-Za-z0-9_-]{1,64}", sid):
+            return jsonify({"error": "X-Replay-Session must be up to 64 letters, digits, - or _"}), 400
+        if request.method == "GET" and request.endpoint in ETAG_ENDPOINTS:
+            try:
+                if request.endpoint == "history":
+                    # a replaying chart moves on with every poll: move first, so the tag
+                    # covers the new position and a 304 never stops the replay in place
+                    g.replay = advance_replay()
+                g.etag = compute_etag()
+            except Exception as e:
+                app.logger.warning(json.dumps({"rid": g.request_id, "etag_error": str(e)}))
+                return None
+            if request.if_none_match.contains_weak(g.etag):
+                # Nothing changed since the client's copy: skip the query, model and encoding
+                resp = Response(status=304)
+                resp.set_etag(g.etag, weak=True)
+                return resp
 
     @app.after_request
     def after_request_hook(resp):
@@ -730,19 +1251,53 @@ def create_app():
         m["requests_total"] += 1
         m["latency_ms_sum"] += ms
         m["latency_ms_count"] += 1
-        resp.headers["Cache-Control"] = "no-store"
+        REQUEST_LATENCY.labels(request.endpoint or "-", request.method).observe(ms / 1000.0)
+        if g.get("rows_served"):
+            ROWS_SERVED.labels(request.endpoint or "-").inc(g.rows_served)
+        if g.get("scores_stale"):
+            # scored from the last window because the scoring pool was busy; not cacheable
+            resp.headers["X-Scores-Stale"] = "1"
+        elif g.get("etag") and resp.status_code in (200, 304):
+            # Let browsers keep the body but always revalidate it with If-None-Match
+            resp.set_etag(g.etag, weak=True)
+            resp.headers["Cache-Control"] = "no-cache"
+            # replay windows differ per session
+            resp.vary.add("X-Replay-Session")
+        else:
+            resp.headers["Cache-Control"] = "no-store"
         resp.headers["X-Response-Time"] = f"{ms:.2f}ms"
-        app.logger.info(json.dumps({
+        resp.headers["X-Request-Id"] = g.request_id
+        with span("compress"):
+            compress_response(
+                resp, request.headers.get("Accept-Encoding"), request.endpoint, m["compression"],
+                level=app.config['COMPRESS_LEVEL'], br_quality=app.config['COMPRESS_BR_QUALITY'],
+                min_size=app.config['COMPRESS_MIN_SIZE'],
+            )
+        record = {
             "rid": g.request_id, "method": request.method, "path": request.path,
-            "status": resp.status_code, "ms": round(ms, 2),
-        }))
+            "status": resp.status_code, "ms": round(ms, 2), "spans": g.get("spans") or [],
+        }
+        app.logger.info(json.dumps(record))
+        if ms >= app.config['TRACE_SLOW_MS'] or random.random() < app.config['TRACE_SAMPLE_RATE']:
+            app.config['_traces'].append({**record, "ts": datetime.now(timezone.utc).isoformat()})
         return resp
     
 
+    @app.teardown_request
+    def teardown_request_hook(exc):
+        # teardown runs even when a view raises, so the in-flight gauge never leaks
+        if g.pop("_in_flight", False):
+            REQUESTS_IN_FLIGHT.labels(request.endpoint or "-").dec()
+
+
     with app.app_context():
         init_db()
         init_settings_table()
         load_persisted_defaults()
+        if os.getenv("WARMUP", "1") != "0":
+            # gunicorn.conf.py sets WARMUP_AFTER_FORK when it preloads the app
+            warm_up([m.strip() for m in os.getenv("WARMUP_MODELS", WARMUP_MODELS).split(",") if m.strip()],
+                    before_fork=os.getenv("WARMUP_AFTER_FORK") == "1")
 
     return app
 
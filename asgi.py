@@ -0,0 +1,322 @@
+# asgi.py
+import asyncio, io, json, logging, os, sqlite3, sys, uuid
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from urllib.parse import parse_qs
+
+import database
+from app import EXPORT_RANGE_SQL, app as flask_app, csv_chunks, export_range
+from compression import _compress_stream, choose_encoding
+from instrumentation import REQUEST_LATENCY, REQUESTS_IN_FLIGHT
+
+
+# Async serving mode: `uvicorn asgi:app` (or gunicorn with -k uvicorn.workers.UvicornWorker).
+#
+# The two long-lived endpoints are served natively on the event loop: /stream
+# connections are asyncio tasks waiting on one shared poller of the alerts table,
+# so thousands of idle dashboards cost a few KB each instead of a thread each, and
+# a date-range /export only holds a thread while it fetches the next chunk of rows.
+# Every other route is the Flask app itself, called through a small WSGI bridge on
+# a bounded thread pool, so ETags, compression, metrics and the scoring code are
+# the ones gunicorn serves. Routes that score a window (CPU-bound) get their own
+# pool, so a burst of model requests cannot starve the cheap reads.
+
+DB_THREADS = int(os.getenv("ASGI_DB_THREADS", "8"))
+# the scoring routes mostly wait on the scoring pool (SCORING_CPUS), so a few threads do
+SCORE_THREADS = int(os.getenv("ASGI_SCORE_THREADS", "2"))
+SCORING_PATHS = {"/scores", "/anomalies", "/scores_for_window", "/report"}
+
+log = logging.getLogger("asgi")
+
+
+def wsgi_environ(scope, body: bytes):
+    """PEP 3333 environ for an ASGI http scope and its (fully read) body."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin1"),
+        "SERVER_NAME": server[0], "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0], "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0), "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body), "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True, "wsgi.multiprocess": True, "wsgi.run_once": False,
+        # /config tells the page it may hold a /stream open (served natively here)
+        "dashboard.native_stream": True,
+    }
+    for name, value in scope.get("headers", []):
+        key = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if key == "CONTENT_LENGTH":
+            continue
+        if key != "CONTENT_TYPE":
+            key = "HTTP_" + key
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def watch_disconnect(receive, on_disconnect):
+    # Reads the request's remaining messages until the client goes away
+    while (await receive())["type"] != "http.disconnect":
+        pass
+    on_disconnect()
+
+
+class AlertHub:
+    """One poller of the alerts table shared by every open /stream connection."""
+
+    def __init__(self, run_db, poll_s):
+        self.run_db = run_db
+        self.poll_s = poll_s
+        self.subscribers = set()
+        self.cursor = None
+        self._task = None
+
+    def subscribe(self):
+        q = asyncio.Queue()
+        self.subscribers.add(q)
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return q
+
+    def unsubscribe(self, q):
+        self.subscribers.discard(q)
+
+    async def _run(self):
+        try:
+            while self.subscribers:
+                try:
+                    if self.cursor is None:
+                        newest = await self.run_db(database.fetch_alerts, 1)
+                        self.cursor = newest[0]["id"] if newest else 0
+                    for a in await self.run_db(database.fetch_alerts, 500, None, self.cursor):
+                        self.cursor = a["id"]
+                        for q in self.subscribers:
+                            q.put_nowait(a)
+                except Exception as e:
+                    log.warning(json.dumps({"alert_hub_error": str(e)}))
+                await asyncio.sleep(self.poll_s)
+        finally:
+            # the next subscriber starts a new poller from wherever this one stopped
+            self._task = None
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+
+class DashboardASGI:
+    """The dashboard as an ASGI app: native /stream and /export, Flask for the rest."""
+
+    def __init__(self, wsgi_app, db_threads=DB_THREADS, score_threads=SCORE_THREADS):
+        self.wsgi = wsgi_app
+        self.db_pool = ThreadPoolExecutor(db_threads, thread_name_prefix="asgi-db")
+        self.score_pool = ThreadPoolExecutor(score_threads, thread_name_prefix="asgi-score")
+        self.hub = None
+
+    @property
+    def config(self):
+        return self.wsgi.config
+
+    def run_db(self, fn, *args):
+        return asyncio.get_running_loop().run_in_executor(self.db_pool, fn, *args)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+        args = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode("latin1")).items()}
+        headers = {k.decode("latin1").lower(): v.decode("latin1") for k, v in scope.get("headers", [])}
+        if scope["method"] == "GET" and scope["path"] == "/stream":
+            last = headers.get("last-event-id") or args.get("after_id")
+            if not last or last.isdigit():
+                return await self.stream(int(last) if last else None, receive, send)
+        elif scope["method"] == "GET" and scope["path"] == "/export" and args.get("from") and args.get("to"):
+            try:
+                span = export_range(args["from"], args["to"])
+            except ValueError:
+                pass  # Flask answers with its usual 400
+            else:
+                return await self.export(span, headers.get("accept-encoding"), receive, send)
+        pool = self.score_pool if scope["path"] in SCORING_PATHS else self.db_pool
+        await self.call_wsgi(scope, receive, send, pool)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.hub:
+                    self.hub.stop()
+                self.db_pool.shutdown(wait=False)
+                self.score_pool.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def call_wsgi(self, scope, receive, send, pool):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        loop = asyncio.get_running_loop()
+
+        def send_sync(message):
+            # blocks the pool thread until the event loop has written the message
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        await loop.run_in_executor(pool, self._serve_wsgi, wsgi_environ(scope, bytes(body)), send_sync)
+
+    def _serve_wsgi(self, environ, send_sync):
+        # The whole response (including a streamed body) is produced on this one
+        # thread, as under gunicorn; Flask views may keep thread-bound sqlite handles
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started["status"] = int(status.split(" ", 1)[0])
+            started["headers"] = [(k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers]
+
+        def start():
+            send_sync({"type": "http.response.start", "status": started["status"],
+                       "headers": started["headers"]})
+
+        result = self.wsgi(environ, start_response)
+        try:
+            sent = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not sent:
+                    start()
+                    sent = True
+                send_sync({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not sent:
+                start()
+            send_sync({"type": "http.response.body", "body": b""})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    async def stream(self, cursor, receive, send):
+        # Same events as Flask's /stream (see app.event_stream), without a thread
+        config = self.config
+        poll_s, beat_s = config['STREAM_POLL_S'], config['STREAM_HEARTBEAT_S']
+        deadline = monotonic() + config['STREAM_MAX_SECONDS']
+        if self.hub is None:
+            self.hub = AlertHub(self.run_db, poll_s)
+        # subscribe before the catch-up query, so nothing lands between the two
+        q = self.hub.subscribe()
+        watcher = asyncio.create_task(watch_disconnect(receive, lambda: q.put_nowait(None)))
+        gauge = REQUESTS_IN_FLIGHT.labels("event_stream")
+        gauge.inc()
+        try:
+            if cursor is None:
+                newest = await self.run_db(database.fetch_alerts, 1)
+                cursor = newest[0]["id"] if newest else 0
+            await send({"type": "http.response.start", "status": 200, "headers": [
+                (b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-store"),
+                (b"x-accel-buffering", b"no"), (b"x-request-id", str(uuid.uuid4()).encode())]})
+
+            async def emit(text):
+                await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+            await emit(f"retry: {int(poll_s * 1000) + 1000}\n\n")
+            while True:
+                missed = await self.run_db(database.fetch_alerts, 100, None, cursor)
+                for a in missed:
+                    cursor = a["id"]
+                    await emit(f"id: {a['id']}\nevent: alert\ndata: {json.dumps(a)}\n\n")
+                if len(missed) < 100:
+                    break
+            last_sent = monotonic()
+            while True:
+                now = monotonic()
+                if now >= deadline:
+                    break
+                try:
+                    a = await asyncio.wait_for(q.get(), min(deadline, last_sent + beat_s) - now)
+                except asyncio.TimeoutError:
+                    if monotonic() < deadline:
+                        await emit(": keep-alive\n\n")
+                        last_sent = monotonic()
+                    continue
+                if a is None:
+                    return  # client went away
+                if a["id"] > cursor:
+                    cursor = a["id"]
+                    await emit(f"id: {a['id']}\nevent: alert\ndata: {json.dumps(a)}\n\n")
+                    last_sent = monotonic()
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            gauge.dec()
+            watcher.cancel()
+            self.hub.unsubscribe(q)
+
+    async def export(self, span, accept_encoding, receive, send):
+        # A date-range CSV export: the rows are fetched chunk by chunk on the DB
+        # pool (one connection, used by one thread at a time) and written between
+        # fetches, so a slow download holds a socket but no thread. Compressed and
+        # counted like Flask's export_csv (see app.after_request_hook)
+        config = self.config
+        t0 = monotonic()
+        gone = asyncio.Event()
+        watcher = asyncio.create_task(watch_disconnect(receive, gone.set))
+        gauge = REQUESTS_IN_FLIGHT.labels("export_csv")
+        gauge.inc()
+        conn = sqlite3.connect(database.DB_PATH, check_same_thread=False)
+        chunks = None
+        try:
+            cur = await self.run_db(conn.execute, EXPORT_RANGE_SQL, span)
+
+            def rows():
+                while chunk := cur.fetchmany(5000):
+                    yield from chunk
+
+            chunks = csv_chunks(rows())
+            headers = [(b"content-type", b"text/csv; charset=utf-8"), (b"cache-control", b"no-store"),
+                       (b"content-disposition", b"attachment; filename=history.csv"),
+                       (b"vary", b"Accept-Encoding"), (b"x-request-id", str(uuid.uuid4()).encode())]
+            encoding = choose_encoding(accept_encoding)
+            if encoding:
+                chunks = _compress_stream(chunks, encoding, config['COMPRESS_LEVEL'], config['COMPRESS_BR_QUALITY'],
+                                          config['_metrics']['compression'], "export_csv")
+                headers.append((b"content-encoding", encoding.encode()))
+            await send({"type": "http.response.start", "status": 200, "headers": headers})
+            # Flask's hook observes a streamed response once its headers are out
+            ms = (monotonic() - t0) * 1000.0
+            m = config['_metrics']
+            m["requests_total"] += 1
+            m["latency_ms_sum"] += ms
+            m["latency_ms_count"] += 1
+            REQUEST_LATENCY.labels("export_csv", "GET").observe(ms / 1000.0)
+            while not gone.is_set():
+                body = await self.run_db(next, chunks, None)
+                if body is None:
+                    await send({"type": "http.response.body", "body": b""})
+                    break
+                if isinstance(body, str):
+                    body = body.encode()
+                await send({"type": "http.response.body", "body": body, "more_body": True})
+        finally:
+            gauge.dec()
+            watcher.cancel()
+            if chunks is not None:
+                # records the compression stats of a download cut short
+                await self.run_db(chunks.close)
+            await self.run_db(conn.close)
+
+
+def create_asgi(wsgi_app=flask_app):
+    return DashboardASGI(wsgi_app)
+
+
+app = create_asgi()
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from time import monotonic
+
+import numpy as np
+
+import database
+from models.sketch import TDigest
+from models.streaming import DETECTOR_VERSION, STREAMING_MODELS, flag_top, make_detector
+
+
+# Calibrated anomaly thresholds. Instead of flagging the top `contamination` share
+# of every window (which always finds anomalies, even on a healthy machine, and
+# moves the cut-off from one poll to the next), a reading is flagged when its score
+# is above the (1 - contamination) quantile of the model's score distribution.
+# That distribution is a t-digest per (model, version) in model_thresholds. It is
+# seeded from history by scripts/calibrate.py and kept up to date by the ingest
+# pipeline as it scores new readings. Until a version has CALIBRATION_MIN_SAMPLES
+# scores the old per-window top-k is used.
+#
+# The streaming detectors' distribution is that of the pipeline's long-running
+# detector; a dashboard window scored on the fly gets a fresh detector, which is
+# run over the readings before the window first (models/streaming.score_streaming)
+# so its scores are on the same scale.
+#
+# iforest is not calibrated: it is refitted on each window, so its scores are not
+# comparable from one window to the next. iforest_ref (one forest trained on long
+# history, models/store.py) is, per stored version.
+
+MIN_SAMPLES = int(os.getenv("CALIBRATION_MIN_SAMPLES", "1000"))
+QUANTILES = (0.9, 0.95, 0.98, 0.99, 0.995, 0.999)
+
+
+def model_version(name: str):
+    """Version the thresholds of a model are stored under, or None if it is not calibrated."""
+    if name == "lstm":
+        from models.lstm import artifact_version
+        version = artifact_version()
+        return None if "none" in version else version
+    if name in STREAMING_MODELS:
+        return DETECTOR_VERSION
+    if name == "iforest_ref":
+        from models.store import current_version
+        return current_version("iforest_ref")
+    return None
+
+
+class Calibrator:
+    """
+    Cache of the stored digests. Readers (the web app) reload a digest at most
+    every reload_s; a writer (the pipeline) owns the digests it updates with
+    observe() and writes them back at most every save_s, and on flush().
+    """
+
+    def __init__(self, min_samples=None, reload_s=10.0, save_s=5.0):
+        self.min_samples = MIN_SAMPLES if min_samples is None else min_samples
+        self.reload_s = reload_s
+        self.save_s = save_s
+        self._entries = {}  # (model, version) -> {"digest", "loaded_at", "owned", "dirty"}
+        self._saved_at = monotonic()
+        self._lock = threading.Lock()
+
+    def _entry(self, name, version):
+        key = (name, version)
+        e = self._entries.get(key)
+        if e is None or (not e["owned"] and monotonic() - e["loaded_at"] > self.reload_s):
+            row = database.load_threshold(name, version)
+            digest = TDigest.from_dict(json.loads(row[0])) if row else None
+            e = {"digest": digest, "updated_at": row[1] if row else None, "loaded_at": monotonic(),
+                 "owned": False, "dirty": False}
+            self._entries[key] = e
+        return e
+
+    def threshold(self, name: str, contamination: float):
+        """Score above which a reading is anomalous, or None while uncalibrated."""
+        version = model_version(name)
+        if version is None:
+            return None
+        with self._lock:
+            digest = self._entry(name, version)["digest"]
+            if digest is None or digest.n < self.min_samples:
+                return None
+            return digest.quantile(1.0 - min(max(contamination, 0.001), 0.5))
+
+    def observe(self, name: str, scores):
+        """Adds freshly computed scores of `name` to its distribution."""
+        version = model_version(name)
+        if version is None:
+            return
+        with self._lock:
+            e = self._entry(name, version)
+            if e["digest"] is None:
+                e["digest"] = TDigest()
+            e["digest"].update(scores)
+            e["owned"] = e["dirty"] = True
+        if monotonic() - self._saved_at > self.save_s:
+            self.flush()
+
+    def replace(self, name: str, digest: TDigest, version=None):
+        """Stores `digest` as the reference distribution of a model version."""
+        version = version or model_version(name)
+        with self._lock:
+            self._entries[(name, version)] = {"digest": digest, "updated_at": None, "loaded_at": monotonic(),
+                                              "owned": True, "dirty": True}
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            dirty = [(k, e) for k, e in self._entries.items() if e["dirty"]]
+            for _, e in dirty:
+                e["dirty"] = False
+            self._saved_at = monotonic()
+        for (name, version), e in dirty:
+            e["updated_at"] = save_digest(name, version, e["digest"])
+
+    def revision(self, name: str):
+        """
+        The stored thresholds row a model is flagged against (version, save time, n),
+        or None if it is not calibrated; part of the read endpoints' ETag. Taken from
+        the row rather than this process's digest, so every worker agrees on it.
+        """
+        version = model_version(name)
+        if version is None:
+            return None
+        with self._lock:
+            e = self._entry(name, version)
+            return f"{name}:{version}:{e['updated_at']}:{e['digest'].n if e['digest'] else 0}"
+
+    def flag(self, name: str, scores, contamination: float):
+        """is_anomaly for a window of scores: threshold compare when calibrated, else top-k."""
+        thr = self.threshold(name, contamination)
+        scores = np.asarray(scores, dtype=float)
+        return scores > thr if thr is not None else flag_top(scores, contamination)
+
+
+def save_digest(name, version, digest):
+    """Writes a digest to model_thresholds; returns its updated_at."""
+    quantiles = {str(q): round(digest.quantile(q), 6) for q in QUANTILES}
+    updated_at = datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+    database.save_threshold(name, version, int(digest.n), json.dumps(digest.to_dict()), json.dumps(quantiles),
+                            updated_at)
+    return updated_at
+
+
+def reference_digest(name: str, chunks):
+    """
+    Digest of a model's scores over history, given as oldest->newest [n, 3]
+    feature chunks. Streaming detectors carry their state across chunks; LSTM
+    windows overlap by seq_len - 1 readings so every reading gets one score.
+    """
+    digest = TDigest()
+    if name in STREAMING_MODELS:
+        detector = make_detector(name)
+        for X in chunks:
+            digest.update(detector.score_batch(X))
+    elif name == "iforest_ref":
+        from models.store import load_forest
+        forest = load_forest("iforest_ref")
+        for X in chunks:
+            digest.update(forest.score(X))
+    elif name == "lstm":
+        from models.lstm import load_artifacts, score_window
+        model, scaler, seq_len = load_artifacts()
+        tail = None
+        for X in chunks:
+            W = X if tail is None else np.vstack([tail, X])
+            scores, _ = score_window(model, scaler, seq_len, W, 0.05)
+            digest.update(scores[seq_len - 1:] if tail is None else scores[len(W) - len(X):])
+            tail = W[len(W) - (seq_len - 1):]
+    else:
+        raise ValueError(f"{name} has no calibrated thresholds")
+    return digest
@@ -0,0 +1,133 @@
+import threading, zlib
+from time import perf_counter
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional; without it only gzip is negotiated
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/octet-stream")
+
+# record() runs on every response, from all of a worker's threads
+_stats_lock = threading.Lock()
+
+
+def choose_encoding(accept_encoding: str | None):
+    """Picks 'br' or 'gzip' from an Accept-Encoding header (honouring q=0), else None."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", accepted.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+def _compressor(encoding: str, level: int, br_quality: int):
+    if encoding == "br":
+        c = brotli.Compressor(quality=br_quality)
+        return c.process, c.finish
+    # wbits=31 -> gzip container
+    c = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return c.compress, c.flush
+
+
+def record(stats: dict, endpoint: str, bytes_in: int, bytes_out: int, seconds: float):
+    with _stats_lock:
+        s = stats.setdefault(endpoint or "-", {"responses": 0, "bytes_in": 0, "bytes_out": 0, "ms_total": 0.0})
+        s["responses"] += 1
+        s["bytes_in"] += bytes_in
+        s["bytes_out"] += bytes_out
+        s["ms_total"] += seconds * 1000.0
+
+
+def summary(stats: dict):
+    """Per-endpoint compression ratio and time for /metrics."""
+    out = {}
+    with _stats_lock:
+        # a snapshot, so a response recorded meanwhile cannot change the dict mid-iteration
+        stats = {endpoint: dict(s) for endpoint, s in stats.items()}
+    for endpoint, s in stats.items():
+        out[endpoint] = {
+            "responses": s["responses"],
+            "bytes_in": s["bytes_in"],
+            "bytes_out": s["bytes_out"],
+            "ratio": round(s["bytes_in"] / s["bytes_out"], 2) if s["bytes_out"] else None,
+            "ms_total": round(s["ms_total"], 2),
+        }
+    return out
+
+
+def _compress_stream(chunks, encoding, level, br_quality, stats, endpoint):
+    """Compresses a streamed body chunk by chunk, so /export never buffers the whole file."""
+    compress, finish = _compressor(encoding, level, br_quality)
+    bytes_in = bytes_out = 0
+    spent = 0.0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            t0 = perf_counter()
+            out = compress(chunk)
+            spent += perf_counter() - t0
+            bytes_in += len(chunk)
+            if out:
+                bytes_out += len(out)
+                yield out
+        t0 = perf_counter()
+        out = finish()
+        spent += perf_counter() - t0
+        bytes_out += len(out)
+        yield out
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+        record(stats, endpoint, bytes_in, bytes_out, spent)
+
+
+def compress_response(resp, accept_encoding, endpoint, stats, level=6, br_quality=4, min_size=1024):
+    """
+    Compresses a Flask response in place when the client accepts it and the body
+    is worth it: buffered bodies below min_size are left alone, streamed bodies are
+    always compressed incrementally.
+    """
+    if resp.status_code < 200 or resp.status_code in (204, 304):
+        return resp
+    if resp.direct_passthrough or "Content-Encoding" in resp.headers:
+        return resp
+    if not (resp.mimetype or "").startswith(COMPRESSIBLE_TYPES):
+        return resp
+    if resp.mimetype == "text/event-stream":
+        # the compressor would hold events back until it has a full block to emit
+        return resp
+    encoding = choose_encoding(accept_encoding)
+    resp.vary.add("Accept-Encoding")
+    if encoding is None:
+        return resp
+
+    if resp.is_streamed:
+        resp.response = _compress_stream(resp.response, encoding, level, br_quality, stats, endpoint)
+        resp.headers.pop("Content-Length", None)
+    else:
+        body = resp.get_data()
+        if len(body) < min_size:
+            return resp
+        t0 = perf_counter()
+        compress, finish = _compressor(encoding, level, br_quality)
+        out = compress(body) + finish()
+        record(stats, endpoint, len(body), len(out), perf_counter() - t0)
+        resp.set_data(out)
+    resp.headers["Content-Encoding"] = encoding
+    return resp
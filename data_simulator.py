@@ -1,7 +1,10 @@
+import os
 import time              
 import random             
 from datetime import datetime  
 from database import insert_reading, init_db  
+from pipeline import ScoringPipeline
+from alerts import AlertEngine, load_rules
 
 def generate_temperature():
     # Simulate temperature between 20–80 °C (float) 
@@ -21,6 +24,13 @@ def iso_now():
 
 def main():
     init_db()  # ensure table exists before inserting 
+    # Score each reading as it arrives (INGEST_SCORING=0 leaves scoring to the read endpoints)
+    # and run the alert rules over the new scores after every batch (ALERTS=0 turns that off)
+    pipeline = None
+    if os.getenv("INGEST_SCORING", "1") != "0":
+        hooks = [AlertEngine(load_rules()).poll] if os.getenv("ALERTS", "1") != "0" else []
+        pipeline = ScoringPipeline(maxsize=int(os.getenv("INGEST_QUEUE_SIZE", "256")),
+                                   after_batch=hooks).start()
     print("Starting simulator. Press Ctrl+C to stop.")  # status message 
     try:
         while True:  # infinite loop to generate a reading per second 
@@ -28,11 +38,16 @@ def main():
             temp = generate_temperature()    # random temp 
             pres = generate_pressure()       # random pressure 
             rpm = generate_motor_speed()     # random rpm 
-            insert_reading(ts, temp, pres, rpm)  # save to SQLite 
+            reading_id = insert_reading(ts, temp, pres, rpm)  # save to SQLite 
+            if pipeline:
+                pipeline.submit(reading_id, reading_id)  # hand off to the scoring worker
             print(f"{ts} | T={temp}°C P={pres}bar RPM={rpm}")  # quick console log 
             time.sleep(1)  # wait 1 second before next reading 
     except KeyboardInterrupt:
         print("Simulator stopped.")   
+    finally:
+        if pipeline:
+            pipeline.stop()
 
 if __name__ == "__main__":
     main()   
@@ -1,5 +1,8 @@
 import sqlite3  
-import os, pathlib
+import os, pathlib, json
+
+from instrumentation import DB_QUERY_SECONDS, timed
+from tracing import traced
 
 BASE_DIR = pathlib.Path(__file__).resolve().parent
 DEFAULT_DB = BASE_DIR / "data" / "sensor_data.db"
@@ -35,6 +38,46 @@ def init_db():
             )
         """)
 
+        # Scores written by the score-at-ingest pipeline (pipeline.py), one per reading
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS scores(
+                reading_id INTEGER PRIMARY KEY,
+                model TEXT NOT NULL,
+                score REAL NOT NULL,
+                is_anomaly INTEGER NOT NULL
+            )
+        """)
+
+        # Alert log (alerts.py): one row per rule state change, "firing" or "resolved"
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS alerts(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                rule TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                severity TEXT NOT NULL,
+                state TEXT NOT NULL,
+                ts TEXT NOT NULL,
+                reading_id INTEGER NOT NULL,
+                model TEXT,
+                value REAL,
+                message TEXT
+            )
+        """)
+
+        # Score distributions behind the calibrated thresholds (calibration.py): a
+        # t-digest per model version plus a few of its quantiles for inspection
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS model_thresholds(
+                model TEXT NOT NULL,
+                version TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                quantiles TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (model, version)
+            )
+        """)
+
         # seed defaults if missing (safe for repeated runs)
         defaults = {
             "contamination_default": "0.05",
@@ -49,7 +92,7 @@ def init_db():
         conn.commit()
 
 def insert_reading(timestamp, temperature, pressure, motor_speed):
-    # Insert one sensor reading row using placeholders (?) for safety
+    # Insert one sensor reading row using placeholders (?) for safety; returns its id
     with get_connection() as conn:
         cur = conn.cursor()
         cur.execute(
@@ -57,7 +100,126 @@ def insert_reading(timestamp, temperature, pressure, motor_speed):
             (timestamp, temperature, pressure, motor_speed)  # values substituted into ?s
         )
         conn.commit()  # persist the insert
+        return cur.lastrowid
+
+def insert_readings(rows):
+    # Bulk insert of (timestamp, temperature, pressure, motor_speed) tuples in one transaction.
+    # Returns the (first_id, last_id) range written, or None for an empty batch
+    rows = list(rows)
+    if not rows:
+        return None
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO readings (timestamp, temperature, pressure, motor_speed) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        # ids of one transaction are consecutive, so the newest id gives the whole range
+        last_id = conn.execute("SELECT MAX(id) FROM readings").fetchone()[0]
+        conn.commit()
+    return last_id - len(rows) + 1, last_id
+
+def first_id_within(seconds: float):
+    # Smallest reading id whose timestamp is within `seconds` of the newest reading (1 if none)
+    with get_connection() as conn:
+        newest = conn.execute("SELECT timestamp FROM readings ORDER BY id DESC LIMIT 1").fetchone()
+        if not newest:
+            return 1
+        row = conn.execute(
+            "SELECT MIN(id) FROM readings WHERE timestamp >= strftime('%Y-%m-%dT%H:%M:%S', ?, ?)",
+            (newest[0].rstrip("Z"), f"-{seconds:.0f} seconds")).fetchone()
+    return row[0] or 1
+
+def insert_scores(rows):
+    # Upsert (reading_id, model, score, is_anomaly) rows from the ingest pipeline
+    with get_connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO scores (reading_id, model, score, is_anomaly) VALUES (?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+
+def load_threshold(model: str, version: str):
+    # (digest JSON, updated_at) stored for a model version, or None
+    with get_connection() as conn:
+        return conn.execute(
+            "SELECT digest, updated_at FROM model_thresholds WHERE model = ? AND version = ?",
+            (model, version)).fetchone()
+
+def save_threshold(model: str, version: str, n: int, digest: str, quantiles: str, updated_at: str):
+    with get_connection() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO model_thresholds (model, version, n, digest, quantiles, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)", (model, version, n, digest, quantiles, updated_at))
+        conn.commit()
+
+def fetch_thresholds():
+    # Every stored model version with its sample count and quantiles, newest first
+    with get_connection() as conn:
+        rows = conn.execute(
+            "SELECT model, version, n, quantiles, updated_at FROM model_thresholds "
+            "ORDER BY updated_at DESC").fetchall()
+    return [{"model": m, "version": v, "n": n, "quantiles": json.loads(q), "updated_at": u}
+            for m, v, n, q, u in rows]
+
+ALERT_FIELDS = ("id", "rule", "kind", "severity", "state", "ts", "reading_id", "model", "value", "message")
+
+def insert_alerts(events, cursor=None):
+    # Appends alert events and (optionally) moves settings.alerts_cursor in the same
+    # transaction. Sets "id" on each event and returns them
+    with get_connection() as conn:
+        for e in events:
+            cur = conn.execute(
+                "INSERT INTO alerts (rule, kind, severity, state, ts, reading_id, model, value, message) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                tuple(e[k] for k in ALERT_FIELDS[1:]))
+            e["id"] = cur.lastrowid
+        if cursor is not None:
+            conn.execute(
+                "INSERT INTO settings(key, value) VALUES('alerts_cursor', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value", (str(cursor),))
+        conn.commit()
+    return events
+
+@timed(DB_QUERY_SECONDS, "fetch_alerts")
+@traced("fetch_alerts")
+def fetch_alerts(limit=50, before_id=None, after_id=None, rule=None):
+    # Alert log page as dicts. before_id pages backwards (newest first); after_id
+    # reads forwards (oldest first) for the live stream. Both are primary key seeks
+    where, args = [], []
+    if before_id is not None:
+        where.append("id < ?"); args.append(before_id)
+    if after_id is not None:
+        where.append("id > ?"); args.append(after_id)
+    if rule:
+        where.append("rule = ?"); args.append(rule)
+    sql = f"SELECT {', '.join(ALERT_FIELDS)} FROM alerts"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id " + ("ASC" if after_id is not None else "DESC") + " LIMIT ?"
+    with get_connection() as conn:
+        rows = conn.execute(sql, (*args, limit)).fetchall()
+    return [dict(zip(ALERT_FIELDS, r)) for r in rows]
+
+@timed(DB_QUERY_SECONDS, "fetch_scores")
+@traced("fetch_scores")
+def fetch_scores(first_id: int, last_id: int, model: str):
+    # Stored ingest-time scores for ids in [first_id, last_id] from `model`: {reading_id: score}
+    with get_connection() as conn:
+        cur = conn.execute(
+            "SELECT reading_id, score FROM scores WHERE reading_id BETWEEN ? AND ? AND model = ?",
+            (first_id, last_id, model))
+        return dict(cur.fetchall())
+
+def fetch_range(first_id: int, last_id: int):
+    # Readings with first_id <= id <= last_id as tuples, oldest->newest
+    with get_connection() as conn:
+        cur = conn.execute(
+            "SELECT id, timestamp, temperature, pressure, motor_speed FROM readings "
+            "WHERE id BETWEEN ? AND ? ORDER BY id ASC", (first_id, last_id))
+        return cur.fetchall()
 
+@timed(DB_QUERY_SECONDS, "fetch_latest")
+@traced("fetch_latest")
 def fetch_latest():
     # Return the most recent reading by id in descending order
     with get_connection() as conn:
@@ -80,6 +242,8 @@ def fetch_latest():
             "motor_speed": row[4],
         }
 
+@timed(DB_QUERY_SECONDS, "fetch_last_n")
+@traced("fetch_last_n")
 def fetch_last_n(n=100):
     # Get last n readings ordered newest-first
     with get_connection() as conn:
@@ -103,6 +267,8 @@ def fetch_last_n(n=100):
             for r in rows
         ]
 
+@timed(DB_QUERY_SECONDS, "fetch_last_n_raw")
+@traced("fetch_last_n_raw")
 def fetch_last_n_raw(n):
     with sqlite3.connect(DB_PATH) as conn:
         conn.row_factory = sqlite3.Row
@@ -115,4 +281,36 @@ def fetch_last_n_raw(n):
         """, (n,))
         rows = cur.fetchall()
     # Return newest-first dictionaries
-    return [dict(r) for r in rows]
\ No newline at end of file
+    return [dict(r) for r in rows]
+
+@timed(DB_QUERY_SECONDS, "fetch_last_n_tuples")
+@traced("fetch_last_n_tuples")
+def fetch_last_n_tuples(n):
+    # Same rows as fetch_last_n_raw (newest-first) but as plain tuples,
+    # for the columnar/binary response paths that never need per-row dicts
+    with sqlite3.connect(DB_PATH) as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT id, timestamp, temperature, pressure, motor_speed
+            FROM readings
+            ORDER BY id DESC
+            LIMIT ?
+        """, (n,))
+        return cur.fetchall()
+
+
+@timed(DB_QUERY_SECONDS, "fetch_window_at_index")
+@traced("fetch_window_at_index")
+def fetch_window_at_index(n: int, end_id: int, as_tuples: bool = False):
+    # Replay window: the (up to) n rows, oldest->newest, ending at reading id end_id.
+    # A primary key range seek, so any position in a long history costs the same
+    with sqlite3.connect(DB_PATH) as conn:
+        if as_tuples:
+            cur = conn.execute(
+                "SELECT id, timestamp, temperature, pressure, motor_speed FROM readings "
+                "WHERE id <= ? ORDER BY id DESC LIMIT ?", (end_id, n))
+            return cur.fetchall()[::-1]
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM readings WHERE id <= ? ORDER BY id DESC LIMIT ?", (end_id, n))
+        return [dict(r) for r in reversed(cur.fetchall())]
@@ -0,0 +1,88 @@
+import numpy as np
+
+from serialization import ts_to_epoch_ms
+
+
+def lttb_indices(x, Y, max_points: int):
+    """
+    Largest-Triangle-Three-Buckets over one or more channels.
+
+    x is the [n] time axis and Y the [n, k] values. Channels are scaled to [0, 1]
+    and a point's triangle area is summed across them, so one index set keeps the
+    shape of every channel. Returns sorted indices, always including both ends.
+    """
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+
+    Y = np.asarray(Y, dtype=float).reshape(n, -1)
+    lo = Y.min(axis=0)
+    span = np.ptp(Y, axis=0)
+    span[span == 0] = 1.0
+    Y = (Y - lo) / span
+
+    # Interior points 1..n-2 split into max_points-2 buckets of (almost) equal size
+    n_buckets = max_points - 2
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_Y = np.add.reduceat(Y[:n - 1], edges[:-1], axis=0) / counts[:, None]
+    # The third vertex for bucket b is the average of bucket b+1 (the last point for the final bucket)
+    next_x = np.append(avg_x[1:], x[-1])
+    next_Y = np.vstack([avg_Y[1:], Y[-1]])
+
+    out = np.empty(max_points, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for b in range(n_buckets):
+        start, stop = edges[b], edges[b + 1]
+        ax, ay = x[a], Y[a]
+        bx, by = x[start:stop], Y[start:stop]
+        area = np.abs((ax - next_x[b]) * (by - ay) - (ax - bx)[:, None] * (next_Y[b] - ay)).sum(axis=1)
+        a = start + int(np.argmax(area))
+        out[b + 1] = a
+    return out
+
+
+def downsample_indices(x, Y, max_points: int, keep=None):
+    """
+    LTTB indices that also always include every position where keep is True
+    (flagged anomalies). The LTTB budget shrinks by the number of kept points so
+    the total stays within max_points unless there are more flags than that.
+    """
+    n = len(x)
+    if not max_points or max_points >= n:
+        return np.arange(n)
+    if keep is None or not np.any(keep):
+        return lttb_indices(x, Y, max_points)
+    flagged = np.flatnonzero(keep)
+    budget = max(3, max_points - len(flagged))
+    return np.union1d(lttb_indices(x, Y, budget), flagged)
+
+
+def downsample_rows(rows, max_points: int, keep=None):
+    """Applies LTTB to a list of reading dicts, keeping rows where keep is True."""
+    if not max_points or max_points >= len(rows):
+        return rows
+    x = ts_to_epoch_ms([r["timestamp"] for r in rows])
+    Y = np.array([[r["temperature"], r["pressure"], r["motor_speed"]] for r in rows], dtype=float)
+    return [rows[i] for i in downsample_indices(x, Y, max_points, keep=keep)]
+
+
+def downsample_columns(cols, max_points: int):
+    """Applies LTTB to a columnar payload, keeping rows flagged in cols['is_anomaly']."""
+    n = len(cols["ts"])
+    if not max_points or max_points >= n:
+        return cols
+    Y = np.column_stack([cols["temperature"], cols["pressure"], cols["motor_speed"]])
+    idx = downsample_indices(ts_to_epoch_ms(cols["ts"]), Y, max_points, keep=cols.get("is_anomaly"))
+    out = {}
+    for k, v in cols.items():
+        if isinstance(v, np.ndarray):
+            out[k] = v[idx]
+        elif isinstance(v, list):
+            out[k] = [v[i] for i in idx]
+        else:
+            out[k] = v
+    return out
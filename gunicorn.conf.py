@@ -0,0 +1,47 @@
+# Gunicorn settings, loaded with `gunicorn -c gunicorn.conf.py app:app`.
+import os
+import shutil
+
+# Threaded workers: the dashboard's requests mostly wait on SQLite and numpy (which
+# release the GIL), and /stream holds a connection open for up to a minute
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Import the app (and warm its models, see app.warm_up) once in the master, then
+# fork: the workers share the loaded libraries, artifacts and warmed caches
+# copy-on-write instead of each paying for them on its first requests
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") != "0"
+
+if preload_app:
+    # TensorFlow must not run before a fork, and each worker starts its own scoring
+    # pool; those models are warmed in post_fork instead (see app.after_fork_models)
+    os.environ["WARMUP_AFTER_FORK"] = "1"
+
+
+def on_starting(server):
+    # Start every deployment with an empty multiprocess metrics directory so
+    # counters from a previous container run are not aggregated in
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def post_fork(server, worker):
+    # Runs in the new worker before it accepts connections, so no request sees a
+    # cold LSTM or an unstarted scoring pool
+    if not preload_app or os.getenv("WARMUP", "1") == "0":
+        return
+    from app import WARMUP_MODELS, after_fork_models, app, warm_up
+    models = after_fork_models(os.getenv("WARMUP_MODELS", WARMUP_MODELS).split(","))
+    if models:
+        with app.app_context():
+            warm_up(models)
+
+
+def child_exit(server, worker):
+    # Drop the live gauges (in-flight requests) of workers that have exited
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
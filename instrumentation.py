@@ -0,0 +1,90 @@
+"""
+Prometheus instrumentation shared by the app, database and model modules.
+
+With several gunicorn workers each process keeps its own counters. When
+PROMETHEUS_MULTIPROC_DIR is set (see Dockerfile / gunicorn.conf.py), every worker
+writes its samples to memory-mapped files in that directory and /metrics/prometheus
+aggregates all of them, so every scrape sees the same numbers whichever worker
+answers it.
+"""
+import os
+from functools import wraps
+from time import perf_counter
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest,
+    multiprocess,
+)
+
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    # Sample files are created lazily on first use; make sure the directory exists
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    "dashboard_request_latency_seconds", "Request latency per route",
+    ["endpoint", "method"], buckets=LATENCY_BUCKETS,
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "dashboard_requests_in_flight", "Requests currently being handled",
+    ["endpoint"], multiprocess_mode="livesum",
+)
+DB_QUERY_SECONDS = Histogram(
+    "dashboard_db_query_seconds", "SQLite query time", ["query"], buckets=LATENCY_BUCKETS,
+)
+MODEL_FIT_SECONDS = Histogram(
+    "dashboard_model_fit_seconds", "Model fit time", ["model"], buckets=LATENCY_BUCKETS,
+)
+MODEL_SCORE_SECONDS = Histogram(
+    "dashboard_model_score_seconds", "Model scoring time", ["model"], buckets=LATENCY_BUCKETS,
+)
+ROWS_SERVED = Counter(
+    "dashboard_rows_served", "Reading rows returned to clients", ["endpoint"],
+)
+INGEST_QUEUE_DEPTH = Gauge(
+    "dashboard_ingest_queue_depth", "Batches waiting in the score-at-ingest queue",
+    multiprocess_mode="livesum",
+)
+INGEST_SCORE_LAG = Histogram(
+    "dashboard_ingest_score_lag_seconds", "Time from a batch being ingested to its scores being written",
+    buckets=LATENCY_BUCKETS,
+)
+INGEST_DROPPED = Counter(
+    "dashboard_ingest_dropped_batches", "Batches not scored because the ingest queue stayed full",
+)
+SCORING_QUEUE_DEPTH = Gauge(
+    "dashboard_scoring_queue_depth", "Scoring jobs waiting for or running in the scoring pool",
+    multiprocess_mode="livesum",
+)
+SCORING_SHED = Counter(
+    "dashboard_scoring_shed", "Requests answered without fresh scores because the scoring pool was busy",
+    ["model", "outcome"],
+)
+ALERTS_TOTAL = Counter(
+    "dashboard_alerts", "Alert state changes written by the alert engine", ["rule", "state"],
+)
+
+
+def timed(histogram, *labels):
+    """Decorator observing a function's wall time in histogram.labels(*labels)."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.labels(*labels).observe(perf_counter() - t0)
+        return wrapper
+    return decorator
+
+
+def render_latest():
+    """Returns (body, content_type) in Prometheus text format, aggregated across workers."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
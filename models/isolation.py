@@ -1,8 +1,14 @@
 # models/isolation.py
+import sklearn
 from sklearn.ensemble import IsolationForest
 import numpy as np
 
-def fit_iforest(X, contamination=0.05, random_state=42):
+from instrumentation import MODEL_FIT_SECONDS, MODEL_SCORE_SECONDS, timed
+from tracing import traced
+
+@timed(MODEL_FIT_SECONDS, "iforest")
+@traced("fit_iforest")
+def fit_iforest(X, contamination=0.05, random_state=42, n_jobs=-1):
     """
     Fit an IsolationForest on feature matrix X (numpy array of shape [n_samples, n_features]).
     Returns the fitted model.
@@ -11,11 +17,13 @@ def fit_iforest(X, contamination=0.05, random_state=42):
         n_estimators=200,
         contamination=contamination,
         random_state=random_state,
-        n_jobs=-1,
+        n_jobs=n_jobs,
     )
     clf.fit(X)
     return clf
 
+@timed(MODEL_SCORE_SECONDS, "iforest")
+@traced("score_iforest")
 def score_iforest(clf, X):
     """
     Returns:
@@ -29,3 +37,70 @@ def score_iforest(clf, X):
     preds = clf.predict(X)  # 1 for inlier, -1 for outlier
     is_outlier = preds == -1
     return scores, is_outlier
+
+
+# --- Reference forests trained on long histories (scripts/train_iforest.py) ---
+# Each worker process fits a slice of the trees on its own uniform sample of the
+# history; merge_forests() joins the slices into one IsolationForest. Every tree
+# still sees max_samples rows, as in a single fit, so the merged forest is the
+# same model a single process would have built from the whole history.
+#
+# Merging (and flattening in models/store.py) reads IsolationForest internals no
+# public API exposes. requirements.txt pins the scikit-learn range they match;
+# check_forest_internals() fails loudly on a version without them.
+
+# per-tree state a fitted IsolationForest keeps in private attributes
+FOREST_INTERNALS = ("estimators_features_", "_seeds", "_max_samples",
+                    "_decision_path_lengths", "_average_path_length_per_tree")
+
+
+def check_forest_internals(clf, names=FOREST_INTERNALS):
+    """Raises RuntimeError if a fitted IsolationForest lacks the internals merged or flattened here."""
+    missing = [name for name in names if not hasattr(clf, name)]
+    if missing:
+        raise RuntimeError(
+            f"scikit-learn {sklearn.__version__} IsolationForest has no {', '.join(missing)}; "
+            "reference forests need a version in the range pinned in requirements.txt")
+
+def fit_forest_shard(X, n_estimators, max_samples=256, random_state=42):
+    """One worker's slice of the forest (runs single-threaded inside a pool worker)."""
+    clf = IsolationForest(
+        n_estimators=n_estimators,
+        max_samples=min(max_samples, len(X)),
+        contamination="auto",
+        random_state=random_state,
+        n_jobs=1,
+    )
+    return clf.fit(X)
+
+
+def merge_forests(forests, X_ref, contamination=0.05):
+    """
+    Combines shard forests into one and sets its decision offset from X_ref (a
+    uniform sample of the history) so that `contamination` of it is flagged.
+    """
+    for clf in forests:
+        check_forest_internals(clf)
+    merged = forests[0]
+    for other in forests[1:]:
+        merged.estimators_ += other.estimators_
+        merged.estimators_features_ += other.estimators_features_
+        merged._seeds = np.concatenate([merged._seeds, other._seeds])
+        merged._average_path_length_per_tree += other._average_path_length_per_tree
+        merged._decision_path_lengths += other._decision_path_lengths
+    merged.n_estimators = len(merged.estimators_)
+    merged.contamination = contamination
+    merged.offset_ = np.percentile(merged.score_samples(X_ref), 100.0 * contamination)
+    return merged
+
+
+def save_iforest(clf, path):
+    # Uncompressed, so joblib.load(path, mmap_mode="r") maps the forest's numpy
+    # state instead of reading it (sklearn still copies each tree's node array)
+    import joblib
+    joblib.dump(clf, path, compress=0)
+
+
+def load_iforest(path, mmap_mode="r"):
+    import joblib
+    return joblib.load(path, mmap_mode=mmap_mode)
@@ -4,6 +4,9 @@ from keras.layers import Input, LSTM, RepeatVector, TimeDistributed, Dense
 from sklearn.preprocessing import StandardScaler
 import joblib, os
 
+from instrumentation import MODEL_SCORE_SECONDS, timed
+from tracing import traced
+
 
 HERE = os.path.dirname(__file__)
 DEFAULT_ART_DIR = os.path.abspath(os.path.join(HERE, "..", "artifacts"))
@@ -40,8 +43,37 @@ def load_artifacts(artifacts_dir="./artifacts"):
     model = load_model(os.path.join(artifacts_dir, "lstm.keras"))
     return model, meta["scaler"], meta["seq_len"]
 
+def artifact_version(artifacts_dir="./artifacts"):
+    """Cheap version tag for the saved artifacts (file mtimes); 'none' if not trained."""
+    parts = []
+    for name in ("lstm.keras", "lstm_meta.pkl"):
+        try:
+            parts.append(str(os.stat(os.path.join(artifacts_dir, name)).st_mtime_ns))
+        except OSError:
+            parts.append("none")
+    return "-".join(parts)
+
+@timed(MODEL_SCORE_SECONDS, "lstm")
+@traced("score_sequences")
 def score_sequences(model, S):
     # ensure inference mode
-    R = model.predict(S, verbose=0, use_multiprocessing=False)
+    R = model.predict(S, verbose=0)
     err = np.mean((S - R)**2, axis=(1,2))
     return err
+
+def score_window(model, scaler, seq_len, X, contamination, threshold=None):
+    """
+    Reconstruction-error scores for an oldest->newest window X, plus the flags:
+    errors above a calibrated threshold when one is given, else the top
+    `contamination` share of the window. The first seq_len-1 points score 0.
+    """
+    Xs = scaler.transform(X)
+    scores = np.zeros(len(Xs), dtype=float)
+    if len(Xs) < seq_len:
+        return scores, np.zeros(len(Xs), dtype=bool)
+    scores[seq_len-1:] = score_sequences(model, make_sequences(Xs, seq_len))
+    if threshold is not None:
+        return scores, scores > threshold
+    k = max(1, int(np.ceil(len(scores) * min(max(contamination, 0.001), 0.5))))
+    thresh = np.partition(scores, -k)[-k]
+    return scores, scores >= thresh
@@ -0,0 +1,86 @@
+# models/sketch.py
+import numpy as np
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl) for streaming quantiles of anomaly scores.
+    Keeps about delta/2 weighted centroids, small near q=0 and q=1, so tail
+    quantiles (the thresholds we care about) stay accurate however many scores
+    go in. New values are buffered and merged in blocks, vectorised.
+    """
+
+    def __init__(self, delta=300, buffer_size=2000):
+        self.delta = delta
+        self.buffer_size = buffer_size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.n = 0
+        self.min, self.max = np.inf, -np.inf
+        self._buffer = []
+
+    def update(self, values):
+        v = np.asarray(values, dtype=float).ravel()
+        v = v[np.isfinite(v)]
+        if len(v):
+            self._buffer.append(v)
+            self.n += len(v)
+            self.min, self.max = min(self.min, float(v.min())), max(self.max, float(v.max()))
+            if sum(len(b) for b in self._buffer) >= self.buffer_size:
+                self._flush()
+        return self
+
+    def merge(self, other):
+        other._flush()
+        self._flush()
+        self._compress(np.concatenate([self.means, other.means]),
+                       np.concatenate([self.weights, other.weights]))
+        self.n += other.n
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        return self
+
+    def _flush(self):
+        if self._buffer:
+            new = np.concatenate(self._buffer)
+            self._buffer = []
+            self._compress(np.concatenate([self.means, new]),
+                           np.concatenate([self.weights, np.ones(len(new))]))
+
+    def _compress(self, means, weights):
+        if not len(means):
+            return
+        order = np.argsort(means, kind="mergesort")
+        m, w = means[order], weights[order]
+        cum = np.cumsum(w)
+        q = (cum - w / 2) / cum[-1]
+        # k1 scale function: every centroid covers at most one unit of k, so
+        # centroids get narrower towards the tails
+        k = np.floor(self.delta / (2 * np.pi) * np.arcsin(2 * q - 1))
+        starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]])
+        self.weights = np.add.reduceat(w, starts)
+        self.means = np.add.reduceat(m * w, starts) / self.weights
+
+    def quantile(self, q):
+        """Estimated q-quantile (0..1) of everything seen, or None when empty."""
+        self._flush()
+        if self.n == 0:
+            return None
+        if len(self.means) == 1:
+            return float(self.means[0])
+        centers = np.cumsum(self.weights) - self.weights / 2
+        total = float(self.weights.sum())
+        return float(np.interp(min(max(q, 0.0), 1.0) * total,
+                               np.r_[0.0, centers, total], np.r_[self.min, self.means, self.max]))
+
+    def to_dict(self):
+        self._flush()
+        return {"delta": self.delta, "n": self.n, "min": self.min, "max": self.max,
+                "means": self.means.tolist(), "weights": self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        t = cls(delta=d["delta"])
+        t.n, t.min, t.max = d["n"], d["min"], d["max"]
+        t.means = np.asarray(d["means"], dtype=float)
+        t.weights = np.asarray(d["weights"], dtype=float)
+        return t
@@ -0,0 +1,156 @@
+# models/store.py
+import json, os, shutil, threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from instrumentation import MODEL_SCORE_SECONDS, timed
+from tracing import traced
+
+
+# Artifact store for models whose numeric state can be shared between worker
+# processes. A trained IsolationForest is flattened into a few .npy arrays (all
+# trees' nodes back to back) that every worker opens with np.load(mmap_mode="r"),
+# so the pages live once in the OS page cache however many gunicorn workers
+# score with it. Each save goes to a new version directory and CURRENT is switched
+# atomically; workers that still map an older version keep reading it safely.
+#
+# The LSTM is not stored here: Keras copies weights into framework-owned buffers
+# when a model is built, so mapped weight files would be copied per worker anyway.
+
+HERE = os.path.dirname(__file__)
+DEFAULT_STORE = os.path.abspath(os.path.join(HERE, "..", "artifacts"))
+STORE_DIR = os.getenv("MODEL_STORE_DIR", DEFAULT_STORE)
+FOREST_ARRAYS = ("children", "feature", "threshold", "leaf_depth", "roots")
+KEEP_VERSIONS = 2
+
+_mapped = {}  # (store dir, name, version) -> MappedForest, one per process
+_lock = threading.Lock()
+
+
+def _average_path_length(n):
+    """c(n): average path length of an unsuccessful BST search, as in sklearn's IsolationForest."""
+    n = np.asarray(n, dtype=float)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+def flatten_forest(clf):
+    """
+    Node arrays of every tree in a fitted IsolationForest, concatenated with
+    global indices. children[2 * i] / children[2 * i + 1] are the left / right
+    child of node i; a leaf points at itself, so descending past it is a no-op.
+    """
+    from models.isolation import check_forest_internals
+    check_forest_internals(clf)
+    parts = {k: [] for k in FOREST_ARRAYS}
+    start = 0
+    for tree, features, depths, avg in zip(clf.estimators_, clf.estimators_features_,
+                                           clf._decision_path_lengths, clf._average_path_length_per_tree,
+                                           strict=True):
+        t = tree.tree_
+        leaf = t.children_left == -1
+        own = np.arange(t.node_count) + start
+        parts["children"].append(np.stack([np.where(leaf, own, t.children_left + start),
+                                           np.where(leaf, own, t.children_right + start)], axis=1).ravel())
+        parts["feature"].append(np.where(leaf, 0, np.asarray(features)[np.maximum(t.feature, 0)]))
+        parts["threshold"].append(t.threshold)
+        # path length credited to a reading that ends in this leaf (same as sklearn's scoring)
+        parts["leaf_depth"].append(np.asarray(depths, dtype=float) + np.asarray(avg, dtype=float) - 1.0)
+        parts["roots"].append([start])
+        start += t.node_count
+    dtypes = {"children": np.int32, "feature": np.int32, "threshold": np.float64,
+              "leaf_depth": np.float64, "roots": np.int32}
+    return {k: np.concatenate(v).astype(dtypes[k]) for k, v in parts.items()}
+
+
+def save_forest(clf, name="iforest_ref", meta=None, root=None):
+    """Writes a fitted IsolationForest as a new version of `name` and makes it current."""
+    root = root or STORE_DIR
+    arrays = flatten_forest(clf)
+    version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+    path = os.path.join(root, name, version)
+    os.makedirs(path)
+    for k, a in arrays.items():
+        np.save(os.path.join(path, f"{k}.npy"), a)
+    depth = max(int(e.tree_.max_depth) for e in clf.estimators_)
+    info = {**(meta or {}), "version": version, "n_trees": len(clf.estimators_),
+            "max_samples": int(clf._max_samples), "n_features": int(clf.n_features_in_),
+            "max_depth": depth, "offset": float(clf.offset_)}
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(info, f, indent=2)
+    tmp = os.path.join(root, name, f"CURRENT.{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(version)
+    os.replace(tmp, os.path.join(root, name, "CURRENT"))
+    # old versions go; workers mapping them keep their open files until they reload
+    versions = sorted(d for d in os.listdir(os.path.join(root, name)) if not d.startswith("CURRENT"))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(root, name, old), ignore_errors=True)
+    return version
+
+
+def current_version(name="iforest_ref", root=None):
+    """Version id of the current artifact, or None if it was never saved."""
+    try:
+        with open(os.path.join(root or STORE_DIR, name, "CURRENT")) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class MappedForest:
+    """Read-only IsolationForest over memory-mapped node arrays."""
+
+    def __init__(self, path):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        for k in FOREST_ARRAYS:
+            setattr(self, k, np.load(os.path.join(path, f"{k}.npy"), mmap_mode="r"))
+        self.version = self.meta["version"]
+        self.offset = self.meta["offset"]
+        self._norm = len(self.roots) * float(_average_path_length([self.meta["max_samples"]])[0])
+
+    def score(self, X):
+        """Anomaly scores (higher = worse, > 0 = outlier at the training contamination)."""
+        # trees compare float32 features, like sklearn does
+        X = np.asarray(X, dtype=np.float32)
+        out = np.empty(len(X))
+        # keep the per-batch [rows, trees] scratch arrays around 1M cells
+        batch = max(16, (1 << 20) // len(self.roots))
+        for i in range(0, len(X), batch):
+            xb = X[i:i + batch]
+            rows = np.arange(len(xb))[:, None]
+            node = np.broadcast_to(self.roots, (len(xb), len(self.roots))).copy()
+            for _ in range(self.meta["max_depth"]):
+                go_right = xb[rows, self.feature[node]] > self.threshold[node]
+                node = self.children[2 * node + go_right]
+            depth = self.leaf_depth[node].sum(axis=1)
+            out[i:i + batch] = 2.0 ** (-depth / self._norm) + self.offset
+        return out
+
+
+def load_forest(name="iforest_ref", root=None):
+    """The current version of `name`, mapped once per process; None if there is none."""
+    root = root or STORE_DIR
+    version = current_version(name, root)
+    if version is None:
+        return None
+    key = (root, name, version)
+    with _lock:
+        if key not in _mapped:
+            for old in [k for k in _mapped if k[:2] == (root, name)]:
+                del _mapped[old]
+            _mapped[key] = MappedForest(os.path.join(root, name, version))
+        return _mapped[key]
+
+
+@timed(MODEL_SCORE_SECONDS, "iforest_ref")
+@traced("score_iforest_ref")
+def score_reference(forest, X, threshold=None):
+    """(scores, is_outlier) from a stored forest; a calibrated threshold replaces its own offset."""
+    scores = forest.score(X)
+    return scores, scores > (0.0 if threshold is None else threshold)
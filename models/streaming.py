@@ -0,0 +1,254 @@
+# models/streaming.py
+import numpy as np
+
+from instrumentation import MODEL_SCORE_SECONDS
+from tracing import traced
+
+
+# Online detectors with constant cost per reading. Each one learns and scores in
+# a single pass: update(x) scores a reading against what has been seen so far and
+# then absorbs it, and score_batch(X) is the same thing over an oldest->newest
+# block (equivalent to calling update row by row). Scores are "higher = worse";
+# until a detector has warmed up it returns 0.
+
+
+class RobustEWMA:
+    """
+    Per-channel exponentially weighted mean/variance z-score. Residuals are
+    clipped at `clip` sigmas before they update the baseline, so a spike or a
+    fault does not drag the mean and variance along with it.
+    """
+
+    def __init__(self, alpha=0.05, clip=3.0, warmup=20):
+        self.alpha, self.clip, self.warmup = alpha, clip, warmup
+        self.n = 0
+        self.mean = None
+        self.var = None
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.n == 0:
+            self.mean, self.var = x.copy(), np.zeros_like(x)
+            self.n = 1
+            return 0.0
+        sigma = np.sqrt(self.var) + 1e-9
+        resid = x - self.mean
+        score = float(np.max(np.abs(resid) / sigma)) if self.n >= self.warmup else 0.0
+        if self.n >= self.warmup:
+            resid = np.clip(resid, -self.clip * sigma, self.clip * sigma)
+        self.mean = self.mean + self.alpha * resid
+        self.var = (1 - self.alpha) * (self.var + self.alpha * resid * resid)
+        self.n += 1
+        return score
+
+    def score_batch(self, X):
+        return np.array([self.update(x) for x in np.asarray(X, dtype=float)])
+
+
+class OnlineMahalanobis:
+    """
+    Mahalanobis distance of each reading from an exponentially weighted mean and
+    covariance over all channels, so it catches readings that are unusual in
+    combination (e.g. temperature up while pressure is flat) even when each
+    channel on its own looks normal.
+    """
+
+    def __init__(self, alpha=0.02, warmup=30, ridge=1e-6):
+        self.alpha, self.warmup, self.ridge = alpha, warmup, ridge
+        self.n = 0
+        self.mean = None
+        self.cov = None
+
+    def update(self, x):
+        x = np.asarray(x, dtype=float)
+        if self.n == 0:
+            self.mean, self.cov = x.copy(), np.zeros((len(x), len(x)))
+            self.n = 1
+            return 0.0
+        d = x - self.mean
+        score = 0.0
+        if self.n >= self.warmup:
+            cov = self.cov + self.ridge * (np.trace(self.cov) / len(x) + 1.0) * np.eye(len(x))
+            score = float(np.sqrt(max(d @ np.linalg.solve(cov, d), 0.0)))
+        # Welford-style exponentially weighted update (alpha grows to a floor for the first readings)
+        a = max(self.alpha, 1.0 / (self.n + 1))
+        self.mean = self.mean + a * d
+        self.cov = (1 - a) * (self.cov + a * np.outer(d, d))
+        self.n += 1
+        return score
+
+    def score_batch(self, X):
+        return np.array([self.update(x) for x in np.asarray(X, dtype=float)])
+
+
+class HalfSpaceTrees:
+    """
+    Streaming half-space trees (Tan, Ting & Liu, 2011). The first `window_size`
+    readings fix the feature ranges and build random trees; after that each
+    window's mass profile is the reference for scoring the next one. Per reading
+    cost is n_trees * depth, independent of how much has been seen.
+    """
+
+    def __init__(self, n_trees=25, depth=8, window_size=250, seed=42):
+        self.n_trees, self.depth, self.window_size = n_trees, depth, window_size
+        self.size_limit = 0.1 * window_size
+        self.rng = np.random.default_rng(seed)
+        self.buffer = []
+        self.lo = self.span = None
+        self.dims = self.splits = None
+        self.ref = self.latest = None
+        self.seen = 0  # readings in the current (latest) window
+        # mean log-mass of the previous window; scores are relative to it so a
+        # typical reading scores ~0 like the warm-up readings do
+        self.typical = 0.0
+        self._log_mass_sum = 0.0
+
+    def _build(self, X):
+        n_feats = X.shape[1]
+        self.lo = X.min(axis=0)
+        self.span = np.where(X.max(axis=0) > self.lo, X.max(axis=0) - self.lo, 1.0)
+        n_internal = 2 ** self.depth - 1
+        n_nodes = 2 ** (self.depth + 1) - 1
+        self.dims = np.zeros((self.n_trees, n_internal), dtype=np.int64)
+        self.splits = np.zeros((self.n_trees, n_internal))
+        trees = np.arange(self.n_trees)[:, None]
+        # random workspace around [0, 1]^d per tree, halved at each level along a random dim
+        s = self.rng.random((self.n_trees, n_feats))
+        width = 2 * np.maximum(s, 1 - s)
+        lo = np.zeros((self.n_trees, n_nodes, n_feats))
+        hi = np.zeros((self.n_trees, n_nodes, n_feats))
+        lo[:, 0], hi[:, 0] = s - width, s + width
+        for level in range(self.depth):
+            nodes = np.arange(2 ** level - 1, 2 ** (level + 1) - 1)
+            q = self.rng.integers(n_feats, size=(self.n_trees, len(nodes)))
+            mid = (lo[trees, nodes, q] + hi[trees, nodes, q]) / 2
+            self.dims[:, nodes], self.splits[:, nodes] = q, mid
+            for child in (2 * nodes + 1, 2 * nodes + 2):
+                lo[:, child], hi[:, child] = lo[:, nodes], hi[:, nodes]
+            hi[trees, 2 * nodes + 1, q] = mid
+            lo[trees, 2 * nodes + 2, q] = mid
+        self.ref = np.zeros((self.n_trees, n_nodes))
+        self.latest = np.zeros((self.n_trees, n_nodes))
+
+    def _paths(self, X):
+        """Node index at every level for every (reading, tree): shape [B, T, depth + 1]."""
+        Xn = (X - self.lo) / self.span
+        trees = np.arange(self.n_trees)
+        node = np.zeros((len(X), self.n_trees), dtype=np.int64)
+        paths = [node]
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.depth):
+            q = self.dims[trees, node]
+            node = 2 * node + 1 + (Xn[rows, q] > self.splits[trees, node])
+            paths.append(node)
+        return np.stack(paths, axis=2)
+
+    def _log_mass(self, paths):
+        """log2 of the HST mass score (higher = denser region = more normal)."""
+        trees = np.arange(self.n_trees)[None, :, None]
+        mass = self.ref[trees, paths]                          # [B, T, depth + 1]
+        small = mass < self.size_limit
+        # stop at the first node whose reference mass is below the limit (or at the leaf)
+        level = np.where(small.any(axis=2), small.argmax(axis=2), self.depth)
+        m = np.take_along_axis(mass, level[..., None], axis=2)[..., 0]
+        return np.log2((m * 2.0 ** level).sum(axis=1) + 1.0)
+
+    def _absorb(self, paths):
+        trees = np.broadcast_to(np.arange(self.n_trees)[None, :, None], paths.shape)
+        np.add.at(self.latest, (trees.ravel(), paths.ravel()), 1.0)
+
+    def score_batch(self, X):
+        X = np.asarray(X, dtype=float)
+        out = np.zeros(len(X))
+        i = 0
+        if self.dims is None:
+            # still collecting the first window: no reference yet
+            take = min(len(X), self.window_size - len(self.buffer))
+            self.buffer.extend(X[:take])
+            i = take
+            if len(self.buffer) == self.window_size:
+                first = np.asarray(self.buffer)
+                self.buffer = []
+                self._build(first)
+                paths = self._paths(first)
+                self._absorb(paths)
+                self.ref, self.latest = self.latest, self.ref
+                self.typical = float(np.mean(self._log_mass(paths)))
+        # Within a window the reference is fixed, so score whole blocks at once
+        while i < len(X):
+            take = min(len(X) - i, self.window_size - self.seen)
+            paths = self._paths(X[i:i + take])
+            log_mass = self._log_mass(paths)
+            out[i:i + take] = self.typical - log_mass
+            self._log_mass_sum += float(log_mass.sum())
+            self._absorb(paths)
+            self.seen += take
+            i += take
+            if self.seen == self.window_size:
+                self.ref, self.latest = self.latest, np.zeros_like(self.latest)
+                self.typical = self._log_mass_sum / self.window_size
+                self._log_mass_sum = 0.0
+                self.seen = 0
+        return out
+
+    def update(self, x):
+        return float(self.score_batch(np.asarray(x, dtype=float)[None, :])[0])
+
+
+# Readings a fresh detector is run over before a window, so that its state (and
+# with it its score distribution) matches a detector that has been running all along
+WARM_CONTEXT = 500
+
+# Part of the calibration key (calibration.py): bump it when a detector's scoring
+# changes, so thresholds learnt from the old scores are not applied to the new ones
+DETECTOR_VERSION = "1"
+
+STREAMING_MODELS = {
+    "ewma": RobustEWMA,
+    "mahalanobis": OnlineMahalanobis,
+    "hst": HalfSpaceTrees,
+}
+
+
+def make_detector(name, n_hint=None, **params):
+    """
+    New detector by model name. n_hint (readings it will see) shrinks the
+    half-space-trees window so short dashboard windows still get scores.
+    """
+    cls = STREAMING_MODELS[name]
+    if cls is HalfSpaceTrees and n_hint and "window_size" not in params:
+        params["window_size"] = int(max(8, min(250, n_hint // 4)))
+    return cls(**params)
+
+
+def flag_top(scores, contamination):
+    """Boolean mask of the top `contamination` share of scores (at least one)."""
+    if len(scores) == 0 or scores.max() == scores.min():
+        return np.zeros(len(scores), dtype=bool)
+    k = max(1, int(np.ceil(len(scores) * min(max(contamination, 0.001), 0.5))))
+    thresh = np.partition(scores, -k)[-k]
+    return scores >= thresh
+
+
+@traced("score_streaming")
+def score_streaming(name, X, contamination, threshold=None, context=None):
+    """
+    Runs a fresh detector over an oldest->newest window. Returns (scores, is_outlier):
+    scores above a calibrated threshold when one is given, else the top `contamination`.
+
+    A calibrated threshold is a quantile of a long-running detector's scores, so the
+    detector is then built with the default parameters and first run over `context`
+    (the readings just before the window, up to WARM_CONTEXT). Without one, a short
+    window shrinks the half-space-trees window instead, so it still gets scores.
+    """
+    with MODEL_SCORE_SECONDS.labels(name).time():
+        if threshold is not None:
+            detector = make_detector(name)
+            if context is not None and len(context):
+                detector.score_batch(context)
+            scores = detector.score_batch(X)
+        else:
+            scores = make_detector(name, n_hint=len(X)).score_batch(X)
+    if threshold is not None:
+        return scores, scores > threshold
+    return scores, flag_top(scores, contamination)
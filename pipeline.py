@@ -0,0 +1,246 @@
+import json
+import logging
+import os
+import queue
+import threading
+from time import monotonic
+
+import numpy as np
+
+import database
+from calibration import Calibrator, model_version
+from instrumentation import INGEST_DROPPED, INGEST_QUEUE_DEPTH, INGEST_SCORE_LAG
+from models.streaming import STREAMING_MODELS, make_detector
+
+
+# Score-at-ingest stage. Producers (the simulator, bulk ingest) insert readings and
+# submit the id range; a worker thread scores new readings with the configured
+# detector (settings.default_model / contamination_default), writes them to the
+# scores table and the model's score distribution (calibration.py), reports
+# flagged readings to the on_alert callbacks and then runs the after_batch hooks
+# (e.g. AlertEngine.poll from alerts.py). The queue is
+# bounded: when scoring falls behind, submit() blocks the producer for up to
+# put_timeout and then drops the batch. Nothing is lost either way, because the
+# worker always resumes from the last scored id, scoring whatever it missed in
+# batches of at most max_batch until it has caught up.
+
+log = logging.getLogger("pipeline")
+
+FALLBACK_MODEL = os.getenv("INGEST_FALLBACK_MODEL", "ewma")
+
+
+class StreamScorer:
+    """
+    Stateful streaming detector; flags scores above the calibrated threshold
+    (nothing until the model has one). score() returns (scores, is_anomaly,
+    model used), like WindowScorer.
+    """
+
+    def __init__(self, name, calibrator):
+        self.name = name
+        self.detector = make_detector(name)
+        self.calibrator = calibrator
+
+    def score(self, rows, contamination):
+        X = np.array([r[2:5] for r in rows], dtype=float)
+        scores = self.detector.score_batch(X)
+        thresh = self.calibrator.threshold(self.name, contamination)
+        if thresh is None:
+            return scores, np.zeros(len(scores), dtype=bool), self.name
+        return scores, scores > thresh, self.name
+
+
+class WindowScorer:
+    """
+    Fixed batch model: iforest_ref scores each batch with the stored reference
+    forest, the LSTM with the seq_len - 1 readings before the batch as context.
+    Flags like StreamScorer: above the calibrated threshold, nothing without one.
+    """
+
+    def __init__(self, name, calibrator):
+        self.name = name
+        self.calibrator = calibrator
+        self._lstm = None
+
+    def score(self, rows, contamination):
+        k = len(rows)
+        if self.name == "iforest_ref":
+            from models.store import load_forest, score_reference
+            forest = load_forest("iforest_ref")
+            if forest is None:
+                raise RuntimeError("no stored iforest_ref forest")
+            scores, _ = score_reference(forest, np.array([r[2:5] for r in rows], dtype=float))
+        else:
+            from models.lstm import load_artifacts, score_window
+            if self._lstm is None:
+                self._lstm = load_artifacts()
+            seq_len = self._lstm[2]
+            window = database.fetch_window_at_index(k + seq_len - 1, rows[-1][0], as_tuples=True)
+            X = np.array([r[2:5] for r in window], dtype=float)
+            scores = score_window(*self._lstm, X, contamination)[0][-k:]
+        scores = np.asarray(scores, dtype=float)
+        thresh = self.calibrator.threshold(self.name, contamination)
+        if thresh is None:
+            return scores, np.zeros(k, dtype=bool), self.name
+        return scores, scores > thresh, self.name
+
+
+def ingest_model(name):
+    """
+    The model the pipeline scores with when the dashboard's default is `name`.
+    Only fixed models with calibrated thresholds are scored at ingest: a window
+    iforest would be refitted for every batch (a 200-tree fit per reading at
+    1 Hz) and its scores would not be comparable from one batch to the next. So
+    iforest is scored with the reference forest, and anything without a stored
+    model (no reference forest, no trained LSTM) with INGEST_FALLBACK_MODEL.
+    """
+    if name == "iforest":
+        name = "iforest_ref"
+    return name if model_version(name) is not None else FALLBACK_MODEL
+
+
+def make_scorer(name, calibrator):
+    return StreamScorer(name, calibrator) if name in STREAMING_MODELS else WindowScorer(name, calibrator)
+
+
+def log_alert(event):
+    log.warning(json.dumps(event))
+
+
+class ScoringPipeline:
+    """Bounded queue + worker thread between ingestion and the scores table."""
+
+    def __init__(self, maxsize=256, put_timeout=5.0, max_batch=5000, on_alert=None, after_batch=None):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.put_timeout = put_timeout
+        self.max_batch = max_batch
+        self.on_alert = list(on_alert) if on_alert else [log_alert]
+        self.after_batch = list(after_batch) if after_batch else []
+        self.scorer = None
+        self.calibrator = Calibrator()
+        self.last_scored_id = None
+        self._settings = (0.0, None)
+        self._thread = None
+
+    # --- producer side ---
+
+    def submit(self, first_id, last_id):
+        """Queues readings first_id..last_id for scoring. False if the queue stayed full."""
+        try:
+            self.queue.put((first_id, last_id, monotonic()), timeout=self.put_timeout)
+        except queue.Full:
+            INGEST_DROPPED.inc()
+            log.warning(json.dumps({"ingest_queue_full": True, "dropped": [first_id, last_id]}))
+            return False
+        INGEST_QUEUE_DEPTH.inc()
+        return True
+
+    def ingest(self, rows):
+        """Inserts (timestamp, temperature, pressure, motor_speed) rows and queues them."""
+        span = database.insert_readings(rows)
+        if span:
+            self.submit(*span)
+        return span
+
+    def start(self):
+        if self._thread is None:
+            self.last_scored_id = self._load_last_scored_id()
+            self._thread = threading.Thread(target=self._run, name="ingest-scorer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=10.0):
+        """Scores what is already queued, then stops the worker."""
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+        self.calibrator.flush()
+
+    # --- worker side ---
+
+    def _load_last_scored_id(self):
+        with database.get_connection() as conn:
+            row = conn.execute("SELECT MAX(reading_id) FROM scores").fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def _current_settings(self):
+        # re-read settings at most every 2 s; the dashboard can change them at any time
+        checked_at, cached = self._settings
+        if cached is None or monotonic() - checked_at > 2.0:
+            with database.get_connection() as conn:
+                found = dict(conn.execute(
+                    "SELECT key, value FROM settings WHERE key IN ('default_model', 'contamination_default')"
+                ).fetchall())
+            c = min(max(float(found.get("contamination_default") or 0.05), 0.001), 0.5)
+            cached = ((found.get("default_model") or "iforest").lower(), c)
+            self._settings = (monotonic(), cached)
+        return cached
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            INGEST_QUEUE_DEPTH.dec()
+            if item is None:
+                return
+            first_id, last_id, submitted = item
+            # coalesce whatever else is already waiting into one batch
+            stop = False
+            while last_id - first_id + 1 < self.max_batch:
+                try:
+                    nxt = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                INGEST_QUEUE_DEPTH.dec()
+                if nxt is None:
+                    stop = True
+                    break
+                first_id, last_id = min(first_id, nxt[0]), max(last_id, nxt[1])
+            try:
+                self._process(first_id, last_id)
+                INGEST_SCORE_LAG.observe(monotonic() - submitted)
+            except Exception as e:
+                # keep the worker alive; the next batch retries from last_scored_id
+                log.error(json.dumps({"ingest_scoring_error": str(e), "range": [first_id, last_id]}))
+            if stop:
+                return
+
+    def _process(self, first_id, last_id):
+        if self.last_scored_id is not None:
+            if self.last_scored_id >= last_id:
+                return
+            # pick up anything skipped by a dropped batch or an outage
+            first_id = self.last_scored_id + 1
+        model, c = self._current_settings()
+        model = ingest_model(model)
+        if self.scorer is None or self.scorer.name != model:
+            self.scorer = make_scorer(model, self.calibrator)
+        # in max_batch chunks, oldest first, so a long backlog is never one enormous batch
+        while first_id <= last_id:
+            end_id = min(last_id, first_id + self.max_batch - 1)
+            self._score_batch(first_id, end_id, c)
+            first_id = end_id + 1
+
+    def _score_batch(self, first_id, last_id, c):
+        rows = database.fetch_range(first_id, last_id)
+        if not rows:
+            return
+        scores, is_out, used = self.scorer.score(rows, c)
+        database.insert_scores([(r[0], used, float(s), int(o)) for r, s, o in zip(rows, scores, is_out)])
+        # new scores keep the model's calibrated threshold current
+        self.calibrator.observe(used, scores)
+        self.last_scored_id = rows[-1][0]
+        for r, s, o in zip(rows, scores, is_out):
+            if o:
+                event = {"event": "anomaly", "reading_id": r[0], "timestamp": r[1],
+                         "model": used, "score": round(float(s), 6)}
+                for callback in self.on_alert:
+                    try:
+                        callback(event)
+                    except Exception as e:
+                        log.error(json.dumps({"alert_callback_error": str(e)}))
+        for hook in self.after_batch:
+            try:
+                hook()
+            except Exception as e:
+                log.error(json.dumps({"after_batch_error": str(e)}))
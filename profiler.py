@@ -0,0 +1,84 @@
+import os
+import sys
+import threading
+from collections import Counter
+from time import monotonic, sleep
+
+
+# On-demand wall-clock sampling profiler for the current worker process.
+# Nothing runs until profile() is called: it polls sys._current_frames() from the
+# calling thread for a bounded time and aggregates the stacks of every other
+# thread, so there is no overhead (no hooks, no tracing) while it is idle.
+
+_active = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is already running in this process."""
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def profile(seconds: float, interval: float = 0.005):
+    """
+    Samples all other threads every `interval` seconds for `seconds` seconds.
+    Returns (Counter of collapsed stacks 'thread;outer;...;inner' -> samples, elapsed seconds).
+    """
+    if not _active.acquire(blocking=False):
+        raise ProfilerBusy("a profile is already running in this worker")
+    try:
+        me = threading.get_ident()
+        names = {}
+        counts = Counter()
+        start = monotonic()
+        deadline = start + seconds
+        while monotonic() < deadline:
+            for tid, frame in sys._current_frames().items():
+                if tid == me:
+                    continue
+                if tid not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(tid, f"thread-{tid}"))
+                counts[";".join(reversed(stack))] += 1
+            sleep(interval)
+        return counts, monotonic() - start
+    finally:
+        _active.release()
+
+
+def to_collapsed(counts) -> str:
+    """Brendan Gregg's collapsed format ('a;b;c 12' per line), for flamegraph.pl or speedscope."""
+    return "\n".join(f"{stack} {n}" for stack, n in counts.most_common()) + "\n"
+
+
+def to_speedscope(counts, elapsed: float, interval: float, name: str = "worker"):
+    """speedscope 'sampled' profile (https://www.speedscope.app/file-format-schema.json)."""
+    frames, index = [], {}
+    samples, weights = [], []
+    for stack, n in counts.most_common():
+        ids = []
+        for label in stack.split(";"):
+            if label not in index:
+                index[label] = len(frames)
+                frames.append({"name": label})
+            ids.append(index[label])
+        samples.append(ids)
+        weights.append(n * interval)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled", "name": name, "unit": "seconds",
+            "startValue": 0, "endValue": round(elapsed, 6),
+            "samples": samples, "weights": weights,
+        }],
+        "name": name,
+        "exporter": "industrial-ai-dashboard",
+    }
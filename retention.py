@@ -60,6 +60,9 @@ def delete_before(conn, cutoff_iso: str):
     try:
         cur = conn.cursor()
         cur.execute("DELETE FROM readings WHERE timestamp < ?", (cutoff_iso,))
+        # ingest-time scores of the deleted readings go with them
+        if cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='scores'").fetchone():
+            cur.execute("DELETE FROM scores WHERE reading_id < (SELECT COALESCE(MIN(id), 9223372036854775807) FROM readings)")
         conn.commit()
         logging.info(f"Deleted raw readings before {cutoff_iso}.")
     except Exception as e:
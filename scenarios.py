@@ -0,0 +1,278 @@
+import argparse, json, pathlib, sqlite3, time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from seed import DB_PATH, ensure_db, synthetic_chunk, bulk_load_pragmas
+
+
+# Scenario-driven fault simulator with ground truth.
+#
+# The healthy signal is seed.py's sinusoidal baseline (without its random spikes);
+# on top of it faults start as a Poisson process per kind and play out over their
+# duration, possibly across chunk boundaries. Every fault is written to the
+# anomaly_labels table with its time range, so detector precision/recall can be
+# measured against the same readings the app serves.
+#
+#   python scenarios.py --hours 24 --seed 1                    # backfill one asset
+#   python scenarios.py --hours 2 --hz 10                      # high-rate (10 samples/s)
+#   python scenarios.py --hours 24 --assets 4                  # one DB per asset
+#   python scenarios.py --live --rate drift=6 --rate stuck=6   # realtime feed
+
+CHANNELS = ("temperature", "pressure", "motor_speed")
+
+# kind -> events per hour, duration range in seconds
+FAULTS = {
+    "spike":        {"rate": 2.0, "duration": (1, 1)},
+    "drift":        {"rate": 0.25, "duration": (300, 1200)},
+    "stuck":        {"rate": 0.5, "duration": (60, 600)},
+    "correlated":   {"rate": 0.5, "duration": (60, 300)},
+    "bearing_wear": {"rate": 0.02, "duration": (3600, 3 * 3600)},
+}
+
+# Per-channel scale of a fault of magnitude 1.0
+SCALE = {"temperature": 15.0, "pressure": 2.5, "motor_speed": 600.0}
+
+
+def ensure_labels(db_path: str):
+    """Creates the ground-truth table next to readings (idempotent)."""
+    ensure_db(db_path)
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS anomaly_labels(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                asset TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                channel TEXT,
+                start_ts TEXT NOT NULL,
+                end_ts TEXT NOT NULL,
+                params TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_labels_start ON anomaly_labels(start_ts)")
+        conn.commit()
+
+
+def label_mask(db_path: str, ids):
+    """Boolean array aligned with `ids`: True where the reading falls inside a labelled fault."""
+    ids = np.asarray(ids, dtype=np.int64)
+    if ids.size == 0:
+        return np.zeros(0, dtype=bool)
+    with sqlite3.connect(db_path) as conn:
+        has_table = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='anomaly_labels'").fetchone()
+        if not has_table:
+            return np.zeros(ids.size, dtype=bool)
+        labelled = conn.execute("""
+            SELECT DISTINCT r.id FROM readings r
+            JOIN anomaly_labels l ON r.timestamp BETWEEN l.start_ts AND l.end_ts
+            WHERE r.id BETWEEN ? AND ?
+        """, (int(ids.min()), int(ids.max()))).fetchall()
+    return np.isin(ids, np.fromiter((r[0] for r in labelled), dtype=np.int64))
+
+
+class Scenario:
+    """
+    Generates readings (and the faults active in them) one chunk at a time.
+    Sample i is taken at start + i/hz; `rates` overrides FAULTS[kind]["rate"].
+    """
+
+    def __init__(self, start: datetime, hz: float = 1.0, rates=None, asset: str = "asset-1",
+                 rng_seed=None, magnitude: float = 1.0, phase: int = 0):
+        self.start = np.datetime64(start.replace(microsecond=0, tzinfo=None), "ms")
+        self.hz = float(hz)
+        self.rates = {k: float((rates or {}).get(k, v["rate"])) for k, v in FAULTS.items()}
+        self.asset = asset
+        self.rng = np.random.default_rng(rng_seed)
+        self.magnitude = magnitude
+        self.phase = phase  # sample offset into the baseline so assets are not in lockstep
+        self.active = []
+
+    def timestamps(self, i0: int, n: int):
+        step_ms = 1000.0 / self.hz
+        ts = self.start + np.round(np.arange(i0, i0 + n) * step_ms).astype("timedelta64[ms]")
+        # Whole-second format at 1 Hz matches the rest of the app; sub-second rates
+        # use milliseconds throughout so the strings still sort chronologically
+        return np.char.add(np.datetime_as_string(ts, unit="s" if self.hz == 1.0 else "ms"), "Z")
+
+    def _schedule(self, i0: int, n: int, ts):
+        """Draws the faults that start inside this chunk; returns their label rows."""
+        labels = []
+        seconds = n / self.hz
+        for kind, rate in self.rates.items():
+            for _ in range(self.rng.poisson(rate * seconds / 3600.0)):
+                lo, hi = FAULTS[kind]["duration"]
+                start = i0 + int(self.rng.integers(0, n))
+                length = max(1, int(round(self.rng.uniform(lo, hi) * self.hz)))
+                fault = {"kind": kind, "start": start, "end": start + length,
+                         "magnitude": float(self.magnitude * self.rng.uniform(0.6, 1.4))}
+                if kind in ("spike", "drift", "stuck"):
+                    fault["channel"] = CHANNELS[int(self.rng.integers(0, 3))]
+                    fault["sign"] = -1.0 if (kind != "stuck" and self.rng.random() < 0.5) else 1.0
+                self.active.append(fault)
+                end_ts = self.timestamps(fault["end"] - 1, 1)[0]
+                start_ts = ts[start - i0]
+                params = {k: v for k, v in fault.items() if k in ("magnitude", "sign")}
+                params["samples"] = length
+                labels.append((self.asset, kind, fault.get("channel"), str(start_ts), str(end_ts),
+                               json.dumps(params)))
+        return labels
+
+    def _apply(self, fault, i0: int, values):
+        lo, hi = max(fault["start"], i0), min(fault["end"], i0 + len(values["temperature"]))
+        if lo >= hi:
+            return
+        sl = slice(lo - i0, hi - i0)
+        frac = (np.arange(lo, hi) - fault["start"]) / max(1, fault["end"] - fault["start"])
+        m = fault["magnitude"]
+        kind = fault["kind"]
+        if kind == "spike":
+            ch = fault["channel"]
+            values[ch][sl] += fault["sign"] * 1.5 * m * SCALE[ch]
+        elif kind == "drift":
+            ch = fault["channel"]
+            values[ch][sl] += fault["sign"] * m * SCALE[ch] * frac
+        elif kind == "stuck":
+            ch = fault["channel"]
+            if "value" not in fault:
+                fault["value"] = float(values[ch][sl][0])
+            values[ch][sl] = fault["value"]
+        elif kind == "correlated":
+            # e.g. cooling loss: temperature and pressure rise together while RPM sags
+            bump = np.sin(np.pi * frac)
+            values["temperature"][sl] += 0.8 * m * SCALE["temperature"] * bump
+            values["pressure"][sl] += 0.6 * m * SCALE["pressure"] * bump
+            values["motor_speed"][sl] -= 0.5 * m * SCALE["motor_speed"] * bump
+        elif kind == "bearing_wear":
+            # slow heat build-up with growing vibration on the shaft speed
+            growth = frac ** 2
+            values["temperature"][sl] += 0.7 * m * SCALE["temperature"] * growth
+            values["motor_speed"][sl] += self.rng.normal(0.0, 1.0, hi - lo) * 0.4 * m * SCALE["motor_speed"] * growth
+
+    def chunk(self, i0: int, n: int):
+        """Returns (reading rows, label rows) for samples i0..i0+n-1."""
+        ts = self.timestamps(i0, n)
+        temp, press, rpm = synthetic_chunk(i0 + self.phase, n, self.rng, hz=self.hz, spike_rate=0.0)
+        values = {"temperature": temp.astype(np.float64), "pressure": press.astype(np.float64),
+                  "motor_speed": rpm.astype(np.float64)}
+        labels = self._schedule(i0, n, ts)
+        # a stuck sensor reports its frozen value whatever else is going on, so apply it last
+        for fault in sorted(self.active, key=lambda f: f["kind"] == "stuck"):
+            self._apply(fault, i0, values)
+        self.active = [f for f in self.active if f["end"] > i0 + n]
+        rows = zip(ts.tolist(),
+                   np.round(values["temperature"], 2).tolist(),
+                   np.round(values["pressure"], 2).tolist(),
+                   np.maximum(values["motor_speed"], 0).astype(np.int64).tolist())
+        return rows, labels
+
+
+def _write(conn, rows, labels):
+    conn.executemany(
+        "INSERT INTO readings(timestamp, temperature, pressure, motor_speed) VALUES (?,?,?,?)", rows)
+    if labels:
+        conn.executemany(
+            "INSERT INTO anomaly_labels(asset, kind, channel, start_ts, end_ts, params) VALUES (?,?,?,?,?,?)",
+            labels)
+    conn.commit()
+
+
+def backfill(db_path: str, seconds: int, scenario: Scenario, chunk_seconds: int = 3600):
+    """Writes `seconds` of scenario data in bulk. Returns the number of faults labelled."""
+    ensure_labels(db_path)
+    total = int(seconds * scenario.hz)
+    step = max(1, int(chunk_seconds * scenario.hz))
+    n_labels = 0
+    with sqlite3.connect(db_path) as conn:
+        bulk_load_pragmas(conn)
+        for i0 in range(0, total, step):
+            rows, labels = scenario.chunk(i0, min(step, total - i0))
+            _write(conn, rows, labels)
+            n_labels += len(labels)
+    return n_labels
+
+
+def live(db_paths, scenarios):
+    """Streams one second of samples per asset every second until interrupted."""
+    for path in db_paths:
+        ensure_labels(path)
+    conns = [sqlite3.connect(path) for path in db_paths]
+    i0 = 0
+    try:
+        while True:
+            t_next = time.monotonic() + 1.0
+            for conn, sc in zip(conns, scenarios):
+                n = max(1, int(sc.hz))
+                rows, labels = sc.chunk(i0 * n, n)
+                _write(conn, rows, labels)
+                for label in labels:
+                    print(f"{label[0]}: {label[1]} {label[2] or ''} {label[3]} -> {label[4]}")
+            i0 += 1
+            time.sleep(max(0.0, t_next - time.monotonic()))
+    except KeyboardInterrupt:
+        print("Scenario simulator stopped.")
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def asset_db_paths(db_path: str, assets: int):
+    """One database per asset: the app serves one at a time (point DB_PATH at it)."""
+    if assets <= 1:
+        return [db_path]
+    p = pathlib.Path(db_path)
+    return [str(p.with_name(f"{p.stem}_asset{k}{p.suffix}")) for k in range(1, assets + 1)]
+
+
+def _parse_rates(items):
+    rates = {}
+    for item in items or []:
+        kind, _, value = item.partition("=")
+        if kind not in FAULTS:
+            raise SystemExit(f"unknown fault kind {kind!r}; choose from {', '.join(FAULTS)}")
+        rates[kind] = float(value)
+    return rates
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Simulate labelled fault scenarios into SQLite")
+    ap.add_argument("--minutes", type=int, default=None)
+    ap.add_argument("--hours", type=int, default=None)
+    ap.add_argument("--days", type=int, default=None)
+    ap.add_argument("--hz", type=float, default=1.0, help="Samples per second (high-rate mode > 1)")
+    ap.add_argument("--assets", type=int, default=1, help="Number of assets, one database each")
+    ap.add_argument("--rate", action="append", metavar="KIND=PER_HOUR",
+                    help=f"Fault rate override, kinds: {', '.join(FAULTS)} (repeatable)")
+    ap.add_argument("--magnitude", type=float, default=1.0, help="Scale every fault's severity")
+    ap.add_argument("--seed", type=int, default=None, help="RNG seed for reproducible scenarios")
+    ap.add_argument("--start", default=None, help="Fixed start timestamp (ISO, UTC)")
+    ap.add_argument("--live", action="store_true", help="Stream in real time instead of backfilling")
+    ap.add_argument("--db", default=DB_PATH)
+    args = ap.parse_args()
+
+    rates = _parse_rates(args.rate)
+    paths = asset_db_paths(args.db, args.assets)
+    seeds = np.random.SeedSequence(args.seed).spawn(len(paths))
+    if args.minutes is None and args.hours is None and args.days is None:
+        args.minutes = 60
+    seconds = (args.minutes or 0)*60 + (args.hours or 0)*3600 + (args.days or 0)*86400
+    if args.live:
+        start = datetime.utcnow()
+    elif args.start:
+        start = datetime.fromisoformat(args.start.rstrip("Z"))
+    else:
+        start = datetime.utcnow() - timedelta(seconds=seconds)
+    scenarios = [Scenario(start, hz=args.hz, rates=rates, asset=f"asset-{k}", rng_seed=s,
+                          magnitude=args.magnitude, phase=(k - 1) * 7919)
+                 for k, s in enumerate(seeds, start=1)]
+
+    if args.live:
+        print(f"Streaming {len(paths)} asset(s) at {args.hz:g} Hz. Press Ctrl+C to stop.")
+        live(paths, scenarios)
+    else:
+        for path, sc in zip(paths, scenarios):
+            pathlib.Path(path).parent.mkdir(parents=True, exist_ok=True)
+            t0 = time.perf_counter()
+            n = backfill(path, seconds, sc)
+            print(f"{sc.asset}: {int(seconds * sc.hz)} readings, {n} labelled faults -> {path} "
+                  f"({time.perf_counter() - t0:.1f}s)")
@@ -0,0 +1,150 @@
+# scoring_pool.py
+import multiprocessing, os, threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from time import perf_counter, time
+
+from instrumentation import SCORING_QUEUE_DEPTH
+from models.isolation import fit_iforest, score_iforest
+from models.store import load_forest, score_reference
+from tracing import add_span
+
+
+# Scoring off the request threads. A per-window IsolationForest fit or an LSTM
+# predict is CPU-bound; run on the web worker's own threads they fight over the
+# GIL and, with n_jobs=-1, every fit fans out over every core at once. Instead
+# each web worker sends those jobs to a small process pool whose processes each
+# use one core (joblib, BLAS and TensorFlow limited to one thread), so the host
+# never runs more than SCORING_CPUS scoring threads however busy it gets.
+#
+# The pool has a queue limit: when SCORING_MAX_QUEUE jobs are already waiting or
+# running, or a job takes longer than SCORING_TIMEOUT_S, run() raises ScoringBusy
+# at once and the caller serves the last scores it has (see window_scores in app.py)
+# instead of queueing behind the backlog. SCORING_WORKERS=0 scores on the request
+# thread, as before. Cheap models (the streaming detectors) always run inline.
+
+POOL_MODELS = {"iforest", "iforest_ref", "lstm"}
+
+
+def _default_workers():
+    # the CPU budget is for the host; every gunicorn worker gets its own pool
+    cpus = int(os.getenv("SCORING_CPUS", str(os.cpu_count() or 1)))
+    return max(1, cpus // max(1, int(os.getenv("GUNICORN_WORKERS", "1"))))
+
+
+WORKERS = int(os.getenv("SCORING_WORKERS", str(_default_workers())))
+MAX_QUEUE = int(os.getenv("SCORING_MAX_QUEUE", str(2 * max(WORKERS, 1))))
+TIMEOUT_S = float(os.getenv("SCORING_TIMEOUT_S", "10"))
+
+_lstm = None  # (model, scaler, seq_len), loaded once per process
+
+
+class ScoringBusy(Exception):
+    """The scoring pool is saturated: its queue is full or the job timed out."""
+
+
+def _init_worker():
+    from threadpoolctl import threadpool_limits
+    # read by TensorFlow when it is first imported in this process
+    os.environ.update(OMP_NUM_THREADS="1", TF_NUM_INTRAOP_THREADS="1", TF_NUM_INTEROP_THREADS="1")
+    threadpool_limits(1)
+
+
+def score_job(X, model, contamination, threshold=None, store_root=None, n_jobs=1):
+    """(scores, is_outlier, model used) for one window; runs in a pool process (or inline)."""
+    global _lstm
+    if model == "lstm":
+        # TensorFlow is imported here, never in the forkserver the pool forks from
+        from models.lstm import load_artifacts, score_window
+        if _lstm is None:
+            _lstm = load_artifacts()
+        mdl, scaler, seq_len = _lstm
+        scores, is_out = score_window(mdl, scaler, seq_len, X, contamination, threshold=threshold)
+        return scores, is_out, "lstm"
+    if model == "iforest_ref":
+        forest = load_forest("iforest_ref", root=store_root)
+        if forest is not None:
+            scores, is_out = score_reference(forest, X, threshold=threshold)
+            return scores, is_out, "iforest_ref"
+    clf = fit_iforest(X, contamination=contamination, random_state=42, n_jobs=n_jobs)
+    scores, is_out = score_iforest(clf, X)
+    return scores, is_out, "iforest"
+
+
+def _pooled_job(*args):
+    # score_job in a pool process, plus when it started and how long it took: spans
+    # recorded here never reach the request's g.spans, so run() records them
+    started, t0 = time(), perf_counter()
+    result = score_job(*args)
+    return result, started, (perf_counter() - t0) * 1000.0
+
+
+class ScoringPool:
+    """Bounded process pool for score_job, created lazily in the process that uses it."""
+
+    def __init__(self, workers=WORKERS, max_queue=MAX_QUEUE, timeout_s=TIMEOUT_S):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout_s = timeout_s
+        self.pending = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # a pool made before a fork (e.g. in a preloading gunicorn master) is not
+        # usable in the child, so each process starts its own on first use
+        if self._pid != os.getpid():
+            self._executor, self._pid, self.pending = None, os.getpid(), 0
+        if self._executor is None:
+            if "forkserver" in multiprocessing.get_all_start_methods():
+                ctx = multiprocessing.get_context("forkserver")
+                # processes fork from a server that has numpy, sklearn and this module loaded
+                ctx.set_forkserver_preload(["scoring_pool"])
+            else:
+                ctx = multiprocessing.get_context("spawn")
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=ctx, initializer=_init_worker)
+        return self._executor
+
+    def _reset(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _done(self, _future):
+        with self._lock:
+            self.pending -= 1
+        SCORING_QUEUE_DEPTH.dec()
+
+    def run(self, X, model, contamination, threshold=None, store_root=None):
+        with self._lock:
+            if self.pending >= self.max_queue:
+                raise ScoringBusy(f"{self.pending} scoring jobs queued")
+            submitted = time()
+            try:
+                future = self._pool().submit(_pooled_job, X, model, contamination, threshold, store_root)
+            except (BrokenProcessPool, RuntimeError):
+                self._executor = None
+                raise ScoringBusy("scoring pool restarting") from None
+            self.pending += 1
+        SCORING_QUEUE_DEPTH.inc()
+        future.add_done_callback(self._done)
+        try:
+            result, started, ms = future.result(timeout=self.timeout_s)
+        except FutureTimeout:
+            # the job keeps its slot until it finishes, so a slow model sheds load
+            raise ScoringBusy(f"{model} scoring took over {self.timeout_s}s") from None
+        except BrokenProcessPool:
+            # a pool process died (e.g. killed for memory); start a new pool next time
+            self._reset()
+            raise ScoringBusy("scoring pool process died") from None
+        # queued behind other jobs (and pickling X), then scoring in the pool process
+        add_span("pool.wait", submitted, max(0.0, started - submitted) * 1000.0)
+        add_span("pool.score", started, ms, model=result[2])
+        return result
+
+    def shutdown(self):
+        if self._executor is not None and self._pid == os.getpid():
+            self._executor.shutdown(wait=False, cancel_futures=True)
+        self._executor = None
@@ -0,0 +1,200 @@
+"""
+Benchmarks for the ingest, read, scoring and export hot paths.
+
+    python scripts/benchmark.py --sizes 10k,1m --out bench.json
+    python scripts/benchmark.py --sizes 10k --compare bench.json --threshold 0.2
+
+Databases are seeded once per size with seed.py and cached in --workdir, so
+repeated runs only pay for the measurements. Results are written as JSON; with
+--compare each median is checked against a previous run and the script exits
+non-zero when any path got slower than the threshold allows.
+"""
+import argparse, json, os, platform, shutil, sqlite3, statistics, subprocess, sys, tempfile, time
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text[:-1] if text[-1] in "km" else text) * mult)
+
+
+def measure(fn, repeat: int, warmup: int = 1):
+    """Runs fn repeat times (after warmup runs) and summarises the wall times in ms."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t0 = perf_counter()
+        fn()
+        times.append((perf_counter() - t0) * 1000.0)
+    times.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(times[0], 3),
+        "median_ms": round(statistics.median(times), 3),
+        "p95_ms": round(times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))], 3),
+        "max_ms": round(times[-1], 3),
+    }
+
+
+def row_count(db_path: str) -> int:
+    try:
+        with sqlite3.connect(db_path) as conn:
+            return int(conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0] or 0)
+    except sqlite3.Error:
+        return 0
+
+
+def ensure_seeded(workdir: str, rows: int) -> str:
+    """Seeds (or reuses) a database with exactly `rows` one-second readings."""
+    import seed
+    path = os.path.join(workdir, f"bench_{rows}.db")
+    if row_count(path) != rows:
+        if os.path.exists(path):
+            os.remove(path)
+        t0 = perf_counter()
+        seed.seed(path, rows, start_from_now=True)
+        print(f"  seeded {rows} rows in {perf_counter() - t0:.1f}s -> {path}", flush=True)
+    return path
+
+
+def bench_size(db_path: str, rows: int, repeat: int):
+    import app as app_module
+    import database
+    from app import detect_scores
+    from seed import synthetic_point
+
+    # Point both the database helpers and app.py's imported copy at this size's DB
+    database.DB_PATH = db_path
+    app_module.DB_PATH = db_path
+    database.init_db()
+    flask_app = app_module.app
+    client = flask_app.test_client()
+    results = {}
+
+    # --- ingest (on a scratch copy so the seeded DB keeps its size) ---
+    scratch = db_path + ".scratch"
+    shutil.copyfile(db_path, scratch)
+    database.DB_PATH = scratch
+    i = [0]
+
+    def one_insert():
+        i[0] += 1
+        temp, press, rpm = synthetic_point(i[0])
+        database.insert_reading("2030-01-01T00:00:00Z", temp, press, rpm)
+    results["insert_reading"] = measure(one_insert, repeat * 10)
+
+    batch = [("2030-01-01T00:00:00Z", *synthetic_point(k)) for k in range(10_000)]
+    results["bulk_ingest_10k"] = measure(lambda: database.insert_readings(batch), repeat)
+    database.DB_PATH = db_path
+    os.remove(scratch)
+
+    # --- reads ---
+    results["fetch_last_n_2000"] = measure(lambda: database.fetch_last_n(2000), repeat)
+    results["fetch_last_n_tuples_2000"] = measure(lambda: database.fetch_last_n_tuples(2000), repeat)
+    for frac in (0.0, 0.5, 1.0):
+        end = max(2000, int(rows * frac))
+        results[f"fetch_window_at_index_2000@{int(frac * 100)}%"] = measure(
+            lambda end=end: database.fetch_window_at_index(2000, end), repeat)
+
+    # --- scoring ---
+    import numpy as np
+    window = database.fetch_last_n_raw(2000)
+    X = np.array([[r["temperature"], r["pressure"], r["motor_speed"]] for r in window], dtype=float)
+    with flask_app.app_context():
+        for model in ("iforest", "lstm"):
+            used = detect_scores(X, model=model, contamination=0.05)[2]
+            stats = measure(lambda model=model: detect_scores(X, model=model, contamination=0.05), repeat)
+            stats["model_used"] = used
+            results[f"detect_scores_{model}_2000"] = stats
+
+    # --- export / report through the app ---
+    # the replay cursor lives in <db>-state and outlives a run; start from live mode
+    client.post("/mode", json={"mode": "live"})
+    results["export_n2000"] = measure(lambda: client.get("/export?n=2000").get_data(), repeat)
+    results["report_n2000"] = measure(lambda: client.get("/report?n=2000").get_data(), repeat)
+    return results
+
+
+def compare(current, baseline, threshold: float):
+    """Returns [(size, path, baseline_ms, current_ms, ratio)] for medians slower than 1+threshold."""
+    regressions = []
+    for size, paths in current["results"].items():
+        for name, stats in paths.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base or not base.get("median_ms"):
+                continue
+            ratio = stats["median_ms"] / base["median_ms"]
+            if ratio > 1.0 + threshold:
+                regressions.append((size, name, base["median_ms"], stats["median_ms"], round(ratio, 3)))
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark ingest/read/scoring/export hot paths")
+    ap.add_argument("--sizes", default="10k", help="Comma-separated DB sizes, e.g. 10k,1m,10m")
+    ap.add_argument("--repeat", type=int, default=5, help="Timed runs per measurement")
+    ap.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "dashboard-bench"),
+                    help="Where seeded databases are cached between runs")
+    ap.add_argument("--out", default="bench.json", help="Write results JSON here")
+    ap.add_argument("--compare", help="Previous results JSON to check for regressions")
+    ap.add_argument("--threshold", type=float, default=0.2,
+                    help="Allowed slowdown of a median before it counts as a regression (0.2 = 20%%)")
+    args = ap.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    # app.py binds DB_PATH (and initialises the schema) at import time, so pick the
+    # first benchmark DB before anything imports it; never touch the real database
+    os.chdir(ROOT)
+    first = ensure_seeded(args.workdir, sizes[0])
+    os.environ["DB_PATH"] = first
+
+    out = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "git_rev": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for rows in sizes:
+        label = next(s.strip() for s in args.sizes.split(",") if parse_size(s) == rows)
+        print(f"[{label}] {rows} rows", flush=True)
+        db_path = ensure_seeded(args.workdir, rows)
+        out["results"][label] = bench_size(db_path, rows, args.repeat)
+        for name, stats in out["results"][label].items():
+            print(f"  {name:<36} median {stats['median_ms']:>10.3f} ms   p95 {stats['p95_ms']:>10.3f} ms")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2)
+    print(f"Wrote {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(out, baseline, args.threshold)
+        for size, name, base_ms, cur_ms, ratio in regressions:
+            print(f"REGRESSION [{size}] {name}: {base_ms:.3f} ms -> {cur_ms:.3f} ms (x{ratio})")
+        if regressions:
+            sys.exit(1)
+        print("No regressions beyond threshold.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Seeds a model's calibrated anomaly threshold from stored history.
+
+    python scripts/calibrate.py --model ewma
+    python scripts/calibrate.py --model lstm --db data/sensor_data.db --last-days 14
+
+Readings are read from SQLite in id-ordered chunks and scored by the model (one
+pass, nothing else held in memory), and the resulting score distribution replaces
+the stored one for the model's current version (see calibration.py). Run it after
+training a new LSTM; the ingest pipeline keeps the distribution current afterwards.
+"""
+import argparse, os, sqlite3, sys
+from time import perf_counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def iter_chunks(db_path: str, first_id: int, chunk: int):
+    """[n, 3] feature chunks of readings with id >= first_id, oldest->newest (id range seeks)."""
+    with sqlite3.connect(db_path) as conn:
+        last = first_id - 1
+        while True:
+            rows = conn.execute(
+                "SELECT id, temperature, pressure, motor_speed FROM readings WHERE id > ? ORDER BY id LIMIT ?",
+                (last, chunk)).fetchall()
+            if not rows:
+                return
+            arr = np.asarray(rows, dtype=np.float64)
+            last = int(arr[-1, 0])
+            yield arr[:, 1:]
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--model", required=True, help="lstm, ewma, mahalanobis or hst")
+    ap.add_argument("--db", default=None, help="database path (default: DB_PATH)")
+    ap.add_argument("--last-days", type=float, default=0, help="only the most recent days of readings (0 = all)")
+    ap.add_argument("--chunk", type=int, default=50_000)
+    args = ap.parse_args()
+
+    import database
+    if args.db:
+        database.DB_PATH = args.db
+    database.init_db()
+    from calibration import QUANTILES, Calibrator, model_version, reference_digest
+
+    version = model_version(args.model)
+    if version is None:
+        sys.exit(f"{args.model} has no calibrated thresholds (or no trained artifacts)")
+
+    first_id = database.first_id_within(args.last_days * 86400) if args.last_days else 1
+
+    t0 = perf_counter()
+    digest = reference_digest(args.model, iter_chunks(database.DB_PATH, first_id, args.chunk))
+    elapsed = perf_counter() - t0
+    if digest.n == 0:
+        sys.exit("no readings to calibrate on")
+    Calibrator().replace(args.model, digest, version=version)
+
+    print(f"{args.model} (version {version}): {digest.n} scores in {elapsed:.1f}s "
+          f"({digest.n / max(elapsed, 1e-9):,.0f}/s)")
+    for q in QUANTILES:
+        print(f"  c={1 - q:<6.3f} threshold={digest.quantile(q):.6g}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Offline detector evaluation: accuracy vs. cost over a labelled dataset.
+
+    python scripts/evaluate.py --generate-hours 24 --seed 1
+    python scripts/evaluate.py --db data/labelled.db --models iforest,lstm \
+        --n 300,1000 --contamination 0.02,0.05,0.1 --seq-len 12,24 --target-f1 0.6
+
+The dataset is a database written by scenarios.py (readings + anomaly_labels).
+Each configuration scores the data the way the dashboard does, one trailing
+window of n readings at a time (non-overlapping windows, at most --max-windows
+of them spread over the test span), and is compared point-by-point with the
+labels. LSTM autoencoders are trained once per seq_len on the first
+--train-frac of the readings. The streaming detectors are calibrated on that
+head, as scripts/calibrate.py would (threshold = the (1 - c) quantile of a
+long-running detector's scores), and every window is scored by a detector
+warmed on the WARM_CONTEXT readings before it, as the dashboard does. iforest
+only sees its window.
+
+Configurations run in a process pool (spawned workers, so TensorFlow never
+sees a forked parent). The table reports precision, recall, F1, mean fit and
+score time per window, one-off training time and peak traced memory for one
+window; with --target-f1 / --target-recall it also names the cheapest
+configuration that meets the target.
+"""
+import argparse, itertools, json, os, sys, tempfile, time, tracemalloc
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+from time import perf_counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_DATA = {}  # per-worker cache: db path -> (X, labels)
+
+
+def load_dataset(db_path: str):
+    """(X [N,3] oldest->newest, labels [N] bool) for every reading in the database."""
+    if db_path not in _DATA:
+        import sqlite3
+        from scenarios import label_mask
+        with sqlite3.connect(db_path) as conn:
+            rows = conn.execute(
+                "SELECT id, temperature, pressure, motor_speed FROM readings ORDER BY id").fetchall()
+        arr = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+        _DATA[db_path] = (arr[:, 1:], label_mask(db_path, arr[:, 0].astype(np.int64)))
+    return _DATA[db_path]
+
+
+def windows(start: int, stop: int, n: int, max_windows: int):
+    """Non-overlapping [lo, hi) windows of n readings, evenly thinned to max_windows."""
+    ends = np.arange(start + n, stop + 1, n)
+    if max_windows and len(ends) > max_windows:
+        ends = ends[np.linspace(0, len(ends) - 1, max_windows).round().astype(int)]
+    return [(int(e) - n, int(e)) for e in ends]
+
+
+def prf(tp: int, fp: int, fn: int):
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return round(precision, 4), round(recall, 4), round(f1, 4)
+
+
+def train_lstm(db_path: str, seq_len: int, train_frac: float, epochs: int, out_dir: str):
+    """Trains one autoencoder per seq_len on the head of the dataset (labelled faults removed)."""
+    from models.lstm import train_and_save
+    X, labels = load_dataset(db_path)
+    split = int(len(X) * train_frac)
+    # Drop labelled points so the autoencoder learns normal behaviour only
+    X_train = X[:split][~labels[:split]]
+    art_dir = os.path.join(out_dir, f"lstm_L{seq_len}")
+    t0 = perf_counter()
+    train_and_save(X_train, seq_len=seq_len, epochs=epochs, batch_size=64, artifacts_dir=art_dir)
+    return seq_len, art_dir, perf_counter() - t0
+
+
+def evaluate_config(db_path: str, config: dict, train_frac: float, max_windows: int):
+    """Scores every window for one configuration; returns the metrics row."""
+    X, labels = load_dataset(db_path)
+    model, n, c = config["model"], config["n"], config["contamination"]
+    from models.streaming import STREAMING_MODELS, WARM_CONTEXT, score_streaming
+    start = int(len(X) * train_frac) if model == "lstm" or model in STREAMING_MODELS else 0
+    spans = windows(start, len(X), n, max_windows)
+    if not spans:
+        raise ValueError(f"not enough readings for windows of {n}")
+
+    threshold = None
+    if model == "lstm":
+        from models.lstm import load_artifacts, score_window
+        mdl, scaler, seq_len = load_artifacts(config["artifacts_dir"])
+    elif model in STREAMING_MODELS:
+        if start:
+            from calibration import reference_digest
+            threshold = reference_digest(model, [X[:start]]).quantile(1.0 - c)
+    else:
+        from models.isolation import fit_iforest, score_iforest
+
+    def run(lo, hi, timings):
+        Xw = X[lo:hi]
+        if model == "lstm":
+            t0 = perf_counter()
+            _, pred = score_window(mdl, scaler, seq_len, Xw, c)
+            timings[1] += perf_counter() - t0
+            return pred
+        if model in STREAMING_MODELS:
+            # online detectors learn as they score: the warm-up counts as score time too
+            t0 = perf_counter()
+            _, pred = score_streaming(model, Xw, c, threshold=threshold,
+                                      context=X[max(0, lo - WARM_CONTEXT):lo])
+            timings[1] += perf_counter() - t0
+            return pred
+        t0 = perf_counter()
+        # one worker per process: the pool already provides the parallelism
+        clf = fit_iforest(Xw, contamination=c, random_state=42, n_jobs=1)
+        t1 = perf_counter()
+        _, pred = score_iforest(clf, Xw)
+        timings[0] += t1 - t0
+        timings[1] += perf_counter() - t1
+        return pred
+
+    # Memory on one traced window only: tracemalloc slows everything down, so the
+    # timings below come from untraced runs
+    tracemalloc.start()
+    run(*spans[0], [0.0, 0.0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tp = fp = fn = 0
+    timings = [0.0, 0.0]  # fit, score seconds
+    for lo, hi in spans:
+        pred, yw = run(lo, hi, timings), labels[lo:hi]
+        tp += int(np.sum(pred & yw))
+        fp += int(np.sum(pred & ~yw))
+        fn += int(np.sum(~pred & yw))
+    fit_s, score_s = timings
+
+    precision, recall, f1 = prf(tp, fp, fn)
+    k = max(1, len(spans))
+    return {
+        **{key: config[key] for key in ("model", "n", "contamination", "seq_len")},
+        "windows": len(spans),
+        "precision": precision, "recall": recall, "f1": f1,
+        "fit_ms": round(fit_s * 1000.0 / k, 2),
+        "score_ms": round(score_s * 1000.0 / k, 2),
+        "train_s": config.get("train_s"),
+        "mem_peak_mb": round(peak / 2**20, 2),
+    }
+
+
+def cheapest(results, target_f1=None, target_recall=None):
+    """Lowest per-window cost (fit + score) among results meeting the targets."""
+    ok = [r for r in results if "error" not in r
+          and (target_f1 is None or r["f1"] >= target_f1)
+          and (target_recall is None or r["recall"] >= target_recall)]
+    return min(ok, key=lambda r: (r["fit_ms"] + r["score_ms"], -r["f1"])) if ok else None
+
+
+def print_table(results):
+    header = (f"{'model':<8}{'n':>6}{'c':>7}{'L':>4}{'win':>5}{'prec':>7}{'recall':>8}{'f1':>7}"
+              f"{'fit ms':>9}{'score ms':>10}{'train s':>9}{'mem MB':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        L = r["seq_len"] if r["seq_len"] is not None else "-"
+        if "error" in r:
+            print(f"{r['model']:<8}{r['n']:>6}{r['contamination']:>7.3f}{L:>4}  error: {r['error']}")
+            continue
+        train = f"{r['train_s']:.1f}" if r["train_s"] is not None else "-"
+        print(f"{r['model']:<8}{r['n']:>6}{r['contamination']:>7.3f}{L:>4}{r['windows']:>5}"
+              f"{r['precision']:>7.3f}{r['recall']:>8.3f}{r['f1']:>7.3f}{r['fit_ms']:>9.1f}"
+              f"{r['score_ms']:>10.1f}{train:>9}{r['mem_peak_mb']:>8.1f}")
+
+
+def _ints(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def _floats(text):
+    return [float(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Evaluate detectors against labelled scenario data")
+    ap.add_argument("--db", help="Labelled database from scenarios.py")
+    ap.add_argument("--generate-hours", type=int, default=None,
+                    help="Generate a fresh labelled dataset of this length instead of --db")
+    ap.add_argument("--seed", type=int, default=1, help="Scenario seed used with --generate-hours")
+    ap.add_argument("--models", default="iforest,lstm",
+                    help="Comma-separated: iforest, lstm, ewma, mahalanobis, hst")
+    ap.add_argument("--n", default="300,1000", help="Window sizes (readings)")
+    ap.add_argument("--contamination", default="0.02,0.05,0.1")
+    ap.add_argument("--seq-len", default="24", help="LSTM sequence lengths")
+    ap.add_argument("--train-frac", type=float, default=0.3, help="Head of the data used to train LSTMs and calibrate the streaming detectors")
+    ap.add_argument("--epochs", type=int, default=5, help="LSTM training epochs")
+    ap.add_argument("--max-windows", type=int, default=50, help="Windows scored per configuration")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--target-f1", type=float, default=None)
+    ap.add_argument("--target-recall", type=float, default=None)
+    ap.add_argument("--out", help="Write all results as JSON")
+    args = ap.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="dashboard-eval-")
+    db_path = args.db
+    if args.generate_hours:
+        from datetime import datetime, timedelta
+        import scenarios
+        db_path = os.path.join(workdir, "labelled.db")
+        seconds = args.generate_hours * 3600
+        sc = scenarios.Scenario(datetime.utcnow() - timedelta(seconds=seconds), rng_seed=args.seed)
+        n_labels = scenarios.backfill(db_path, seconds, sc)
+        print(f"Generated {seconds} readings with {n_labels} labelled faults -> {db_path}", flush=True)
+    if not db_path or not os.path.exists(db_path):
+        ap.error("pass --db with a scenarios.py database or --generate-hours")
+
+    models = [m.strip().lower() for m in args.models.split(",") if m.strip()]
+    seq_lens = _ints(args.seq_len)
+    ctx = get_context("spawn")
+    results = []
+    t_start = perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers), mp_context=ctx) as pool:
+        # Stage 1: one LSTM per seq_len (training is the expensive part, so it is shared)
+        trained = {}
+        if "lstm" in models:
+            futures = [pool.submit(train_lstm, db_path, L, args.train_frac, args.epochs, workdir)
+                       for L in seq_lens]
+            for f, L in zip(futures, seq_lens):
+                try:
+                    _, art_dir, train_s = f.result()
+                    trained[L] = {"artifacts_dir": art_dir, "train_s": round(train_s, 2)}
+                except Exception as e:
+                    trained[L] = {"error": f"training failed: {e}"}
+
+        # Stage 2: the sweep
+        configs = []
+        for model, n, c in itertools.product(models, _ints(args.n), _floats(args.contamination)):
+            for L in (seq_lens if model == "lstm" else [None]):
+                configs.append({"model": model, "n": n, "contamination": c, "seq_len": L,
+                                **(trained.get(L, {}) if model == "lstm" else {})})
+        futures = {}
+        for config in configs:
+            if "error" in config:
+                results.append({**config, "train_s": None})
+                continue
+            futures[pool.submit(evaluate_config, db_path, config, args.train_frac, args.max_windows)] = config
+        for f in as_completed(futures):
+            config = futures[f]
+            try:
+                results.append(f.result())
+            except Exception as e:
+                results.append({key: config[key] for key in ("model", "n", "contamination", "seq_len")}
+                               | {"error": str(e).splitlines()[0] if str(e) else type(e).__name__})
+
+    results.sort(key=lambda r: (r["model"], r["n"], r["contamination"], r["seq_len"] or 0))
+    print_table(results)
+    print(f"{len(results)} configurations in {perf_counter() - t_start:.1f}s")
+
+    best = cheapest(results, args.target_f1, args.target_recall)
+    if args.target_f1 is not None or args.target_recall is not None:
+        if best:
+            print(f"Cheapest meeting target: model={best['model']} n={best['n']} "
+                  f"c={best['contamination']} seq_len={best['seq_len']} "
+                  f"(f1={best['f1']}, {best['fit_ms'] + best['score_ms']:.1f} ms/window)")
+        else:
+            print("No configuration meets the target.")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"db": db_path, "generated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                       "results": results, "cheapest": best}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""
+In-process load generator: N virtual dashboards against the Flask app.
+
+    python scripts/loadtest.py --clients 50 --duration 60
+
+Each virtual client behaves like static/js/app.js: it loads /config once, then
+every tick fetches /history and /scores_for_window together (binary layout,
+max_points, revalidating with If-None-Match like the browser cache does) and
+sleeps poll_ms (from /config, or --poll-ms) after the tick completes. Every
+--anomalies-every ticks it also refreshes /anomalies, and every --config-every
+ticks it reloads /config. Like a browser tab, each client sends its own
+X-Replay-Session id, so each one replays with its own cursor.
+
+The app runs in this process against a freshly seeded temporary database (a
+background thread keeps inserting one reading per second, like the simulator),
+so no server or external service is needed. Reports throughput, latency
+percentiles, 304 share and error rate per endpoint.
+"""
+import argparse, json, os, random, sys, tempfile, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from time import perf_counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(sorted_vals, q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+class Stats:
+    """Thread-safe per-endpoint latency/status collector."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def add(self, endpoint: str, ms: float, status: int):
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append((ms, status))
+
+    def summary(self, elapsed: float):
+        out = {}
+        all_samples = []
+        for endpoint, samples in sorted(self.samples.items()):
+            out[endpoint] = self._summarise(samples, elapsed)
+            all_samples.extend(samples)
+        out["ALL"] = self._summarise(all_samples, elapsed)
+        return out
+
+    @staticmethod
+    def _summarise(samples, elapsed):
+        lat = sorted(ms for ms, _ in samples)
+        errors = sum(1 for _, status in samples if status == 0 or status >= 500)
+        not_modified = sum(1 for _, status in samples if status == 304)
+        n = len(samples)
+        return {
+            "requests": n,
+            "rps": round(n / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(lat, 0.50), 2),
+            "p90_ms": round(percentile(lat, 0.90), 2),
+            "p99_ms": round(percentile(lat, 0.99), 2),
+            "max_ms": round(lat[-1], 2) if lat else 0.0,
+            "not_modified_pct": round(100.0 * not_modified / n, 1) if n else 0.0,
+            "error_pct": round(100.0 * errors / n, 2) if n else 0.0,
+        }
+
+
+def virtual_client(flask_app, args, stats, pool, stop: threading.Event, seed: int):
+    rng = random.Random(seed)
+    client = flask_app.test_client()
+    etags = {}
+    # app.js gives every tab its own replay cursor (X-Replay-Session); so does each client
+    session = "%032x" % rng.getrandbits(128)
+
+    def get(endpoint, url):
+        headers = {"Accept-Encoding": "gzip", "X-Replay-Session": session}
+        if url in etags:
+            headers["If-None-Match"] = etags[url]
+        t0 = perf_counter()
+        try:
+            resp = client.get(url, headers=headers)
+            resp.get_data()
+            status = resp.status_code
+            if resp.headers.get("ETag"):
+                etags[url] = resp.headers["ETag"]
+            body = resp.get_json(silent=True) if endpoint == "config" else None
+        except Exception:
+            status, body = 0, None
+        stats.add(endpoint, (perf_counter() - t0) * 1000.0, status)
+        return body
+
+    cfg = get("config", "/config") or {}
+    view_seconds = int(cfg.get("view_window_seconds") or args.view_seconds)
+    score_window = int(cfg.get("score_window_default") or args.score_window)
+    model = (cfg.get("default_model") or "iforest").lower()
+    contamination = float(cfg.get("contamination_default") or 0.05)
+    poll_s = (args.poll_ms or int(cfg.get("poll_ms") or 1000)) / 1000.0
+
+    # Stagger start like dashboards opened at different moments
+    stop.wait(rng.uniform(0, poll_s))
+    tick = 0
+    while not stop.is_set():
+        tick += 1
+        hist = f"/history?n={view_seconds}&max_points={args.max_points}&layout=binary"
+        scores = (f"/scores_for_window?n={score_window}&c={contamination:.3f}&model={model}"
+                  f"&max_points={args.max_points}&layout=binary")
+        # app.js issues both requests concurrently (Promise.all)
+        futures = [pool.submit(get, "history", hist), pool.submit(get, "scores_for_window", scores)]
+        for f in futures:
+            f.result()
+        if args.anomalies_every and tick % args.anomalies_every == 0:
+            get("anomalies", f"/anomalies?n={score_window}&c={contamination:.3f}&model={model}")
+        if args.config_every and tick % args.config_every == 0:
+            get("config", "/config")
+        stop.wait(poll_s)
+
+
+def live_ingest(stop: threading.Event):
+    import database
+    from seed import synthetic_point
+    t = 0
+    while not stop.wait(1.0):
+        t += 1
+        ts = datetime.now(timezone.utc).replace(tzinfo=None).isoformat(timespec="seconds") + "Z"
+        database.insert_reading(ts, *synthetic_point(t))
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Simulate many concurrent dashboards in-process")
+    ap.add_argument("--clients", type=int, default=20, help="Number of virtual dashboards")
+    ap.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    ap.add_argument("--poll-ms", type=int, default=None,
+                    help="Delay after each tick (default: the poll_ms setting from /config)")
+    ap.add_argument("--view-seconds", type=int, default=60, help="Fallback if /config has none")
+    ap.add_argument("--score-window", type=int, default=30, help="Fallback if /config has none")
+    ap.add_argument("--max-points", type=int, default=600)
+    ap.add_argument("--anomalies-every", type=int, default=10, help="Ticks between /anomalies")
+    ap.add_argument("--config-every", type=int, default=30, help="Ticks between /config reloads")
+    ap.add_argument("--seed-minutes", type=int, default=60, help="History seeded before the run")
+    ap.add_argument("--no-ingest", action="store_true", help="Do not insert live readings")
+    ap.add_argument("--json", help="Also write the summary to this file")
+    args = ap.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="dashboard-load-")
+    db_path = os.path.join(tmpdir, "load.db")
+    # app.py binds DB_PATH at import time, so set it before importing the app
+    os.environ["DB_PATH"] = db_path
+    os.chdir(ROOT)
+    import seed
+    seed.seed(db_path, args.seed_minutes * 60, start_from_now=True)
+    import app as app_module
+    flask_app = app_module.app
+    flask_app.logger.disabled = True
+
+    stats = Stats()
+    stop = threading.Event()
+    pool = ThreadPoolExecutor(max_workers=max(2, args.clients * 2))
+    threads = [threading.Thread(target=virtual_client, args=(flask_app, args, stats, pool, stop, i),
+                                daemon=True) for i in range(args.clients)]
+    if not args.no_ingest:
+        threads.append(threading.Thread(target=live_ingest, args=(stop,), daemon=True))
+
+    print(f"{args.clients} clients for {args.duration:.0f}s against {db_path}", flush=True)
+    t0 = perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=30)
+    elapsed = perf_counter() - t0
+    pool.shutdown(wait=True)
+
+    summary = stats.summary(elapsed)
+    header = f"{'endpoint':<20}{'reqs':>8}{'rps':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}{'304%':>7}{'err%':>7}"
+    print(header)
+    print("-" * len(header))
+    for endpoint, s in summary.items():
+        print(f"{endpoint:<20}{s['requests']:>8}{s['rps']:>9.1f}{s['p50_ms']:>9.1f}{s['p90_ms']:>9.1f}"
+              f"{s['p99_ms']:>9.1f}{s['max_ms']:>9.1f}{s['not_modified_pct']:>7.1f}{s['error_pct']:>7.2f}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"clients": args.clients, "duration_s": round(elapsed, 2), "endpoints": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Trains a reference IsolationForest on a long stretch of stored history.
+
+    python scripts/train_iforest.py --last-days 14 --trees 200 --workers 4
+    python scripts/train_iforest.py --db data/labelled.db --json train.json
+
+The readings are streamed from SQLite once, in id-ordered chunks, and only the
+rows the forest needs are kept: trees * max_samples rows drawn uniformly from the
+whole range (each tree is grown on max_samples of them, as isolation forests are
+meant to be trained) plus a reference sample for the decision offset. The trees
+are split across worker processes, each fitting its slice on its own share of the
+sample, and the slices are merged into one forest. It is published to the model
+store (models/store.py) as the new version of iforest_ref, which the dashboard and
+the ingest pipeline score with from memory-mapped arrays; --joblib also keeps a
+plain sklearn copy.
+
+Prints the time spent scanning, fitting, merging and saving, and the peak RSS of
+this process and of the workers.
+"""
+import argparse, json, os, resource, sqlite3, sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from time import perf_counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def gather(db_path: str, first_id: int, positions: np.ndarray, chunk: int):
+    """Feature rows at the given sorted row positions (0 = first reading with id >= first_id)."""
+    out = np.empty((len(positions), 3))
+    filled = 0
+    offset = 0
+    last = first_id - 1
+    with sqlite3.connect(db_path) as conn:
+        while filled < len(positions):
+            rows = conn.execute(
+                "SELECT id, temperature, pressure, motor_speed FROM readings WHERE id > ? ORDER BY id LIMIT ?",
+                (last, chunk)).fetchall()
+            if not rows:
+                break
+            arr = np.asarray(rows, dtype=np.float64)
+            last = int(arr[-1, 0])
+            hi = np.searchsorted(positions, offset + len(arr))
+            take = positions[filled:hi] - offset
+            out[filled:hi] = arr[take, 1:]
+            filled, offset = hi, offset + len(arr)
+    return out[:filled]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(who).ru_maxrss / 1024.0, 1)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default=None, help="database path (default: DB_PATH)")
+    ap.add_argument("--last-days", type=float, default=0, help="train on the most recent days only (0 = all)")
+    ap.add_argument("--trees", type=int, default=200)
+    ap.add_argument("--max-samples", type=int, default=256, help="rows per tree")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--contamination", type=float, default=0.05, help="sets the decision offset")
+    ap.add_argument("--ref-size", type=int, default=50_000, help="rows used to set the decision offset")
+    ap.add_argument("--chunk", type=int, default=200_000, help="rows read from SQLite per query")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--store-dir", default=None, help="model store (default: MODEL_STORE_DIR or artifacts/)")
+    ap.add_argument("--joblib", help="also save the sklearn forest here (uncompressed joblib)")
+    ap.add_argument("--json", help="also write the report to this file")
+    args = ap.parse_args()
+
+    import database
+    if args.db:
+        database.DB_PATH = args.db
+    from models.isolation import fit_forest_shard, merge_forests, save_iforest
+    from models.store import STORE_DIR, save_forest
+
+    first_id = database.first_id_within(args.last_days * 86400) if args.last_days else 1
+    with database.get_connection() as conn:
+        n_rows, last_id = conn.execute("SELECT COUNT(*), MAX(id) FROM readings WHERE id >= ?", (first_id,)).fetchone()
+    if not n_rows:
+        sys.exit("no readings to train on")
+
+    rng = np.random.default_rng(args.seed)
+    workers = max(1, min(args.workers, args.trees))
+    train_pos = rng.choice(n_rows, size=min(n_rows, args.trees * args.max_samples), replace=False)
+    ref_pos = rng.choice(n_rows, size=min(n_rows, args.ref_size), replace=False)
+    positions = np.union1d(train_pos, ref_pos)
+
+    t0 = perf_counter()
+    sample = gather(database.DB_PATH, first_id, positions, args.chunk)
+    t_scan = perf_counter() - t0
+    X_train = sample[np.searchsorted(positions, train_pos)]   # still in random order
+    X_ref = sample[np.searchsorted(positions, ref_pos)]
+
+    # trees and rows split evenly over the workers; each shard is a uniform sample
+    tree_counts = [len(a) for a in np.array_split(np.arange(args.trees), workers)]
+    shards = np.array_split(X_train, workers)
+    t0 = perf_counter()
+    if workers == 1:
+        forests = [fit_forest_shard(shards[0], tree_counts[0], args.max_samples, args.seed)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            futures = [pool.submit(fit_forest_shard, X, n, args.max_samples, args.seed + i)
+                       for i, (X, n) in enumerate(zip(shards, tree_counts))]
+            forests = [f.result() for f in futures]
+    t_fit = perf_counter() - t0
+
+    t0 = perf_counter()
+    clf = merge_forests(forests, X_ref, contamination=args.contamination)
+    t_merge = perf_counter() - t0
+
+    import sklearn
+    report = {
+        "rows": int(n_rows), "first_id": int(first_id), "last_id": int(last_id),
+        "sampled_rows": int(len(sample)), "trees": clf.n_estimators, "max_samples": int(clf.max_samples_),
+        "workers": workers, "contamination": args.contamination, "offset": float(clf.offset_),
+        "sklearn": sklearn.__version__,
+        "trained_at": datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z"),
+        "seconds": {"scan": round(t_scan, 3), "fit": round(t_fit, 3), "merge": round(t_merge, 3)},
+    }
+    t0 = perf_counter()
+    store = args.store_dir or STORE_DIR
+    report["version"] = save_forest(clf, "iforest_ref", meta=report, root=store)
+    if args.joblib:
+        save_iforest(clf, args.joblib)
+    report["seconds"]["save"] = round(perf_counter() - t0, 3)
+    report["peak_rss_mb"] = {"main": peak_rss_mb(), "workers": peak_rss_mb(resource.RUSAGE_CHILDREN)}
+    path = os.path.join(store, "iforest_ref", report["version"])
+    report["store_mb"] = round(sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1e6, 2)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    s = report["seconds"]
+    print(f"{n_rows:,} readings (ids {first_id}..{last_id}), {len(sample):,} sampled -> "
+          f"{clf.n_estimators} trees x {clf.max_samples_} rows on {workers} worker(s)")
+    print(f"scan {s['scan']:.2f}s ({n_rows / max(s['scan'], 1e-9):,.0f} rows/s)  fit {s['fit']:.2f}s  "
+          f"merge {s['merge']:.2f}s  save {s['save']:.2f}s")
+    print(f"peak RSS: main {report['peak_rss_mb']['main']} MB, workers {report['peak_rss_mb']['workers']} MB; "
+          f"iforest_ref version {report['version']} ({report['store_mb']} MB) in {store}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import json, struct
+import numpy as np
+from flask import Response
+
+from tracing import traced
+
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; fall back to the stdlib encoder
+    orjson = None
+
+
+# Order of the tuples returned by the *_tuples fetch helpers in database.py
+READING_COLUMNS = ("id", "timestamp", "temperature", "pressure", "motor_speed")
+
+
+def rows_to_columns(rows):
+    """
+    Transposes reading tuples (id, timestamp, temperature, pressure, motor_speed)
+    into columns without building a dict per row. Numeric columns are NumPy arrays.
+    """
+    if not rows:
+        return {
+            "id": np.zeros(0, dtype=np.int64), "ts": [],
+            "temperature": np.zeros(0), "pressure": np.zeros(0), "motor_speed": np.zeros(0),
+        }
+    ids, ts, temp, press, rpm = zip(*rows)
+    return {
+        "id": np.array(ids, dtype=np.int64),
+        "ts": list(ts),
+        "temperature": np.array(temp, dtype=float),
+        "pressure": np.array(press, dtype=float),
+        "motor_speed": np.array(rpm, dtype=float),
+    }
+
+
+def feature_matrix(cols):
+    """Returns the [n, 3] model input matrix straight from the column arrays."""
+    return np.column_stack([cols["temperature"], cols["pressure"], cols["motor_speed"]])
+
+
+def _default(o):
+    if isinstance(o, np.ndarray):
+        return o.tolist()
+    if isinstance(o, np.generic):
+        return o.item()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def dumps(payload) -> bytes:
+    """Encodes a payload that may contain NumPy arrays (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY, default=_default)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+# Binary layout (?layout=binary), all little-endian:
+#   b"IADB" | uint32 header length | JSON header | zero pad to 8 bytes | column bodies
+# The header carries {"version", "n", "columns": [{"name", "dtype", "offset"}], ...scalars};
+# column offsets are relative to the start of the bodies and every body is 8-byte
+# aligned, so the browser can wrap each one in a typed array view without copying.
+BINARY_MAGIC = b"IADB"
+BINARY_VERSION = 1
+BINARY_COLUMNS = {
+    "id": ("i8", "<i8"),
+    "ts": ("i8", "<i8"),  # epoch milliseconds, UTC
+    "temperature": ("f4", "<f4"),
+    "pressure": ("f4", "<f4"),
+    "motor_speed": ("f4", "<f4"),
+    "anomaly_score": ("f4", "<f4"),
+    "is_anomaly": ("u1", "|u1"),
+}
+
+
+def ts_to_epoch_ms(ts):
+    """ISO-8601 UTC timestamps ('...Z' or SQLite's 'YYYY-MM-DD HH:MM:SS') to int64 epoch ms."""
+    if len(ts) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.char.rstrip(np.asarray(ts, dtype=str), "Z").astype("datetime64[ms]").astype(np.int64)
+
+
+def encode_binary(payload) -> bytes:
+    """Packs a columnar payload into the binary layout described above."""
+    n = len(payload["ts"])
+    columns, bodies, offset = [], [], 0
+    for name, (code, dtype) in BINARY_COLUMNS.items():
+        if name not in payload:
+            continue
+        values = ts_to_epoch_ms(payload["ts"]) if name == "ts" else payload[name]
+        body = np.ascontiguousarray(values, dtype=dtype).tobytes()
+        body += b"\0" * (-len(body) % 8)
+        columns.append({"name": name, "dtype": code, "offset": offset})
+        bodies.append(body)
+        offset += len(body)
+
+    meta = {k: v for k, v in payload.items() if k not in BINARY_COLUMNS}
+    header = json.dumps({"version": BINARY_VERSION, "n": n, "columns": columns, **meta},
+                        default=_default, separators=(",", ":")).encode("utf-8")
+    prefix = BINARY_MAGIC + struct.pack("<I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % 8)
+    return prefix + b"".join(bodies)
+
+
+def decode_binary(data: bytes):
+    """Inverse of encode_binary; returns the header dict with NumPy column arrays."""
+    if data[:4] != BINARY_MAGIC:
+        raise ValueError("not a binary columns payload")
+    (hlen,) = struct.unpack_from("<I", data, 4)
+    out = json.loads(data[8:8 + hlen])
+    base = 8 + hlen + (-(8 + hlen) % 8)
+    dtypes = {code: dtype for code, dtype in BINARY_COLUMNS.values()}
+    for col in out["columns"]:
+        out[col["name"]] = np.frombuffer(data, dtype=dtypes[col["dtype"]], count=out["n"],
+                                         offset=base + col["offset"])
+    return out
+
+
+@traced("serialize")
+def columnar_response(payload, status: int = 200, layout: str = "columnar") -> Response:
+    if layout == "binary":
+        return Response(encode_binary(payload), status=status, mimetype="application/octet-stream")
+    return Response(dumps(payload), status=status, mimetype="application/json")
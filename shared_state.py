@@ -0,0 +1,169 @@
+# shared_state.py
+import fcntl, hashlib, mmap, os, sqlite3, struct, threading
+from collections import namedtuple
+from contextlib import contextmanager
+from time import monotonic, time
+
+
+# State every web worker must agree on. gunicorn runs several worker processes and
+# consecutive polls from one dashboard land on different ones, so anything kept in
+# a worker's app.config (the replay cursor, the stride set with POST /config) was
+# only ever true for that worker.
+#
+# A small file next to the database ("<db>-state") is memory-mapped by every
+# process using that database. It holds the replay cursors, which change on every
+# replay poll and are not worth a SQLite write, and a settings version that
+# set_setting() bumps after committing to the settings table. Reads come from
+# memory: a process reloads its settings only when that version has moved (or,
+# for writers that bypass set_setting, after SETTINGS_MAX_AGE_S). Updates take an
+# fcntl lock on the file, so read-modify-write steps are atomic across workers.
+# Times are wall-clock (time.time()), since monotonic() is per process.
+#
+# Each dashboard replays with its own cursor, keyed by the session id it sends
+# (X-Replay-Session). Sessions are fixed-size slots in an open-addressed table in
+# the same file; one idle for REPLAY_SESSION_TTL_S is forgotten and its slot
+# reused. Requests without a session id share the cursor in slot 0.
+
+SETTINGS_MAX_AGE_S = float(os.getenv("SETTINGS_MAX_AGE_S", "5"))
+SESSION_SLOTS = int(os.getenv("REPLAY_SESSION_SLOTS", "1024"))
+SESSION_TTL_S = float(os.getenv("REPLAY_SESSION_TTL_S", "1800"))
+
+# replay cursor: mode on/off, index (id of the newest reading shown), stride per
+# poll (0 = the replay_stride setting), speed in readings per second (0 = one
+# stride per poll instead), last manual step, last automatic advance
+ReplayCursor = namedtuple("ReplayCursor", "mode index stride speed stepped_at advanced_at")
+NEW_CURSOR = ReplayCursor(False, 0, 0, 0.0, 0.0, 0.0)
+
+_HEADER = struct.Struct("<q")  # settings version
+_SLOT = struct.Struct("<16sd?7xqqddd")  # session key, last seen, then the cursor
+_SLOTS_AT = 64
+_SIZE = -(-(_SLOTS_AT + (SESSION_SLOTS + 1) * _SLOT.size) // mmap.PAGESIZE) * mmap.PAGESIZE
+_EMPTY = bytes(16)
+
+_states = {}  # (db path, pid) -> SharedState
+_states_lock = threading.Lock()
+
+
+def session_key(session_id: str) -> bytes:
+    return hashlib.blake2b(session_id.encode("utf-8"), digest_size=16).digest()
+
+
+class SharedState:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.path = f"{db_path}-state"
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self._fd).st_size < _SIZE:
+            os.ftruncate(self._fd, _SIZE)  # new bytes read as zeros: live mode, no sessions
+        self._map = mmap.mmap(self._fd, _SIZE)
+        # flock() excludes other processes; threads of this one share the fd, so they queue here first
+        self._thread_lock = threading.Lock()
+        self._settings = {}
+        self._settings_version = None
+        self._settings_loaded_at = 0.0
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    # --- replay cursors ---
+
+    def _offset(self, slot):
+        return _SLOTS_AT + slot * _SLOT.size
+
+    def _load(self, slot):
+        key, seen, *cursor = _SLOT.unpack_from(self._map, self._offset(slot))
+        return key, seen, ReplayCursor(*cursor)
+
+    def _store(self, slot, key, seen, cursor):
+        _SLOT.pack_into(self._map, self._offset(slot), key, seen, bool(cursor.mode), int(cursor.index),
+                        int(cursor.stride), float(cursor.speed), float(cursor.stepped_at),
+                        float(cursor.advanced_at))
+
+    def _find(self, key, now):
+        """(slot, cursor) for a session key, claiming a slot (with a new cursor) if it has none."""
+        if key is None:
+            return 0, self._load(0)[2]
+        start = int.from_bytes(key[:8], "little") % SESSION_SLOTS
+        free = oldest = None
+        for i in range(SESSION_SLOTS):
+            slot = 1 + (start + i) % SESSION_SLOTS
+            k, seen, cursor = self._load(slot)
+            if k == key:
+                return slot, (cursor if now - seen <= SESSION_TTL_S else NEW_CURSOR)
+            if k == _EMPTY:
+                # never used: the key is not further along the probe sequence
+                return (slot if free is None else free), NEW_CURSOR
+            if free is None and now - seen > SESSION_TTL_S:
+                free = slot
+            if oldest is None or seen < oldest[1]:
+                oldest = (slot, seen)
+        # every slot is live: the session idle the longest loses its cursor
+        return (free if free is not None else oldest[0]), NEW_CURSOR
+
+    def replay(self, session_id=None):
+        """The ReplayCursor of a session (or the shared one); touching it keeps the session alive."""
+        return self.update_replay(lambda cursor: None, session_id)
+
+    def update_replay(self, fn, session_id=None):
+        """
+        Atomically replaces a session's cursor with fn(cursor), which returns the new
+        ReplayCursor (or None to leave it as it is). Returns the cursor after.
+        """
+        key = session_key(session_id) if session_id else None
+        with self._locked():
+            now = time()
+            slot, cursor = self._find(key, now)
+            cursor = fn(cursor) or cursor
+            self._store(slot, key or _EMPTY, now, cursor)
+        return cursor
+
+    def live_sessions(self):
+        """Number of replay sessions seen within the TTL."""
+        now = time()
+        with self._locked():
+            slots = [self._load(slot)[:2] for slot in range(1, SESSION_SLOTS + 1)]
+        return sum(1 for key, seen in slots if key != _EMPTY and now - seen <= SESSION_TTL_S)
+
+    # --- settings table ---
+
+    def get_setting(self, key, default=None):
+        version = _HEADER.unpack_from(self._map, 0)[0]
+        if version != self._settings_version or monotonic() - self._settings_loaded_at > SETTINGS_MAX_AGE_S:
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute("SELECT key, value FROM settings").fetchall()
+            self._settings, self._settings_version, self._settings_loaded_at = dict(rows), version, monotonic()
+        return self._settings.get(key, default)
+
+    def set_setting(self, key, value):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                "INSERT INTO settings(key, value) VALUES(?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, value)
+            )
+            conn.commit()
+        self.settings_changed()
+
+    def settings_changed(self):
+        """Makes every process reload its settings on its next read."""
+        with self._locked():
+            version = _HEADER.unpack_from(self._map, 0)[0]
+            _HEADER.pack_into(self._map, 0, version + 1)
+
+
+def shared_state(db_path) -> SharedState:
+    """The SharedState of a database for this process (mappings are not reused across a fork)."""
+    key = (db_path, os.getpid())
+    state = _states.get(key)
+    if state is None:
+        with _states_lock:
+            state = _states.get(key)
+            if state is None:
+                state = _states[key] = SharedState(db_path)
+    return state
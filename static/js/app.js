@@ -11,6 +11,25 @@ let chartsEverRendered = false;
 let clockInterval = null; // Handle for the live clock
 
 
+// Each tab replays with its own cursor on the server (see shared_state.py). The id
+// lives in sessionStorage, so a reload keeps its place but a new tab starts fresh.
+const REPLAY_SESSION = (() => {
+  let id = null;
+  try { id = sessionStorage.getItem('replaySession'); } catch {}
+  if (!id) {
+    const bytes = new Uint8Array(16);
+    crypto.getRandomValues(bytes);
+    id = Array.from(bytes, b => b.toString(16).padStart(2, '0')).join('');
+    try { sessionStorage.setItem('replaySession', id); } catch {}
+  }
+  return id;
+})();
+
+function withSession(opts = {}) {
+  return { ...opts, headers: { ...(opts.headers || {}), 'X-Replay-Session': REPLAY_SESSION } };
+}
+
+
 // --- Alert tuning variables ---
 const MIN_ALERT_SCORE = 0.18;
 const PERSIST_K = 3;
@@ -239,32 +258,106 @@ function escapeHtml(s) {
 
 
 
+// About one point per horizontal pixel of the main chart; the server LTTB-downsamples to this
+// (keeping every flagged anomaly), so wide view windows don't ship thousands of hidden points.
+function chartMaxPoints() {
+  const el = document.getElementById('tempChart');
+  return Math.max(200, Math.round((el && el.clientWidth) || 600));
+}
+
+
+function toEpochMs(t) { return typeof t === 'number' ? t : Date.parse(t); }
+
+
+// Decodes the ?layout=binary payload: "IADB", uint32 header length, JSON header,
+// then 8-byte aligned little-endian column bodies that are wrapped as typed array views.
+function decodeBinaryColumns(buf) {
+  const magic = String.fromCharCode(...new Uint8Array(buf, 0, 4));
+  if (magic !== 'IADB') throw new Error('Unexpected binary payload');
+  const headerLen = new DataView(buf).getUint32(4, true);
+  const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buf, 8, headerLen)));
+  const base = Math.ceil((8 + headerLen) / 8) * 8;
+  const out = { ...header };
+  for (const col of header.columns) {
+    const off = base + col.offset;
+    if (col.dtype === 'f4') out[col.name] = new Float32Array(buf, off, header.n);
+    else if (col.dtype === 'u1') out[col.name] = new Uint8Array(buf, off, header.n);
+    else if (col.dtype === 'i8') out[col.name] = Array.from(new BigInt64Array(buf, off, header.n), Number);
+  }
+  return out;
+}
+
+
+// Binary responses are decoded; JSON errors/fallbacks (e.g. `[]`) are parsed as usual.
+async function readColumns(resp) {
+  const type = resp.headers.get('Content-Type') || '';
+  if (type.startsWith('application/octet-stream')) return decodeBinaryColumns(await resp.arrayBuffer());
+  return resp.json();
+}
+
+
+// Row objects -> columnar payload ({ts:[...], temperature:[...], ...}), sorted oldest->newest.
+function rowsToColumns(rows) {
+  const asc = [...rows].sort((a, b) => Date.parse(a.timestamp) - Date.parse(b.timestamp));
+  return {
+    id: asc.map(r => r.id),
+    ts: asc.map(r => r.timestamp),
+    temperature: asc.map(r => Number(r.temperature)),
+    pressure: asc.map(r => Number(r.pressure)),
+    motor_speed: asc.map(r => Number(r.motor_speed))
+  };
+}
+
+
+// Columnar scores payload -> row objects. Only used for the (small) scored window,
+// which the badges, alert overlay and anomaly table consume row by row.
+function columnsToRows(cols) {
+  const n = (cols && cols.ts) ? cols.ts.length : 0;
+  const out = new Array(n);
+  for (let i = 0; i < n; i++) {
+    out[i] = {
+      id: Number(cols.id[i]),
+      timestamp: typeof cols.ts[i] === 'number' ? new Date(cols.ts[i]).toISOString() : cols.ts[i],
+      temperature: cols.temperature[i],
+      pressure: cols.pressure[i],
+      motor_speed: cols.motor_speed[i],
+      anomaly_score: cols.anomaly_score[i],
+      is_anomaly: Boolean(cols.is_anomaly[i]),
+      model: cols.model
+    };
+  }
+  return out;
+}
+
+
 async function fetchAndUpdate() {
   const token = ++lastToken;
   const root = document.querySelector('.activity');
   root?.classList.add('busy');
   try {
     const [histResp, scoreResp] = await Promise.all([
-      fetch(`/history?n=${viewSeconds}&_t=${Date.now()}`), 
-      fetch(`/scores_for_window?n=${scoreWindow}&c=${contamination.toFixed(3)}&model=${encodeURIComponent(selectedModel)}&_t=${Date.now()}`)
+      // No cache-busting param: the browser revalidates with If-None-Match and the
+      // server answers 304 when nothing changed, reusing the cached body
+      fetch(`/history?n=${viewSeconds}&max_points=${chartMaxPoints()}&layout=binary`, withSession({ cache: 'no-cache' })), 
+      fetch(`/scores_for_window?n=${scoreWindow}&c=${contamination.toFixed(3)}&model=${encodeURIComponent(selectedModel)}&max_points=${chartMaxPoints()}&layout=binary`, withSession({ cache: 'no-cache' }))
     ]);
 
 
     if (token !== lastToken) return;
 
 
-    const [histPayload, scorePayload] = await Promise.all([histResp.json(), scoreResp.json()]);
+    const [histPayload, scorePayload] = await Promise.all([readColumns(histResp), readColumns(scoreResp)]);
 
 
-    const histRows = Array.isArray(histPayload) ? histPayload : (histPayload.rows || []);
-    const scoredNewestFirst = Array.isArray(scorePayload) ? scorePayload : (scorePayload.rows || []);
+    // Columnar history comes back oldest->newest; chart arrays are read straight off the columns
+    const hist = histPayload.ts ? histPayload : rowsToColumns(histPayload.rows || []);
+    const scoredNewestFirst = Array.isArray(scorePayload) ? scorePayload : columnsToRows(scorePayload);
 
 
-    const histAsc = [...histRows].sort((a, b) => Date.parse(a.timestamp) - Date.parse(b.timestamp));
-    const times = histAsc.map(r => Date.parse(r.timestamp));
-    const temps = histAsc.map(r => Number(r.temperature));
-    const press = histAsc.map(r => Number(r.pressure));
-    const rpm   = histAsc.map(r => Number(r.motor_speed));
+    const times = Array.from(hist.ts, toEpochMs);
+    const temps = Array.from(hist.temperature, Number);
+    const press = Array.from(hist.pressure, Number);
+    const rpm   = Array.from(hist.motor_speed, Number);
 
 
     const dataNow = times.length ? times[times.length - 1] : Date.now();
@@ -290,8 +383,9 @@ async function fetchAndUpdate() {
       || (cutoffBucket !== Math.floor(prevCutoff / 1000));
 
 
-    if (histAsc.length > 0) {
-      const latest = histAsc[histAsc.length - 1];
+    if (times.length > 0) {
+      const last = times.length - 1;
+      const latest = { temperature: temps[last], pressure: press[last], motor_speed: rpm[last] };
       const kpiTemp = document.getElementById('kpiTemp');
       const kpiPress = document.getElementById('kpiPress');
       const kpiRpm = document.getElementById('kpiRpm');
@@ -574,6 +668,60 @@ function hideOverlay(){
 }
 
 
+// Server-side alerts (alert rules over the stored scores). When the server runs
+// in async mode (/config says alert_stream: 'sse') they arrive on /stream, and
+// EventSource reconnects on its own and resends Last-Event-ID, so nothing is missed.
+// Under gunicorn's threaded workers an open stream would hold a server thread, so
+// the page polls /alerts for anything newer than the last alert it has seen.
+const ALERT_POLL_MS = 5000;
+let alertStream = null;
+let lastAlertId = null;
+
+function showServerAlert(a){
+  const when = a.ts ? toHMSutc(toEpochMs(a.ts)) : '';
+  if (a.state === 'firing') {
+    showToast(`[${a.severity}] ${a.rule}: ${a.message} ${when}`,
+      { variant: a.severity === 'critical' ? 'error' : 'warn', timeout: 8000 });
+    if (a.severity === 'critical' && Date.now() >= alertLatchedUntil) {
+      showOverlay(a.value, `${a.rule}: ${a.message} (reading #${a.reading_id}, ${a.model})`);
+    }
+  } else {
+    showToast(`${a.rule} resolved ${when}`, { variant: 'info', role: 'status', timeout: 4000 });
+  }
+}
+
+async function pollAlerts(){
+  try {
+    const resp = await fetch('/alerts?limit=100', { cache: 'no-store' });
+    if (!resp.ok) return;
+    const alerts = (await resp.json()).alerts || [];  // newest first
+    if (lastAlertId === null) {
+      // like a new stream: start from the newest alert rather than replaying the log
+      lastAlertId = alerts.length ? alerts[0].id : 0;
+      return;
+    }
+    const fresh = alerts.filter(a => a.id > lastAlertId).reverse();
+    fresh.forEach(showServerAlert);
+    if (fresh.length) lastAlertId = fresh[fresh.length - 1].id;
+  } catch (e) { console.warn('alert poll failed', e); }
+}
+
+function startAlertStream(mode){
+  if (alertStream) return;
+  if (mode === 'sse' && typeof EventSource !== 'undefined') {
+    alertStream = new EventSource('/stream');
+    alertStream.addEventListener('alert', e => {
+      let a;
+      try { a = JSON.parse(e.data); } catch { return; }
+      showServerAlert(a);
+    });
+    return;
+  }
+  pollAlerts();
+  alertStream = setInterval(pollAlerts, ALERT_POLL_MS);
+}
+
+
 function resetUIStatus(){
   ['kpiTemp','kpiPress','kpiRpm'].forEach(id => { const el=document.getElementById(id); if (el) el.textContent='--'; });
   const ka=document.getElementById('kpiAnom'); if (ka) ka.textContent='--';
@@ -600,7 +748,7 @@ function resetUIStatus(){
 
 
 async function setMode(mode){
-  await fetch('/mode', { method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ mode }) });
+  await fetch('/mode', withSession({ method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ mode }) }));
   resetUIStatus();
   initCharts();
   
@@ -642,11 +790,11 @@ function setReplayControlsEnabled(enabled){
 
 async function replayStep(delta){
   try {
-    const resp = await fetch('/replay/step', {
+    const resp = await fetch('/replay/step', withSession({
       method:'POST',
       headers:{'Content-Type':'application/json'},
       body: JSON.stringify({ delta })
-    });
+    }));
     if (!resp.ok) {
       const msg = `Step failed: HTTP ${resp.status}`;
       document.getElementById('statusText').textContent = msg;
@@ -666,7 +814,7 @@ async function refreshAnomalyTable(anomalyRows) {
     let rows = anomalyRows;
     
     if (!rows) {
-      const resp = await fetch(`/anomalies?n=${scoreWindow}&c=${contamination.toFixed(3)}&model=${encodeURIComponent(selectedModel)}&_t=${Date.now()}`);
+      const resp = await fetch(`/anomalies?n=${scoreWindow}&c=${contamination.toFixed(3)}&model=${encodeURIComponent(selectedModel)}`, withSession({ cache: 'no-cache' }));
       if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
       rows = await resp.json();
     }
@@ -756,9 +904,11 @@ async function updateBadges(scoredNewestFirst, visibleSecs = null) {
 
 
 
+let alertStreamMode = 'poll';
+
 async function loadDefaults() {
   try {
-    const resp = await fetch('/config?_t=' + Date.now());
+    const resp = await fetch('/config?_t=' + Date.now(), withSession());
     if (!resp.ok) return;
     const cfg = await resp.json();
 
@@ -792,6 +942,7 @@ async function loadDefaults() {
     if (cfg.history_window_default) {
       historyWindow = Number(cfg.history_window_default);
     }
+    if (cfg.alert_stream) alertStreamMode = cfg.alert_stream;
   } catch(e) { console.warn('loadDefaults failed', e); }
 }
 
@@ -903,7 +1054,7 @@ document.addEventListener('DOMContentLoaded', () => {
   document.getElementById('stopLiveBtn')?.addEventListener('click', stopPolling);
   document.getElementById('startReplayBtn')?.addEventListener('click', () => setMode('replay'));
   document.getElementById('resetReplayBtn')?.addEventListener('click', async () => {
-    await fetch('/replay/reset', { method:'POST' });
+    await fetch('/replay/reset', withSession({ method:'POST' }));
     backoffMs = MIN_MS; 
     await fetchAndUpdate();
   });
@@ -920,8 +1071,13 @@ document.addEventListener('DOMContentLoaded', () => {
   if (playBtn) { playBtn.textContent = 'Play'; playBtn.dataset.playing = '0'; }
   
   speedSel?.addEventListener('change', async e => {
+    // this tab's pace only; other dashboards replaying keep theirs
     const stride = Number(e.target.value || 1);
-    await persistConfig({ replay_stride: stride });
+    try {
+      await fetch('/replay/settings', withSession({
+        method:'POST', headers:{'Content-Type':'application/json'}, body: JSON.stringify({ stride })
+      }));
+    } catch(e) { console.warn('replay settings failed', e); }
   });
 
 
@@ -959,7 +1115,7 @@ document.addEventListener('DOMContentLoaded', () => {
     await setMode('replay');
     const local = new Date(jumpInp.value);
     const isoUtc = new Date(local.getTime() - local.getTimezoneOffset()*60000).toISOString();
-    await fetch('/replay/seek?ts=' + encodeURIComponent(isoUtc));
+    await fetch('/replay/seek?ts=' + encodeURIComponent(isoUtc), withSession());
     await fetchAndUpdate();
   });
 
@@ -1074,6 +1230,7 @@ document.addEventListener('DOMContentLoaded', () => {
     setActiveTab('Overview');
     startPolling();
     startLiveClock();
+    startAlertStream(alertStreamMode);
   });
 
 
@@ -9,6 +9,7 @@ import sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from app import app as flask_app
+import app as app_module
 import database
 
 
@@ -37,10 +38,15 @@ def app():
     # Swap DB_PATH to point to the temp DB
     original_db_path = database.DB_PATH
     database.DB_PATH = db_path
+    # app.py imports DB_PATH by value, so point its copy at the temp DB as well
+    app_module.DB_PATH = db_path
 
     # Configure Flask test mode
     flask_app.config['TESTING'] = True
     flask_app.config['DB_PATH'] = db_path
+    # calibrated thresholds are cached per app; start each test from its own (empty) DB
+    from calibration import Calibrator
+    flask_app.config['_calibrator'] = Calibrator()
 
     # Initialize schema for the temp DB (both readings and settings)
     database.init_db()
@@ -64,6 +70,9 @@ def app():
 
     # Restore global DB_PATH
     database.DB_PATH = original_db_path
+    app_module.DB_PATH = original_db_path
 
-    # Remove the temp file 
+    # Remove the temp file (and the shared replay/settings state next to it)
     _safe_unlink(db_path)
+    if os.path.exists(db_path + "-state"):
+        _safe_unlink(db_path + "-state")
@@ -0,0 +1,75 @@
+import numpy as np
+
+import database
+import seed
+from alerts import DEFAULT_RULES, AlertEngine, build_rules
+from calibration import Calibrator, reference_digest
+from models import store
+from pipeline import ScoringPipeline
+
+
+def _ts(i):
+    return "2025-01-01T%02d:%02d:%02dZ" % (i // 3600, i // 60 % 60, i % 60)
+
+
+def _store(scores, flags, start=0):
+    """Inserts one reading per second with the given scores / anomaly flags."""
+    first, last = database.insert_readings([(_ts(start + i), 50.0, 6.0, 1800) for i in range(len(scores))])
+    database.insert_scores([(first + i, "ewma", float(s), int(f))
+                            for i, (s, f) in enumerate(zip(scores, flags))])
+
+
+def test_count_rule_debounces_and_resolves(app):
+    """Test N-in-M fires once per burst, resolves with hysteresis and only reads new scores."""
+    engine = AlertEngine(build_rules([{"name": "burst", "kind": "count", "n": 3, "window_s": 10, "clear_n": 0}]))
+    flags = [0] * 5 + [1] * 6 + [0] * 20
+    _store([0.0] * len(flags), flags)
+
+    first = engine.poll()
+    assert [a["state"] for a in first] == ["firing", "resolved"]
+    assert first[0]["reading_id"] == 8 and first[0]["value"] == 3
+    assert engine.poll() == []   # nothing new, nothing re-read
+
+    _store([0.0] * 4, [1] * 4, start=len(flags))
+    assert [a["state"] for a in engine.poll()] == ["firing"]
+
+
+def test_threshold_rule_needs_sustained_score(app, client):
+    """Test score-above-threshold alerts need hold_s seconds and are served by /alerts and /stream."""
+    rule = {"name": "hot", "kind": "threshold", "threshold": 5.0, "clear": 2.0, "hold_s": 3, "clear_s": 2,
+            "severity": "critical"}
+    # a 2 s blip (ignored), then 6 s above, then hovering between clear and threshold, then calm
+    scores = [0, 9, 9, 0, 0] + [8] * 6 + [4, 6, 4] + [0] * 4
+    _store(scores, [0] * len(scores))
+
+    alerts = AlertEngine(build_rules([rule])).poll()
+    assert [(a["state"], a["reading_id"]) for a in alerts] == [("firing", 9), ("resolved", 17)]
+
+    page = client.get('/alerts?limit=1').get_json()
+    assert page["alerts"][0]["state"] == "resolved" and page["next_before_id"] == page["alerts"][0]["id"]
+    older = client.get(f'/alerts?limit=1&before_id={page["next_before_id"]}').get_json()
+    assert older["alerts"][0]["state"] == "firing" and older["next_before_id"] is not None
+
+    app.config['STREAM_MAX_SECONDS'] = 0
+    body = client.get('/stream', headers={"Last-Event-ID": "0"}).get_data(as_text=True)
+    assert body.count("event: alert") == 2 and f"id: {page['alerts'][0]['id']}" in body
+
+
+def test_default_rules_quiet_on_healthy_data(app, tmp_path, monkeypatch):
+    """Test a calibrated ingest model raises no default alert over an hour of healthy seed readings."""
+    monkeypatch.setattr(store, "STORE_DIR", str(tmp_path))   # no reference forest: ingest scores ewma
+    rng = np.random.default_rng(7)
+    history = np.column_stack(seed.synthetic_chunk(0, 3 * 3600, rng, spike_rate=0.0)).astype(float)
+    Calibrator().replace("ewma", reference_digest("ewma", [history]))
+
+    temp, press, rpm = seed.synthetic_chunk(3 * 3600, 3600, rng, spike_rate=0.0)
+    pipeline = ScoringPipeline()
+    for start in range(0, 3600, 60):
+        rows = [(_ts(start + i), float(temp[start + i]), float(press[start + i]), int(rpm[start + i]))
+                for i in range(60)]
+        pipeline._process(*database.insert_readings(rows))
+
+    with database.get_connection() as conn:
+        flagged = conn.execute("SELECT SUM(is_anomaly) FROM scores WHERE model = 'ewma'").fetchone()[0]
+    assert 0 < flagged < 0.1 * 3600   # flags at about the calibrated rate...
+    assert AlertEngine(build_rules(DEFAULT_RULES)).poll() == []   # ...without raising an alert
@@ -59,6 +59,8 @@ def test_config_get(client):
     data = json.loads(response.data)
     # Should have at least some config keys
     assert len(data) > 0
+    # a threaded WSGI server polls /alerts rather than holding a thread per /stream
+    assert data['alert_stream'] == 'poll'
 
 
 def test_config_post(client):
@@ -106,3 +108,325 @@ def test_anomalies_endpoint(client):
     
     data = json.loads(response.data)
     assert isinstance(data, list)
+
+
+def test_single_flight_shares_result(app):
+    """Test concurrent callers with the same key share one computation."""
+    import threading, time
+    from app import single_flight
+
+    calls = []
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return "scored"
+
+    def worker():
+        with app.app_context():
+            results.append(single_flight(("scores_for_window", 1, 10, "iforest", 0.05), compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1
+    assert results == ["scored"] * 5
+
+
+def test_prometheus_metrics_endpoint(client):
+    """Test /metrics/prometheus exposes per-route latency histograms."""
+    client.get('/history?n=5')
+    response = client.get('/metrics/prometheus')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain')
+
+    body = response.data.decode()
+    assert 'dashboard_request_latency_seconds_bucket{endpoint="history"' in body
+    assert 'dashboard_requests_in_flight' in body
+    assert 'dashboard_db_query_seconds' in body
+
+
+def test_debug_traces_records_spans(client, app):
+    """Test sampled requests land in /debug/traces with their spans, including the scoring pool's."""
+    import database
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % i, 50.0 + i % 5, 6.0, 1800) for i in range(10)])
+    client.post('/mode', json={'mode': 'live'})
+    app.config['TRACE_SAMPLE_RATE'] = 1.0
+    try:
+        response = client.get('/scores_for_window?n=10&c=0.05&model=iforest')
+        rid = response.headers['X-Request-Id']
+    finally:
+        app.config['TRACE_SAMPLE_RATE'] = 0.1
+
+    traces = json.loads(client.get(f'/debug/traces?rid={rid}').data)
+    assert len(traces) == 1
+    names = [s['name'] for s in traces[0]['spans']]
+    assert any(n.startswith('fetch_') for n in names)
+    assert 'compress' in names
+    # the fit ran in a pool process; its timing comes back with the result
+    spans = {s['name']: s for s in traces[0]['spans']}
+    pool, score = spans['scoring_pool'], spans['pool.score']
+    assert 'pool.wait' in spans and score['model'] == 'iforest'
+    assert pool['start_ms'] - 5 <= score['start_ms'] <= pool['start_ms'] + pool['ms']
+
+
+def test_admin_profile_requires_token(client, monkeypatch):
+    """Test /admin/profile is disabled without ADMIN_TOKEN and checks the bearer token."""
+    assert client.post('/admin/profile?seconds=0.1').status_code == 403
+
+    monkeypatch.setenv('ADMIN_TOKEN', 'secret')
+    assert client.post('/admin/profile?seconds=0.1').status_code == 401
+
+    headers = {'Authorization': 'Bearer secret'}
+    response = client.post('/admin/profile?seconds=0.2&format=speedscope', headers=headers)
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['profiles'][0]['type'] == 'sampled'
+
+
+def test_profiler_collapsed_stacks():
+    """Test the sampler sees a busy background thread."""
+    import threading, time
+    from profiler import profile, to_collapsed
+
+    stop = threading.Event()
+
+    def busy_loop():
+        while not stop.is_set():
+            sum(range(1000))
+
+    t = threading.Thread(target=busy_loop, name='busy')
+    t.start()
+    try:
+        counts, elapsed = profile(0.2, 0.005)
+    finally:
+        stop.set()
+        t.join()
+
+    text = to_collapsed(counts)
+    assert 'busy;' in text
+    assert 'busy_loop' in text
+    assert elapsed >= 0.2
+
+
+def test_scores_streaming_model(client):
+    """Test streaming detectors are accepted as model= and as default_model."""
+    import database
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % (i % 60), 50.0 + i % 7, 6.0, 1800 + i)
+                              for i in range(100)])
+    client.post('/mode', json={'mode': 'live'})
+    response = client.get('/scores?n=100&model=mahalanobis')
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data and {r['model'] for r in data} == {'mahalanobis'}
+
+    response = client.post('/config', json={'default_model': 'hst'})
+    assert response.get_json()['updated'] == {'default_model': 'hst'}
+    response = client.post('/config', json={'default_model': 'nope'})
+    assert 'default_model' in response.get_json()['errors']
+    client.post('/config', json={'default_model': 'iforest'})
+
+
+def test_calibrated_threshold_replaces_top_k(client, app):
+    """Test a calibrated model flags nothing on a healthy window and flags a real outlier."""
+    import numpy as np
+    import database
+    from calibration import reference_digest
+    rng = np.random.RandomState(3)
+    normal = lambda n: np.c_[50 + rng.randn(n), 6 + 0.1 * rng.randn(n), 1800 + 20 * rng.randn(n)]
+    app.config['_calibrator'].replace("ewma", reference_digest("ewma", [normal(5000)]))
+    client.post('/mode', json={'mode': 'live'})
+    rows = [("2025-01-01T00:%02d:%02dZ" % (i // 60, i % 60), *x) for i, x in enumerate(normal(120))]
+    database.insert_readings(rows)
+
+    data = client.get('/scores_for_window?n=120&model=ewma&c=0.001').get_json()
+    assert not any(r['is_anomaly'] for r in data)
+
+    database.insert_readings([("2025-01-01T00:02:00Z", 90.0, 6.0, 1800)])
+    data = client.get('/scores_for_window?n=121&model=ewma&c=0.001').get_json()
+    assert [r['id'] for r in data if r['is_anomaly']] == [121]
+    assert [t['model'] for t in client.get('/thresholds').get_json()] == ['ewma']
+
+
+def test_threshold_revision_is_shared_by_workers(app):
+    """Test the ETag's thresholds part comes from the stored row, so every worker computes the same one."""
+    import numpy as np
+    from calibration import Calibrator, reference_digest
+    X = np.random.RandomState(1).randn(2000, 3)
+    pipeline, worker_a, worker_b = Calibrator(), Calibrator(reload_s=0), Calibrator(reload_s=0)
+    assert worker_a.revision("iforest") is None
+    pipeline.replace("ewma", reference_digest("ewma", [X]))
+    worker_a.threshold("hst", 0.05)   # has loaded other models as well
+    first = worker_a.revision("ewma")
+    assert first == worker_b.revision("ewma")
+
+    pipeline.observe("ewma", np.zeros(10))
+    pipeline.flush()
+    assert worker_a.revision("ewma") == worker_b.revision("ewma") != first
+
+
+def test_iforest_ref_uses_stored_forest(client, tmp_path, monkeypatch):
+    """Test model=iforest_ref scores with the stored reference forest, and falls back without one."""
+    import numpy as np
+    import database
+    import models.store as store
+    from models.isolation import fit_forest_shard, merge_forests
+    monkeypatch.setattr(store, "STORE_DIR", str(tmp_path))
+    client.post('/mode', json={'mode': 'live'})
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % i, 50.0 + i % 5, 6.0, 1800) for i in range(50)])
+
+    data = client.get('/scores_for_window?n=50&model=iforest_ref').get_json()
+    assert {r['model'] for r in data} == {'iforest'}
+
+    X = np.random.RandomState(0).randn(2000, 3) * [2, 0.1, 20] + [52, 6, 1800]
+    store.save_forest(merge_forests([fit_forest_shard(X, 50)], X), root=str(tmp_path))
+    data = client.get('/scores_for_window?n=50&model=iforest_ref').get_json()
+    assert {r['model'] for r in data} == {'iforest_ref'}
+    assert client.post('/config', json={'default_model': 'iforest_ref'}).get_json()['updated']
+    client.post('/config', json={'default_model': 'iforest'})
+
+
+def test_warm_up_exercises_models(client, app):
+    """Test warm_up runs the requested models (leaving the LSTM until after a fork) and /healthz reports it."""
+    from app import warm_up
+    app.config['_warmup'] = {}
+    with app.app_context():
+        done = dict(warm_up(["iforest", "ewma", "lstm"], before_fork=True))
+    assert "ewma" in done and "lstm" not in done
+    assert "ewma" in client.get('/healthz').get_json()['warmup_ms']
+
+
+def test_busy_scoring_pool_sheds_to_last_scores(client, app, monkeypatch):
+    """Test a saturated scoring pool serves the last window's scores (marked stale) or a 503."""
+    import database
+    from scoring_pool import ScoringPool
+    client.post('/mode', json={'mode': 'live'})
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % i, 50.0 + i % 5, 6.0, 1800) for i in range(40)])
+    fresh = client.get('/scores_for_window?n=30&model=iforest')
+    assert fresh.status_code == 200 and 'X-Scores-Stale' not in fresh.headers
+
+    monkeypatch.setitem(app.config, '_scoring_pool', ScoringPool(workers=1, max_queue=0))
+    database.insert_readings([("2025-01-01T00:00:40Z", 50.0, 6.0, 1800)])
+    stale = client.get('/scores_for_window?n=30&model=iforest')
+    assert stale.status_code == 200 and stale.headers['X-Scores-Stale'] == '1' and 'ETag' not in stale.headers
+    before = {r['id']: r['anomaly_score'] for r in fresh.get_json()}
+    rows = stale.get_json()
+    assert all(r['anomaly_score'] == before[r['id']] for r in rows[:-1])
+    assert rows[-1]['id'] == 41 and rows[-1]['anomaly_score'] == 0.0 and not rows[-1]['is_anomaly']
+
+    busy = client.get('/scores_for_window?n=31&model=iforest')
+    assert busy.status_code == 503 and busy.headers['Retry-After'] == '1'
+
+
+def test_replay_cursor_and_settings_shared_across_processes(client, app):
+    """Test another worker process sees this one's replay cursor, and its setting changes show up here."""
+    import subprocess
+    import sys
+    import database
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % i, 50.0, 6.0, 1800) for i in range(40)])
+    client.post('/mode', json={'mode': 'replay'})
+    assert client.post('/replay/step', json={'delta': 7}).get_json()['index'] == 7
+
+    other_worker = (
+        "import sys; from shared_state import shared_state; s = shared_state(sys.argv[1]); "
+        "print(s.replay()[:2]); s.set_setting('replay_stride', '3')"
+    )
+    out = subprocess.run([sys.executable, "-c", other_worker, database.DB_PATH], capture_output=True,
+                         text=True, check=True, cwd=app.root_path).stdout
+    assert out.strip() == "(True, 7)"
+    assert client.get('/config').get_json()['replay_stride'] == '3'
+    client.post('/mode', json={'mode': 'live'})
+
+
+def test_replay_sessions_have_independent_cursors(client, app):
+    """Test each X-Replay-Session keeps its own cursor and stride, and windows are id-range seeks."""
+    import database
+    database.insert_readings([("2025-01-01T00:%02d:%02dZ" % (i // 60, i % 60), 50.0, 6.0, 1800) for i in range(100)])
+    with database.get_connection() as conn:
+        conn.execute("DELETE FROM readings WHERE id <= 20")  # as after retention: ids start at 21
+    a, b = {'X-Replay-Session': 'tab-a'}, {'X-Replay-Session': 'tab-b'}
+
+    assert client.post('/mode', json={'mode': 'replay'}, headers=a).get_json()['index'] == 20
+    assert client.post('/replay/settings', json={'stride': 10}, headers=a).get_json()['stride'] == 10
+    ids = [r['id'] for r in client.get('/history?n=5', headers=a).get_json()['rows']]
+    assert ids == [26, 27, 28, 29, 30]
+
+    # b seeks elsewhere and steps by hand; a's cursor and the shared one do not move
+    assert client.get('/replay/seek?ts=2025-01-01T00:01:00Z', headers=b).get_json()['index'] == 61
+    assert client.post('/replay/step', json={'delta': 3}, headers=b).get_json()['index'] == 64
+    assert client.get('/config', headers=a).get_json()['replay_index'] == 30
+    assert client.get('/config').get_json()['replay_mode'] is False
+    ids = [r['id'] for r in client.get('/scores_for_window?n=3&model=ewma', headers=b).get_json()]
+    assert ids == [62, 63, 64]
+
+    assert client.get('/config', headers={'X-Replay-Session': 'bad id!'}).status_code == 400
+
+
+def test_replay_speed_advances_with_conditional_polls(client, app):
+    """Test a speed-mode replay keeps moving when polls send If-None-Match, even polls seconds apart."""
+    import time
+    import database
+    database.insert_readings([("2025-01-01T00:%02d:%02dZ" % (i // 60, i % 60), 50.0, 6.0, 1800) for i in range(300)])
+    s = {'X-Replay-Session': 'slow-tab'}
+    client.post('/mode', json={'mode': 'replay'}, headers=s)
+    client.post('/replay/settings', json={'speed': 20}, headers=s)
+
+    etag, seen = None, []
+    for _ in range(8):
+        time.sleep(0.15)
+        resp = client.get('/history?n=1', headers={**s, 'If-None-Match': etag or ''})
+        if resp.status_code == 200:
+            etag = resp.headers['ETag']
+            seen.append(resp.get_json()['rows'][-1]['id'])
+    assert len(seen) >= 4 and seen == sorted(set(seen)) and 15 <= seen[-1] <= 45
+
+    # polled every 2.5 s (a slow poll_ms, or a throttled background tab): still 20/s
+    time.sleep(2.5)
+    last = client.get('/history?n=1', headers={**s, 'If-None-Match': etag}).get_json()['rows'][-1]['id']
+    assert 40 <= last - seen[-1] <= 75
+
+
+def test_live_scores_flag_spike_on_newest_reading(client):
+    """Test live /scores and /anomalies run the causal detectors oldest->newest, so the latest reading counts."""
+    import numpy as np
+    import database
+    rng = np.random.RandomState(5)
+    X = np.c_[50 + rng.randn(150), 6 + 0.1 * rng.randn(150), 1800 + 20 * rng.randn(150)]
+    X[-1] = [95.0, 6.0, 1800.0]
+    database.insert_readings([("2025-01-01T00:%02d:%02dZ" % (i // 60, i % 60), *x) for i, x in enumerate(X)])
+    client.post('/mode', json={'mode': 'live'})
+    for model in ('ewma', 'mahalanobis'):
+        data = client.get(f'/scores?n=150&model={model}&c=0.01').get_json()
+        assert data[0]['id'] == 150 and data[0]['is_anomaly']
+        assert data[0]['anomaly_score'] == max(r['anomaly_score'] for r in data)
+        cols = client.get(f'/scores?n=150&model={model}&c=0.01&layout=columnar').get_json()
+        assert cols['id'][0] == 150 and cols['is_anomaly'][0]
+        assert 150 in [r['id'] for r in client.get(f'/anomalies?n=150&model={model}&c=0.01').get_json()]
+
+
+def test_calibrated_thresholds_false_positive_rate_on_clean_data(client, app):
+    """Test per-window streaming scores flag about c of a healthy machine's readings, whatever the window size."""
+    import numpy as np
+    import database
+    from calibration import reference_digest
+    from seed import synthetic_chunk
+    rng = np.random.default_rng(1)
+    clean = lambda t0, n: np.c_[synthetic_chunk(t0, n, rng, spike_rate=0.0)].astype(float)
+    history = clean(0, 10000)
+    for model in ('ewma', 'mahalanobis', 'hst'):
+        app.config['_calibrator'].replace(model, reference_digest(model, [history]))
+    database.insert_readings([("2025-01-01T%02d:%02d:%02dZ" % (i // 3600, i // 60 % 60, i % 60), *x)
+                              for i, x in enumerate(clean(10000, 2500))])
+    client.post('/mode', json={'mode': 'replay'})
+
+    for model in ('ewma', 'mahalanobis', 'hst'):
+        flags = []
+        for end, n in [(800, 60), (1100, 60), (1400, 200), (1900, 200), (2500, 1000)]:
+            client.post('/replay/step', json={'delta': end - client.get('/config').get_json()['replay_index']})
+            flags += [r['is_anomaly'] for r in client.get(f'/scores_for_window?n={n}&model={model}&c=0.05').get_json()]
+        assert np.mean(flags) <= 0.08, model
+    client.post('/mode', json={'mode': 'live'})
@@ -0,0 +1,83 @@
+import asyncio
+import gzip
+import json
+
+import database
+from asgi import DashboardASGI
+from instrumentation import REQUEST_LATENCY
+
+
+def _call(asgi, path, query=b"", method="GET", headers=(), body=b""):
+    """Runs one request through the ASGI app; returns (status, headers, body)."""
+    async def run():
+        sent, pending = [], [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if pending:
+                return pending.pop(0)
+            await asyncio.sleep(3600)  # the client never disconnects
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi({"type": "http", "method": method, "path": path, "query_string": query,
+                    "headers": list(headers)}, receive, send)
+        return sent
+
+    sent = asyncio.run(run())
+    headers = {k.decode(): v.decode() for k, v in sent[0]["headers"]}
+    return sent[0]["status"], headers, b"".join(m.get("body", b"") for m in sent[1:])
+
+
+def test_asgi_bridges_flask_routes(app):
+    """Test ordinary routes (with a request body) are served by the Flask app through the bridge."""
+    asgi = DashboardASGI(app, db_threads=2, score_threads=1)
+    for mode in ("replay", "live"):
+        status, _, body = _call(asgi, "/mode", method="POST", body=json.dumps({"mode": mode}).encode(),
+                                headers=[(b"content-type", b"application/json")])
+        assert status == 200 and json.loads(body)["mode"] == mode
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % i, 50.0, 6.0, 1800.0) for i in range(30)])
+    status, headers, body = _call(asgi, "/scores", query=b"n=30&model=ewma")
+    assert status == 200 and len(json.loads(body)) == 30 and "x-request-id" in headers
+    # the page may hold /stream open here: the event loop serves it without a thread
+    assert json.loads(_call(asgi, "/config")[2])["alert_stream"] == "sse"
+
+
+def test_asgi_native_stream_and_export(app):
+    """Test /stream and a date-range /export are served on the event loop with Flask's output."""
+    app.config['STREAM_MAX_SECONDS'] = 0.3
+    asgi = DashboardASGI(app, db_threads=2, score_threads=1)
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % i, 50.0, 6.0, 1800.0) for i in range(30)])
+    database.insert_alerts([{"rule": "r", "kind": "count", "severity": "warn", "state": s,
+                             "ts": "2025-01-01T00:00:01Z", "reading_id": 1, "model": "ewma",
+                             "value": 1.0, "message": "m"} for s in ("firing", "resolved")])
+
+    status, headers, body = _call(asgi, "/stream", headers=[(b"last-event-id", b"0")])
+    assert status == 200 and headers["content-type"].startswith("text/event-stream")
+    assert body.decode().count("event: alert") == 2 and "id: 2\n" in body.decode()
+    # bad ids are left to Flask's validation
+    assert _call(asgi, "/stream", query=b"after_id=x")[0] == 400
+
+    status, _, body = _call(asgi, "/export", query=b"from=2025-01-01T00:00:00Z&to=2025-01-01T00:00:09Z")
+    flask_body = app.test_client().get("/export?from=2025-01-01T00:00:00Z&to=2025-01-01T00:00:09Z").get_data()
+    assert status == 200 and body == flask_body and body.count(b"\n") == 11
+
+
+def test_asgi_export_is_compressed_and_counted(app):
+    """Test the native /export is gzipped when accepted and shows up in /metrics like Flask's."""
+    asgi = DashboardASGI(app, db_threads=2, score_threads=1)
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % i, 50.0, 6.0, 1800.0) for i in range(30)])
+    query = b"from=2025-01-01T00:00:00Z&to=2025-01-01T00:00:29Z"
+    histogram = REQUEST_LATENCY.labels("export_csv", "GET")
+
+    def observed():
+        return sum(b.get() for b in histogram._buckets)
+
+    before = observed()
+    status, headers, body = _call(asgi, "/export", query=query, headers=[(b"accept-encoding", b"gzip")])
+    plain = _call(asgi, "/export", query=query)[2]
+    assert status == 200 and headers["content-encoding"] == "gzip" and headers["vary"] == "Accept-Encoding"
+    assert gzip.decompress(body) == plain and plain.count(b"\n") == 31
+
+    assert json.loads(app.test_client().get('/metrics').data)['compression']['export_csv']['responses'] == 1
+    assert observed() > before   # the latency histogram the Flask hooks fill
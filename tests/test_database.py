@@ -64,3 +64,22 @@ def test_fetch_last_n(app):
     assert len(rows) == 5
     # Should be newest first
     assert rows[0]['motor_speed'] > rows[-1]['motor_speed']
+
+
+def test_seed_is_reproducible(tmp_path):
+    """Test vectorised seeding writes the same rows for the same RNG seed."""
+    from datetime import datetime
+    import seed
+
+    rows = []
+    for name in ("a.db", "b.db"):
+        path = str(tmp_path / name)
+        seed.seed(path, 5000, True, rng_seed=42, start=datetime(2025, 1, 1), chunk_size=1500)
+        with sqlite3.connect(path) as conn:
+            rows.append(conn.execute(
+                "SELECT timestamp, temperature, pressure, motor_speed FROM readings ORDER BY id").fetchall())
+
+    assert len(rows[0]) == 5000
+    assert rows[0] == rows[1]
+    assert rows[0][0][0] == "2025-01-01T00:00:00Z"
+    assert rows[0][-1][0] == "2025-01-01T01:23:19Z"
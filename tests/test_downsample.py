@@ -0,0 +1,39 @@
+import numpy as np
+from downsample import lttb_indices, downsample_indices
+
+
+def test_lttb_keeps_endpoints_and_size():
+    """Test LTTB returns max_points sorted indices including both ends."""
+    x = np.arange(1000, dtype=float)
+    Y = np.column_stack([np.sin(x / 50.0), np.cos(x / 30.0), x])
+
+    idx = lttb_indices(x, Y, 100)
+
+    assert len(idx) == 100
+    assert idx[0] == 0 and idx[-1] == 999
+    assert np.all(np.diff(idx) > 0)
+
+
+def test_lttb_preserves_spike():
+    """Test a single large spike survives downsampling."""
+    x = np.arange(2000, dtype=float)
+    y = np.zeros(2000)
+    y[1234] = 50.0
+
+    idx = lttb_indices(x, y, 50)
+
+    assert 1234 in idx
+
+
+def test_downsample_keeps_flagged_points():
+    """Test flagged anomalies are always kept and the total stays bounded."""
+    rng = np.random.RandomState(0)
+    x = np.arange(1500, dtype=float)
+    Y = rng.rand(1500, 3)
+    keep = np.zeros(1500, dtype=bool)
+    keep[[7, 500, 1499, 1001]] = True
+
+    idx = downsample_indices(x, Y, 120, keep=keep)
+
+    assert set(np.flatnonzero(keep)) <= set(idx.tolist())
+    assert len(idx) <= 120
@@ -59,3 +59,157 @@ def test_export_csv(client, app):
     assert 'text/csv' in response.content_type
     
     database.DB_PATH = original
+
+
+def test_columnar_layout(client, app):
+    """Test ?layout=columnar returns column arrays matching the row layout."""
+    client.post('/mode', data=json.dumps({'mode': 'live'}), content_type='application/json')
+    with sqlite3.connect(app.config['DB_PATH']) as conn:
+        cur = conn.cursor()
+        for i in range(30):
+            cur.execute("""
+                INSERT INTO readings(timestamp, temperature, pressure, motor_speed)
+                VALUES(datetime('now', ?), ?, ?, ?)
+            """, (f'+{i} seconds', 30.0 + i, 5.0, 1500 + i))
+        conn.commit()
+
+    hist = json.loads(client.get('/history?n=20&layout=columnar').data)
+    rows = json.loads(client.get('/history?n=20').data)['rows']
+    assert hist['ts'] == [r['timestamp'] for r in rows]
+    assert hist['temperature'] == [r['temperature'] for r in rows]
+    assert 'server_now' in hist
+
+    cols = json.loads(client.get('/scores_for_window?n=20&c=0.1&model=iforest&layout=columnar').data)
+    scored = json.loads(client.get('/scores_for_window?n=20&c=0.1&model=iforest').data)
+    assert cols['id'] == [r['id'] for r in scored]
+    assert cols['is_anomaly'] == [r['is_anomaly'] for r in scored]
+    assert cols['model'] == 'iforest'
+
+
+def test_binary_layout(client, app):
+    """Test ?layout=binary decodes to the same columns as the JSON layout."""
+    from serialization import decode_binary
+
+    client.post('/mode', data=json.dumps({'mode': 'live'}), content_type='application/json')
+    with sqlite3.connect(app.config['DB_PATH']) as conn:
+        cur = conn.cursor()
+        for i in range(30):
+            cur.execute("""
+                INSERT INTO readings(timestamp, temperature, pressure, motor_speed)
+                VALUES(?, ?, ?, ?)
+            """, (f'2025-01-01T00:00:{i:02d}Z', 30.5 + i, 5.25, 1500 + i))
+        conn.commit()
+
+    response = client.get('/scores_for_window?n=20&c=0.1&model=iforest&layout=binary')
+    assert response.content_type == 'application/octet-stream'
+    out = decode_binary(response.data)
+    cols = json.loads(client.get('/scores_for_window?n=20&c=0.1&model=iforest&layout=columnar').data)
+
+    assert out['n'] == 20
+    assert out['model'] == 'iforest'
+    assert out['id'].tolist() == cols['id']
+    assert out['ts'][0] == 1735689610000  # 2025-01-01T00:00:10Z
+    assert out['temperature'].tolist() == cols['temperature']
+    assert out['is_anomaly'].astype(bool).tolist() == cols['is_anomaly']
+
+
+def test_history_max_points(client, app):
+    """Test ?max_points bounds the number of rows returned."""
+    client.post('/mode', data=json.dumps({'mode': 'live'}), content_type='application/json')
+    with sqlite3.connect(app.config['DB_PATH']) as conn:
+        conn.executemany("""
+            INSERT INTO readings(timestamp, temperature, pressure, motor_speed)
+            VALUES(?, ?, ?, ?)
+        """, [(f'2025-01-01T00:{i // 60:02d}:{i % 60:02d}Z', 30.0 + (i % 7), 5.0, 1500) for i in range(600)])
+        conn.commit()
+
+    rows = json.loads(client.get('/history?n=600&max_points=100').data)['rows']
+    cols = json.loads(client.get('/history?n=600&max_points=100&layout=columnar').data)
+
+    assert len(rows) == 100
+    assert cols['ts'] == [r['timestamp'] for r in rows]
+    assert client.get('/history?max_points=abc').status_code == 400
+
+
+def test_gzip_compression(client, app):
+    """Test large responses and CSV exports are gzip-compressed on request."""
+    import gzip
+
+    client.post('/mode', data=json.dumps({'mode': 'live'}), content_type='application/json')
+    with sqlite3.connect(app.config['DB_PATH']) as conn:
+        conn.executemany("""
+            INSERT INTO readings(timestamp, temperature, pressure, motor_speed)
+            VALUES(?, ?, ?, ?)
+        """, [(f'2025-01-01T00:{i // 60:02d}:{i % 60:02d}Z', 30.0, 5.0, 1500) for i in range(300)])
+        conn.commit()
+
+    headers = {'Accept-Encoding': 'gzip'}
+    response = client.get('/history?n=300', headers=headers)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert len(json.loads(gzip.decompress(response.data))['rows']) == 300
+
+    response = client.get('/export?n=300', headers=headers)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode().count('\n') == 301
+
+    small = client.get('/ping', headers=headers)
+    assert 'Content-Encoding' not in small.headers
+
+    metrics = json.loads(client.get('/metrics').data)
+    assert metrics['compression']['history']['ratio'] > 1
+
+
+def test_conditional_get(client, app):
+    """Test read endpoints answer If-None-Match with 304 until new data arrives."""
+    client.post('/mode', data=json.dumps({'mode': 'live'}), content_type='application/json')
+
+    def insert(i):
+        with sqlite3.connect(app.config['DB_PATH']) as conn:
+            conn.execute("""
+                INSERT INTO readings(timestamp, temperature, pressure, motor_speed)
+                VALUES(?, 40.0, 5.0, 1500)
+            """, (f'2025-01-01T00:00:{i:02d}Z',))
+            conn.commit()
+
+    for i in range(20):
+        insert(i)
+
+    url = '/scores_for_window?n=20&c=0.1&model=iforest'
+    first = client.get(url)
+    etag = first.headers['ETag']
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+
+    again = client.get(url + '&_t=123', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+
+    other = client.get('/scores_for_window?n=10&c=0.1&model=iforest', headers={'If-None-Match': etag})
+    assert other.status_code == 200
+
+    insert(30)
+    changed = client.get(url, headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+
+
+def test_conditional_get_keeps_replay_moving(client, app):
+    """Test replay /history polls sent with If-None-Match still advance the cursor."""
+    import time
+    import database
+    database.insert_readings([("2025-01-01T00:00:%02dZ" % i, 40.0, 5.0, 1500) for i in range(60)])
+    client.post('/mode', json={'mode': 'replay'})
+    client.post('/replay/settings', json={'stride': 5})
+    client.post('/replay/step', json={'delta': 10})
+
+    # right after a manual step the cursor holds still, so the poll may be a 304
+    first = client.get('/history?n=5')
+    etag = first.headers['ETag']
+    assert [r['id'] for r in first.get_json()['rows']] == [6, 7, 8, 9, 10]
+    assert client.get('/history?n=5', headers={'If-None-Match': etag}).status_code == 304
+
+    time.sleep(0.6)
+    moved = client.get('/history?n=5', headers={'If-None-Match': etag})
+    assert moved.status_code == 200 and moved.headers['ETag'] != etag
+    assert [r['id'] for r in moved.get_json()['rows']] == [11, 12, 13, 14, 15]
+    client.post('/mode', json={'mode': 'live'})
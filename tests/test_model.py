@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from models.isolation import fit_iforest, score_iforest
 
 
@@ -41,3 +42,109 @@ def test_contamination_affects_anomaly_count():
     
     # Higher contamination should find more anomalies
     assert sum(is_out_high) > sum(is_out_low)
+
+
+def test_streaming_detectors_flag_injected_spike():
+    """Test streaming detectors rank an injected temperature spike at the top."""
+    from models.streaming import STREAMING_MODELS, make_detector
+
+    rng = np.random.RandomState(0)
+    X = np.column_stack([50 + rng.randn(3000), 6 + 0.2 * rng.randn(3000), 1800 + 30 * rng.randn(3000)])
+    X[2500] = [80.0, 6.0, 1800.0]
+
+    for name in STREAMING_MODELS:
+        scores = make_detector(name, n_hint=len(X)).score_batch(X)
+        assert len(scores) == 3000
+        if name == "hst":
+            # half-space trees are a coarse density estimate: top 2% rather than the max
+            assert np.mean(scores > scores[2500]) < 0.02
+        else:
+            assert int(np.argmax(scores)) == 2500, name
+
+
+def test_streaming_batch_matches_updates():
+    """Test score_batch gives the same scores as feeding readings one at a time."""
+    from models.streaming import STREAMING_MODELS, make_detector
+
+    X = np.random.RandomState(1).rand(300, 3)
+    for name in STREAMING_MODELS:
+        batch = make_detector(name, n_hint=300).score_batch(X)
+        det = make_detector(name, n_hint=300)
+        single = np.array([det.update(x) for x in X])
+        np.testing.assert_allclose(batch, single, err_msg=name)
+
+
+def test_tdigest_tail_quantiles():
+    """Test the t-digest tracks tail quantiles of a skewed stream and survives a round trip."""
+    from models.sketch import TDigest
+    x = np.random.RandomState(0).exponential(1.0, 200_000)
+    digest = TDigest()
+    for chunk in np.array_split(x, 97):
+        digest.update(chunk)
+    digest = TDigest.from_dict(digest.to_dict())
+
+    for q in (0.5, 0.95, 0.99, 0.999):
+        assert abs(np.mean(x <= digest.quantile(q)) - q) < 0.002
+    assert len(digest.means) <= digest.delta
+
+
+def test_sharded_forest_merge(tmp_path):
+    """Test shard forests merge into one forest with the requested offset, and round-trip to disk."""
+    from models.isolation import fit_forest_shard, load_iforest, merge_forests, save_iforest
+    rng = np.random.RandomState(0)
+    X = rng.randn(6000, 3)
+    shards = [fit_forest_shard(part, 50, random_state=i) for i, part in enumerate(np.array_split(X, 3))]
+    clf = merge_forests(shards, X, contamination=0.05)
+
+    assert clf.n_estimators == len(clf.estimators_) == 150
+    _, is_out = score_iforest(clf, X)
+    assert abs(is_out.mean() - 0.05) < 0.005
+    assert score_iforest(clf, np.array([[8.0, 8.0, 8.0]]))[1][0]
+
+    save_iforest(clf, tmp_path / "iforest.joblib")
+    again = load_iforest(tmp_path / "iforest.joblib")
+    assert np.allclose(again.score_samples(X[:100]), clf.score_samples(X[:100]))
+
+
+def test_store_maps_forest_and_matches_sklearn(tmp_path):
+    """Test the stored forest is memory-mapped, scores like sklearn and switches versions atomically."""
+    from models.isolation import fit_forest_shard, merge_forests
+    from models.store import current_version, load_forest, save_forest
+    X = np.random.RandomState(1).randn(3000, 3) * [5, 1, 300] + [50, 6, 1800]
+    clf = merge_forests([fit_forest_shard(X, 60, random_state=0)], X, contamination=0.05)
+
+    first = save_forest(clf, root=str(tmp_path))
+    forest = load_forest(root=str(tmp_path))
+    assert isinstance(forest.children, np.memmap) and forest.version == first
+    scores, is_out = score_iforest(clf, X)
+    assert np.allclose(forest.score(X), scores)
+    assert ((forest.score(X) > 0) == is_out).all()
+
+    second = save_forest(clf, root=str(tmp_path))
+    assert current_version(root=str(tmp_path)) == second != first
+    assert load_forest(root=str(tmp_path)).version == second
+
+
+def test_mapped_forest_matches_score_samples(tmp_path):
+    """Test the flattened forest reproduces sklearn's score_samples for merged shards and feature subsets."""
+    from sklearn.ensemble import IsolationForest
+    from models.isolation import fit_forest_shard, merge_forests
+    from models.store import load_forest, save_forest
+    X = np.random.RandomState(2).randn(4000, 3) * [5, 1, 300] + [50, 6, 1800]
+    probe = np.vstack([X[:500], [[90.0, 6.0, 1800.0], [50.0, 12.0, 900.0]]])
+    shards = [fit_forest_shard(part, 40, random_state=i) for i, part in enumerate(np.array_split(X, 2))]
+    subset = IsolationForest(n_estimators=40, max_samples=128, max_features=2, random_state=5).fit(X)
+    for name, clf in (("merged", merge_forests(shards, X)), ("subset", merge_forests([subset], X))):
+        save_forest(clf, name=name, root=str(tmp_path))
+        forest = load_forest(name, root=str(tmp_path))
+        # MappedForest.score is sklearn's anomaly score, shifted by the fitted offset
+        assert np.allclose(forest.score(probe), -clf.score_samples(probe) + clf.offset_)
+
+
+def test_forest_internals_are_checked():
+    """Test merging a forest without the sklearn internals it relies on fails with a clear error."""
+    from models.isolation import fit_forest_shard, merge_forests
+    clf = fit_forest_shard(np.random.RandomState(0).randn(300, 3), 5)
+    del clf._decision_path_lengths
+    with pytest.raises(RuntimeError, match="_decision_path_lengths"):
+        merge_forests([clf], np.zeros((10, 3)))
@@ -0,0 +1,99 @@
+import numpy as np
+
+import database
+from pipeline import ScoringPipeline
+
+
+def _rows(n, start=0):
+    rng = np.random.RandomState(start)
+    return [("2025-01-01T00:%02d:%02dZ" % ((start + i) // 60 % 60, (start + i) % 60),
+             50.0 + rng.randn(), 6.0 + 0.1 * rng.randn(), 1800.0 + 20 * rng.randn())
+            for i in range(n)]
+
+
+def test_pipeline_scores_ingested_batches(app):
+    """Test ingested readings are scored into the scores table and alerts are raised."""
+    from app import set_setting
+    from calibration import Calibrator, reference_digest
+    set_setting("default_model", "ewma")
+    # flags need a calibrated threshold: reference scores from earlier, normal readings
+    reference = np.array([r[1:] for r in _rows(2000, start=1000)], dtype=float)
+    Calibrator().replace("ewma", reference_digest("ewma", [reference]))
+    events = []
+    pipeline = ScoringPipeline(on_alert=[events.append]).start()
+
+    pipeline.ingest(_rows(400))
+    spike = _rows(1, start=400)[0][:1] + (95.0, 6.0, 1800.0)
+    pipeline.ingest([spike])
+    pipeline.stop()
+
+    with database.get_connection() as conn:
+        count, models = conn.execute("SELECT COUNT(*), GROUP_CONCAT(DISTINCT model) FROM scores").fetchone()
+    assert count == 401 and models == "ewma"
+    assert events and events[-1]["reading_id"] == 401
+
+
+def test_pipeline_backfills_dropped_batches(app):
+    """Test a batch dropped on a full queue is picked up by the next one."""
+    pipeline = ScoringPipeline(maxsize=1, put_timeout=0.01)
+    first = database.insert_readings(_rows(50))
+    second = database.insert_readings(_rows(50, start=50))
+    third = database.insert_readings(_rows(50, start=100))
+
+    assert pipeline.submit(*first)
+    assert not pipeline.submit(*second)   # queue full, worker not started
+    pipeline.start()
+    pipeline.submit(*third)
+    pipeline.stop()
+
+    # the default iforest is scored at ingest with the fallback model (no reference forest here)
+    assert len(database.fetch_scores(1, 150, "ewma")) == 150
+
+
+def test_read_endpoint_uses_stored_scores(client, app):
+    """Test /scores serves ingest-time scores instead of rescoring when they exist (not iforest's)."""
+    client.post('/mode', json={'mode': 'live'})
+    first, last = database.insert_readings(_rows(60))
+    database.insert_scores([(i, "ewma", float(i), int(i == last)) for i in range(first, last + 1)])
+
+    data = client.get('/scores?n=60&model=ewma&c=0.02').get_json()
+
+    assert [r["anomaly_score"] for r in data] == [float(i) for i in range(last, first - 1, -1)]
+    assert [r["id"] for r in data if r["is_anomaly"]] == [last, last - 1]
+
+    # stored iforest scores come from separate per-batch fits: the window is refitted instead
+    database.insert_scores([(i, "iforest", float(i), int(i == last)) for i in range(first, last + 1)])
+    data = client.get('/scores?n=60&model=iforest&c=0.02').get_json()
+    assert [r["anomaly_score"] for r in data] != [float(i) for i in range(last, first - 1, -1)]
+
+
+def test_ingest_scores_only_fixed_models(app, tmp_path, monkeypatch):
+    """Test iforest is scored at ingest with the reference forest (or the fallback), never refitted per batch."""
+    import models.store as store
+    from models.isolation import fit_forest_shard, merge_forests
+    from pipeline import ingest_model
+    monkeypatch.setattr(store, "STORE_DIR", str(tmp_path))
+    assert ingest_model("iforest") == "ewma" and ingest_model("hst") == "hst"
+    X = np.random.RandomState(0).randn(2000, 3) * [1, 0.1, 20] + [50, 6, 1800]
+    store.save_forest(merge_forests([fit_forest_shard(X, 50)], X), root=str(tmp_path))
+    assert ingest_model("iforest") == "iforest_ref"
+
+    pipeline = ScoringPipeline()
+    pipeline._process(*database.insert_readings(_rows(30)))
+    with database.get_connection() as conn:
+        models, flagged = conn.execute("SELECT GROUP_CONCAT(DISTINCT model), SUM(is_anomaly) FROM scores").fetchone()
+    # no calibrated threshold yet, so nothing is flagged
+    assert models == "iforest_ref" and flagged == 0
+
+
+def test_pipeline_catches_up_in_batches_after_an_outage(app):
+    """Test a backlog larger than max_batch is scored in full, a batch at a time."""
+    from app import set_setting
+    set_setting("default_model", "ewma")
+    pipeline = ScoringPipeline(max_batch=100)
+    pipeline.last_scored_id = 0  # as if it had scored everything before an outage
+    database.insert_readings(_rows(250))
+    span = database.insert_readings(_rows(30, start=250))
+    pipeline._process(*span)
+
+    assert len(database.fetch_scores(1, 280, "ewma")) == 280 and pipeline.last_scored_id == 280
@@ -0,0 +1,40 @@
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+
+import scenarios
+
+
+def test_backfill_writes_labels_covering_faults(tmp_path):
+    """Test every fault kind is labelled and label_mask marks the affected readings."""
+    path = str(tmp_path / "sc.db")
+    rates = {kind: 6.0 for kind in scenarios.FAULTS}
+    sc = scenarios.Scenario(datetime(2025, 1, 1), rates=rates, rng_seed=3)
+
+    n_labels = scenarios.backfill(path, 4 * 3600, sc, chunk_seconds=900)
+
+    with sqlite3.connect(path) as conn:
+        kinds = {k for (k,) in conn.execute("SELECT DISTINCT kind FROM anomaly_labels")}
+        ids = np.array([r[0] for r in conn.execute("SELECT id FROM readings ORDER BY id")])
+        start_ts, end_ts = conn.execute(
+            "SELECT start_ts, end_ts FROM anomaly_labels WHERE kind='stuck' LIMIT 1").fetchone()
+        stuck = conn.execute("SELECT temperature, pressure, motor_speed FROM readings "
+                             "WHERE timestamp BETWEEN ? AND ?", (start_ts, end_ts)).fetchall()
+
+    assert n_labels > 0 and kinds == set(scenarios.FAULTS)
+    assert len(ids) == 4 * 3600
+    mask = scenarios.label_mask(path, ids)
+    assert 0 < mask.mean() < 1
+    # a stuck sensor holds one channel constant for the whole fault
+    assert any(len({row[c] for row in stuck}) == 1 for c in range(3))
+
+
+def test_high_rate_timestamps_sort(tmp_path):
+    """Test sub-second timestamps are monotonic as strings."""
+    sc = scenarios.Scenario(datetime(2025, 1, 1), hz=10, rng_seed=1)
+    ts = sc.timestamps(0, 25).tolist()
+
+    assert ts[0] == "2025-01-01T00:00:00.000Z"
+    assert ts[10] == "2025-01-01T00:00:01.000Z"
+    assert ts == sorted(ts)
@@ -0,0 +1,57 @@
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter, time
+
+from flask import g, has_request_context
+
+
+# Lightweight per-request spans. before_request sets g.spans = []; each span appends
+# {"name", "start_ms", "ms"} relative to the request start (g._t0). Outside a request
+# (CLI scripts, the simulator, tests calling functions directly) spans are no-ops.
+# Work done in another process (the scoring pool) is timed there and handed back
+# to add_span with a wall-clock start.
+
+
+@contextmanager
+def span(name: str, **attrs):
+    spans = g.get("spans") if has_request_context() else None
+    if spans is None:
+        yield
+        return
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        t1 = perf_counter()
+        spans.append({
+            "name": name,
+            "start_ms": round((t0 - g.get("_t0", t0)) * 1000.0, 3),
+            "ms": round((t1 - t0) * 1000.0, 3),
+            **attrs,
+        })
+
+
+def add_span(name: str, started_at: float, ms: float, **attrs):
+    """Records a span timed elsewhere; started_at is wall-clock (time.time()) seconds."""
+    spans = g.get("spans") if has_request_context() else None
+    if spans is None:
+        return
+    # g._t0 is on the perf_counter clock; line it up with the wall clock now
+    t0_wall = time() - (perf_counter() - g.get("_t0", perf_counter()))
+    spans.append({
+        "name": name,
+        "start_ms": round((started_at - t0_wall) * 1000.0, 3),
+        "ms": round(ms, 3),
+        **attrs,
+    })
+
+
+def traced(name: str):
+    """Decorator recording a span around each call."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator